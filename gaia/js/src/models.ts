@@ -16,7 +16,10 @@ export const CommandConfiguration = z.object({
     model: z.string(),
     api_base: z.string(),
     api_key: z.string(),
-    system_prompt: z.string()
+    system_prompt: z.string(),
+    max_turns: z.number().nullable().optional(),
+    max_tokens: z.number().nullable().optional(),
+    max_repeats: z.number().nullable().optional()
 })
 
 export type CommandConfiguration = z.infer<typeof CommandConfiguration>
@@ -56,7 +59,7 @@ export const task_to_preview = (t: FullQuestion): QuestionPreview => ({
 
 export type FullQuestion = z.infer<typeof FullQuestion>
 
-export const TaskResultStatus = z.union([z.literal('correct'), z.literal('incorrect'), z.literal('not-found'), z.literal('error')])
+export const TaskResultStatus = z.union([z.literal('correct'), z.literal('incorrect'), z.literal('not-found'), z.literal('error'), z.literal('timeout'), z.literal('budget-exhausted')])
 
 export type TaskResultStatus = z.infer<typeof TaskResultStatus>
 
@@ -64,7 +67,9 @@ export const TaskResult = z.union([
     z.object({ status: z.literal('correct'), created: z.string(), actual: z.string(), conversation: z.array(z.record(z.string(), z.string())) }),
     z.object({ status: z.literal('incorrect'), created: z.string(), expected: z.string(), actual: z.string(), conversation: z.array(z.record(z.string(), z.string())) }),
     z.object({ status: z.literal('not-found'), created: z.string(), conversation: z.array(z.record(z.string(), z.string())) }),
-    z.object({ status: z.literal('error'), created: z.string() })
+    z.object({ status: z.literal('error'), created: z.string() }),
+    z.object({ status: z.literal('timeout'), created: z.string(), timeout_s: z.number(), conversation: z.array(z.record(z.string(), z.string())) }),
+    z.object({ status: z.literal('budget-exhausted'), created: z.string(), reason: z.string(), conversation: z.array(z.record(z.string(), z.string())) })
 ])
 
 export type TaskResult = z.infer<typeof TaskResult>
@@ -74,7 +79,8 @@ export const TaskRunPreview = z.object({
     task: QuestionPreview,
     started: z.string(),
     result: TaskResultStatus.nullable(),
-    finished: z.string().nullable()
+    finished: z.string().nullable(),
+    model: z.string().nullable().optional()
 })
 
 export type TaskRunPreview = z.infer<typeof TaskRunPreview>
@@ -93,7 +99,8 @@ export const run_to_preview = (tr: TaskRun): TaskRunPreview => ({
     task: task_to_preview(tr.task),
     started: tr.started,
     result: tr.result?.status ?? null,
-    finished: tr.result?.created ?? null
+    finished: tr.result?.created ?? null,
+    model: tr.command.model
 })
 
 export type TaskRun = z.infer<typeof TaskRun>
@@ -1,9 +1,9 @@
 import requests
 import sseclient
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Literal, Optional
 from pydantic import TypeAdapter
 
-from models import CommandConfiguration, FullTask, TaskPreview, TaskResult, TaskRun, TaskRunPreview, TaskUpdate
+from models import NEXT_CURSOR_HEADER, CommandConfiguration, FullTask, Lease, RunFilter, TaskPreview, TaskResult, TaskRun, TaskRunPreview, TaskUpdate
 
 
 # check_connection: (base: string, timeout_ms: number) => Promise<boolean>
@@ -36,15 +36,54 @@ def run_single(base: str, command: CommandConfiguration, task_id: str, timeout_s
 
 # get_all_runs: (base: string, abort_controller?: AbortController) => Promise<TaskRunPreview[]>
 def get_all_runs(base: str) -> List[TaskRunPreview]:
-    ...
+    return list(iter_runs(base))
 
 # get_task_runs: (base: string, task_id: string, abort_controller?: AbortController) => Promise<TaskRunPreview[]>
 def get_task_run(base: str, task_id: str) -> List[TaskRunPreview]:
-    ...
+    return list(iter_runs(base, RunFilter(task_id=task_id)))
+
+# the listings a page at a time, only fetching the next page once the last one has been used up.
+def iter_pages(base: str, path: str, params: Dict[str, Any], page_size: int = 100) -> Iterator[Any]:
+    cursor: Optional[str] = None
+    while True:
+        page_params = {**params, "limit": page_size, **({"cursor": cursor} if cursor is not None else {})}
+        response = requests.get(f"{base}{path}", params=page_params)
+        response.raise_for_status()
+        yield from response.json()
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return
+
+def iter_tasks(base: str, level: Optional[int] = None, page_size: int = 100) -> Iterator[TaskPreview]:
+    params = {"level": level} if level is not None else {}
+    return (TaskPreview.model_validate(t) for t in iter_pages(base, "/gaia/tasks", params, page_size))
+
+def iter_runs(base: str, filter: RunFilter = RunFilter(), page_size: int = 100) -> Iterator[TaskRunPreview]:
+    params = filter.model_dump(mode="json", exclude_none=True, exclude={"task_id"})
+    path = f"/gaia/tasks/{filter.task_id}/runs" if filter.task_id is not None else "/gaia/runs"
+    return (TaskRunPreview.model_validate(r) for r in iter_pages(base, path, params, page_size))
 
 # get_single_run: (base: string, run_id: string, abort_controller?: AbortController) => Promise<TaskRun | undefined>
-def get_single_run(base: str, run_id: str) -> Optional[TaskRun]:
-    ...
+# the compact form leaves big payloads as blob references; get_blob fetches them.
+def get_single_run(base: str, run_id: str, form: Literal["expanded", "compact"] = "expanded") -> Optional[TaskRun]:
+    response = requests.get(f"{base}/gaia/runs/{run_id}", params={"form": form})
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return TypeAdapter(TaskRun).validate_python(response.json())
+
+def get_blob(base: str, ref: str) -> Optional[str]:
+    response = requests.get(f"{base}/gaia/blobs/{ref}")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.text
+
+# how the runs store is doing: see TaskRunStore.metrics.
+def get_store_metrics(base: str) -> Dict[str, float]:
+    response = requests.get(f"{base}/gaia/store-metrics")
+    response.raise_for_status()
+    return response.json()
 
 # // returns the run's id if it was successfully created, and undefined if it wasn't for some reason.
 # invoke: (base: string, command: CommandConfiguration, task_id: string, abort_controller?: AbortController) => Promise<string | undefined>
@@ -64,6 +103,40 @@ def invoke(base: str, command: CommandConfiguration, task_id: str) -> Optional[s
 def invoke_all(base: str, command: CommandConfiguration):
     ...
 
+# queue_sweep: queues a run of every given task (or every task) for remote workers to lease.
+def queue_sweep(base: str, command: CommandConfiguration, task_ids: Optional[List[str]] = None) -> List[str]:
+    json = {
+        "command": command.model_dump(),
+        "task_ids": task_ids
+    }
+    response = requests.post(f"{base}/gaia/sweeps", json=json)
+    response.raise_for_status()
+    return response.json()
+
+# claim_lease: returns None when there's nothing queued.
+def claim_lease(base: str, worker_id: str, lease_s: float) -> Optional[Lease]:
+    json = { "worker_id": worker_id, "lease_s": lease_s }
+    response = requests.post(f"{base}/gaia/leases", json=json)
+    response.raise_for_status()
+    return TypeAdapter(Optional[Lease]).validate_python(response.json())
+
+# heartbeat_lease: returns None if the lease already expired and should be abandoned.
+def heartbeat_lease(base: str, lease: Lease, lease_s: float) -> Optional[Lease]:
+    json = { "worker_id": lease.worker_id, "lease_s": lease_s }
+    response = requests.post(f"{base}/gaia/leases/{lease.id}/heartbeat", json=json)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return TypeAdapter(Lease).validate_python(response.json())
+
+# submit_lease_result: returns False if the lease expired before the result made it back.
+def submit_lease_result(base: str, lease: Lease, result: TaskResult) -> bool:
+    response = requests.post(f"{base}/gaia/leases/{lease.id}/result", params={ "worker_id": lease.worker_id }, json=result.model_dump(mode="json"))
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    return True
+
 def check_runs(base: str):
     messages = sseclient.SSEClient(f"{base}/gaia/check-runs")
     for msg in messages:
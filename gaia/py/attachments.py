@@ -0,0 +1,247 @@
+"""
+Extracts GAIA attachments (spreadsheets, documents, slides, pdfs, archives, ...) into plain text once,
+ahead of time, so an agent can be handed the contents instead of spending turns writing a parser.
+Extractions are cached by the sha256 of the file's contents, so a re-downloaded or renamed copy of the
+same file costs nothing.
+
+    python attachments.py extract             # everything in files/
+    python attachments.py show files/<name>
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock, get_ident
+from typing import Callable, Dict, List, Optional, Tuple, TypedDict
+from xml.etree import ElementTree
+
+
+CACHE_DIR = ".attachment-cache"
+# bump this whenever an extractor changes, so stale extractions aren't served from the cache.
+EXTRACTOR_VERSION = 1
+# more than this isn't going to fit in a small model's context anyway.
+MAX_CHARS = 20_000
+
+
+class Extraction(TypedDict):
+    sha256: str
+    # what the text is: "table", "text", "listing" or "metadata".
+    kind: str
+    text: str
+    truncated: bool
+
+
+def sha256_of(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_text(path: str) -> str:
+    with open(path, encoding="utf-8", errors="replace") as file:
+        return file.read()
+
+
+def rows_to_text(rows: List[List[str]]) -> str:
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue()
+
+
+def extract_xlsx(path: str) -> Tuple[str, str]:
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    sheets = []
+    for sheet in workbook.worksheets:
+        rows = [["" if v is None else str(v) for v in row] for row in sheet.iter_rows(values_only=True)]
+        sheets.append(f"# sheet: {sheet.title}\n{rows_to_text(rows)}")
+    workbook.close()
+    return "table", "\n".join(sheets)
+
+
+def xml_paragraphs(data: bytes, paragraph_tag: str) -> List[str]:
+    # docx and pptx are both zips of xml; every <w:t>/<a:t> under a paragraph is a run of its text.
+    paragraphs = []
+    for element in ElementTree.fromstring(data).iter():
+        if element.tag.endswith(paragraph_tag):
+            text = "".join(t.text or "" for t in element.iter() if t.tag.endswith("}t"))
+            if text.strip() != "":
+                paragraphs.append(text)
+    return paragraphs
+
+
+def extract_docx(path: str) -> Tuple[str, str]:
+    with zipfile.ZipFile(path) as archive:
+        return "text", "\n".join(xml_paragraphs(archive.read("word/document.xml"), "}p"))
+
+
+def extract_pptx(path: str) -> Tuple[str, str]:
+    with zipfile.ZipFile(path) as archive:
+        slides = sorted(
+            (n for n in archive.namelist() if n.startswith("ppt/slides/slide") and n.endswith(".xml")),
+            key=lambda n: int("".join(c for c in n if c.isdigit()) or 0)
+        )
+        parts = [f"# slide {i + 1}\n" + "\n".join(xml_paragraphs(archive.read(n), "}p")) for i, n in enumerate(slides)]
+        return "text", "\n".join(parts)
+
+
+def extract_pdf(path: str) -> Tuple[str, str]:
+    # pypdf isn't in requirements.txt; without it pdfs are left for the agent like before.
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return "text", "\n".join(f"# page {i + 1}\n{page.extract_text() or ''}" for i, page in enumerate(reader.pages))
+
+
+def extract_image(path: str) -> Tuple[str, str]:
+    from PIL import Image
+    with Image.open(path) as image:
+        return "metadata", f"{image.format} image, {image.width}x{image.height} pixels, mode {image.mode}"
+
+
+def extract_zip(path: str) -> Tuple[str, str]:
+    with zipfile.ZipFile(path) as archive:
+        lines = [f"{info.filename}\t{info.file_size} bytes" for info in archive.infolist() if not info.is_dir()]
+    return "listing", "\n".join(lines)
+
+
+def extract_mp3(path: str) -> Tuple[str, str]:
+    # no transcription here, just whatever the ID3v2 tag says.
+    lines = [f"mp3 audio, {os.path.getsize(path)} bytes"]
+    with open(path, "rb") as file:
+        header = file.read(10)
+        if header[:3] == b"ID3":
+            size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            tag = file.read(size)
+            i = 0
+            while i + 10 <= len(tag) and tag[i:i + 4].strip(b"\0") != b"":
+                frame_id = tag[i:i + 4].decode("latin-1")
+                frame_size = int.from_bytes(tag[i + 4:i + 8], "big")
+                body = tag[i + 10:i + 10 + frame_size]
+                if frame_id.startswith("T") and len(body) > 1:
+                    encoding = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(body[0], "latin-1")
+                    lines.append(f"{frame_id}: {body[1:].decode(encoding, errors='replace').strip(chr(0))}")
+                i += 10 + frame_size
+    return "metadata", "\n".join(lines)
+
+
+EXTRACTORS: Dict[str, Callable[[str], Tuple[str, str]]] = {
+    ".xlsx": extract_xlsx,
+    ".docx": extract_docx,
+    ".pptx": extract_pptx,
+    ".pdf": extract_pdf,
+    ".png": extract_image,
+    ".jpg": extract_image,
+    ".jpeg": extract_image,
+    ".zip": extract_zip,
+    ".mp3": extract_mp3,
+    ".csv": lambda path: ("table", read_text(path)),
+    ".txt": lambda path: ("text", read_text(path)),
+    ".py": lambda path: ("text", read_text(path)),
+    ".jsonld": lambda path: ("text", read_text(path)),
+    ".pdb": lambda path: ("text", read_text(path)),
+}
+
+
+def extract(path: str, sha256: Optional[str] = None) -> Optional[Extraction]:
+    # None when there's no extractor for the file (or the one there is needs a library we don't have).
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower())
+    if extractor is None:
+        return None
+    try:
+        kind, text = extractor(path)
+    except ImportError:
+        return None
+    except Exception as e:
+        # a broken file just means the agent has to deal with it itself.
+        print(f"couldn't extract {path}: {e}")
+        return None
+    return {
+        "sha256": sha256 or sha256_of(path),
+        "kind": kind,
+        "text": text[:MAX_CHARS],
+        "truncated": len(text) > MAX_CHARS,
+    }
+
+
+class AttachmentCache:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        # (path, size, mtime) -> sha256, so files aren't hashed again for every task that uses them.
+        self.hashes: Dict[Tuple[str, int, int], str] = {}
+        self.lock = Lock()
+
+    def get(self, path: str) -> Optional[Extraction]:
+        try:
+            sha256 = self.__hash(path)
+        except FileNotFoundError:
+            # a missing attachment just goes without its contents, like one there's no extractor for.
+            return None
+        entry_path = os.path.join(self.cache_dir, f"{sha256}.v{EXTRACTOR_VERSION}.json")
+        if os.path.exists(entry_path):
+            with open(entry_path) as file:
+                return json.load(file)
+
+        extraction = extract(path, sha256)
+        if extraction is None:
+            return None
+        # write-then-rename, so concurrent tasks never see half an entry.
+        tmp_path = f"{entry_path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(extraction, file)
+        os.replace(tmp_path, entry_path)
+        return extraction
+
+    def warm(self, files_dir: str = "files", processes: Optional[int] = None) -> Dict[str, Optional[Extraction]]:
+        names = sorted(n for n in os.listdir(files_dir) if os.path.isfile(os.path.join(files_dir, n)))
+        with ProcessPoolExecutor(processes) as pool:
+            extractions = pool.map(cached_extraction, [self.cache_dir] * len(names), [os.path.join(files_dir, n) for n in names])
+            return dict(zip(names, extractions))
+
+    def __hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            sha256 = self.hashes.get(key)
+        if sha256 is None:
+            sha256 = sha256_of(path)
+            with self.lock:
+                self.hashes[key] = sha256
+        return sha256
+
+
+def cached_extraction(cache_dir: str, path: str) -> Optional[Extraction]:
+    return AttachmentCache(cache_dir).get(path)
+
+
+def attachment_context(extraction: Extraction) -> str:
+    truncated = f" (cut off after {MAX_CHARS} characters)" if extraction["truncated"] else ""
+    return (
+        f"The attached file's contents have already been extracted for you ({extraction['kind']}{truncated}), "
+        f"so you only need to open it yourself if this isn't enough:\n"
+        f"```\n{extraction['text']}\n```"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["extract", "show"])
+    parser.add_argument("path", type=str, nargs="?", default="files", help="the attachments directory, or one file for show")
+    parser.add_argument("--cache", type=str, default=CACHE_DIR)
+    parser.add_argument("--processes", type=int, help="defaults to one per core")
+    args = parser.parse_args()
+
+    cache = AttachmentCache(args.cache)
+    if args.action == "show":
+        extraction = cache.get(args.path)
+        print(extraction["text"] if extraction is not None else f"no extractor for {args.path}")
+    else:
+        for name, extraction in cache.warm(args.path, args.processes).items():
+            summary = "skipped" if extraction is None else f"{extraction['kind']}, {len(extraction['text'])} chars"
+            print(f"{name}: {summary}")
@@ -0,0 +1,191 @@
+"""
+Measures what the benchmark engines cost on their own -- queueing, building result dicts, logging and
+collecting results -- by driving each of them with a runner that returns immediately.  Every case is
+compared against bench_baselines.json and the script exits non-zero if one of them regressed.
+
+    python bench_harness.py                       # run and compare
+    python bench_harness.py --update-baselines    # run and store the numbers as the new baselines
+    python bench_harness.py --quick               # the small cases only
+
+Wall-clock numbers move around with whatever else the machine is doing, so every repeat also times a
+fixed calibration loop right before the engine runs, and the gate compares throughput relative to that
+loop (the median over the repeats) rather than raw tasks/s.  A case that looks slower than its baseline
+is measured again, and only counts as a regression if it's slower both times.  Baselines are still
+best updated when moving to a different machine.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, NotRequired, Optional, Tuple, TypedDict
+
+from benchmark import LMC, Benchmark, BenchmarkRunner, OpenInterpreterCommand, TaskResult, run_benchmark, run_benchmark_sweep, run_benchmark_threaded, run_benchmark_threaded_pool
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baselines.json")
+
+Engine = Callable[[Benchmark, BenchmarkRunner, int], List[TaskResult]]
+
+
+class InstantRunner(BenchmarkRunner):
+    def run(self, command: OpenInterpreterCommand, prompt: str, timeout_s: Optional[float] = None) -> Tuple[datetime, List[LMC], datetime]:
+        now = datetime.now()
+        return now, [{"role": "assistant", "content": "FINAL ANSWER: 42"}], now
+
+
+def instant_benchmark(n_tasks: int) -> Benchmark[Dict]:
+    return Benchmark(
+        lambda: [{"id": str(i)} for i in range(n_tasks)],
+        lambda t: {"id": t["id"], "prompt": "What is the answer?"},
+        lambda t, messages: "correct"
+    )
+
+
+def sweep(benchmark: Benchmark, runner: BenchmarkRunner, n_workers: int) -> List[TaskResult]:
+    # two commands sharing one backend, so the per-command bookkeeping is in there too.
+    commands: Dict[str, OpenInterpreterCommand] = {"a": {"model": "openai/a"}, "b": {"model": "openai/b"}}
+    results = run_benchmark_sweep(benchmark, commands, {"openai": n_workers}, runner=runner)
+    return [r for rs in results.values() for r in rs]
+
+
+ENGINES: Dict[str, Engine] = {
+    "run_benchmark": lambda b, r, n: run_benchmark(b, {}, r),
+    "run_benchmark_threaded_pool": lambda b, r, n: run_benchmark_threaded_pool(b, {}, n, r),
+    "run_benchmark_threaded": lambda b, r, n: run_benchmark_threaded(b, {}, n, r),
+    "run_benchmark_sweep": sweep,
+}
+
+
+class Measurement(TypedDict):
+    tasks_per_s: float
+    # wall-clock microseconds per task, which is all overhead with a runner that takes no time.
+    overhead_us: float
+    peak_mb: float
+    # tasks/s divided by calibration loops/s, measured side by side; what the gate compares.
+    relative: NotRequired[float]
+
+
+def cases(quick: bool) -> List[Tuple[str, int, int]]:
+    task_counts = [1_000] if quick else [1_000, 10_000]
+    worker_counts = [1, 8, 32]
+    return [
+        (engine, n_tasks, n_workers)
+        for engine in ENGINES
+        for n_tasks in task_counts
+        # the sequential engine has nothing to vary.
+        for n_workers in ([1] if engine == "run_benchmark" else worker_counts)
+    ]
+
+
+def case_name(engine: str, n_tasks: int, n_workers: int) -> str:
+    return f"{engine}/{n_tasks}/{n_workers}"
+
+
+def calibrate(n: int = 20_000) -> float:
+    """
+    Loops per second of plain python doing the same sort of thing the engines do (building dicts,
+    appending, formatting), so a busy or throttled machine slows it down about as much as them.
+    """
+    began = time.perf_counter()
+    rows = []
+    for i in range(n):
+        rows.append({"task_id": str(i), "status": "correct", "prompt": f"task {i}"})
+    assert len(rows) == n
+    return n / (time.perf_counter() - began)
+
+
+def measure(engine: Engine, n_tasks: int, n_workers: int, repeats: int = 5) -> Measurement:
+    benchmark, runner = instant_benchmark(n_tasks), InstantRunner()
+    # the median of a few runs, so one unlucky run (or one lucky one) doesn't decide anything.
+    elapsed, relative = [], []
+    for _ in range(repeats):
+        gc.collect()
+        calibration_per_s = calibrate()
+        began = time.perf_counter()
+        results = engine(benchmark, runner, n_workers)
+        elapsed.append(time.perf_counter() - began)
+        assert len(results) > 0
+        relative.append(len(results) / elapsed[-1] / calibration_per_s)
+    n_results = len(results)
+    median = statistics.median(elapsed)
+
+    # tracemalloc slows everything down a lot, so peak memory gets its own run.
+    gc.collect()
+    tracemalloc.start()
+    engine(benchmark, runner, n_workers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "tasks_per_s": n_results / median,
+        "overhead_us": median / n_results * 1e6,
+        "peak_mb": peak / 2**20,
+        "relative": statistics.median(relative),
+    }
+
+
+def regressions(name: str, measured: Measurement, baseline: Measurement, tolerance: float) -> List[str]:
+    problems = []
+    # baselines from before calibration only have raw tasks/s to go on.
+    if "relative" in measured and "relative" in baseline:
+        if measured["relative"] < baseline["relative"] * (1 - tolerance):
+            problems.append(f"{name}: {measured['relative']:.3f} tasks per calibration loop, baseline {baseline['relative']:.3f} ({measured['tasks_per_s']:.0f} tasks/s)")
+    elif measured["tasks_per_s"] < baseline["tasks_per_s"] * (1 - tolerance):
+        problems.append(f"{name}: {measured['tasks_per_s']:.0f} tasks/s, baseline {baseline['tasks_per_s']:.0f}")
+    if measured["peak_mb"] > baseline["peak_mb"] * (1 + tolerance):
+        problems.append(f"{name}: {measured['peak_mb']:.1f} MB peak, baseline {baseline['peak_mb']:.1f}")
+    return problems
+
+
+def load_baselines(path: str) -> Dict[str, Measurement]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="1k tasks only")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.3, help="how much worse than the baseline (as a fraction) still passes")
+    parser.add_argument("--baselines", type=str, default=BASELINES_PATH)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args()
+
+    baselines = load_baselines(args.baselines)
+    measurements: Dict[str, Measurement] = {}
+    problems: List[str] = []
+
+    print(f"{'case':<40}{'tasks/s':>12}{'us/task':>10}{'peak MB':>10}{'vs baseline':>14}")
+    for engine, n_tasks, n_workers in cases(args.quick):
+        name = case_name(engine, n_tasks, n_workers)
+        m = measure(ENGINES[engine], n_tasks, n_workers, args.repeats)
+        measurements[name] = m
+        baseline = baselines.get(name)
+        if baseline is None:
+            versus = "-"
+        elif "relative" in baseline:
+            versus = f"{m['relative'] / baseline['relative']:.2f}x"
+        else:
+            versus = f"{m['tasks_per_s'] / baseline['tasks_per_s']:.2f}x"
+        print(f"{name:<40}{m['tasks_per_s']:>12.0f}{m['overhead_us']:>10.1f}{m['peak_mb']:>10.1f}{versus:>14}")
+        if baseline is not None and not args.update_baselines and len(regressions(name, m, baseline, args.tolerance)) > 0:
+            # make sure before calling it a regression: it has to be slower again on a second go.
+            again = measure(ENGINES[engine], n_tasks, n_workers, args.repeats)
+            problems.extend(regressions(name, again, baseline, args.tolerance))
+
+    if args.update_baselines:
+        with open(args.baselines, "w") as file:
+            json.dump({**baselines, **measurements}, file, indent=2, sort_keys=True)
+        print(f"baselines written to {args.baselines}.")
+    elif len(problems) > 0:
+        print("\nregressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
@@ -0,0 +1,108 @@
+"""
+Measures how fast the stores look tasks and runs up by id, one at a time and with get_many, on
+synthetic data (100k tasks and 100k runs unless told otherwise).  The "scan" cases do what the stores
+did before they had indexes -- walk the list until the id turns up -- on a sample of the ids, since
+doing all of them would take hours.
+
+    python bench_stores.py
+    python bench_stores.py --n 10000
+"""
+import argparse
+import gc
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, TypedDict
+
+import pyarrow as pa
+
+from catalog import TaskCatalog
+from models import CommandConfiguration, FullTask, TaskRun
+from store import MemoryTaskRunStore, MemoryTaskStore
+
+
+SCAN_SAMPLE = 200
+
+
+class LookupMeasurement(TypedDict):
+    lookups_per_s: float
+    us_per_lookup: float
+
+
+def synthetic_tasks(n: int) -> List[FullTask]:
+    return [
+        FullTask(task_id=f"task-{i:08d}", level=i % 3 + 1, question=f"Question {i}?", final_answer=str(i), file_name="", annotator_metadata=None)
+        for i in range(n)
+    ]
+
+
+def synthetic_runs(tasks: List[FullTask]) -> List[TaskRun]:
+    command = CommandConfiguration(auto_run=True, os_mode=False, model="", api_base="", api_key="", system_prompt="")
+    return [TaskRun(task=task, command=command, result=None) for task in tasks]
+
+
+def synthetic_catalog(tasks: List[FullTask]) -> TaskCatalog:
+    return TaskCatalog(pa.table({
+        "task_id": [t.task_id for t in tasks],
+        "Level": [str(t.level) for t in tasks],
+        "Question": [t.question for t in tasks],
+        "Final answer": [t.final_answer for t in tasks],
+    }))
+
+
+def scan(items: List[Any], key: Callable[[Any], str]) -> Callable[[str], Optional[Any]]:
+    def find(id: str) -> Optional[Any]:
+        for item in items:
+            if key(item) == id:
+                return item
+        return None
+    return find
+
+
+def measure_lookups(lookup_many: Callable[[List[str]], List], ids: List[str], repeats: int = 3) -> LookupMeasurement:
+    # the best of a few, like bench_harness.py.
+    best = float("inf")
+    for _ in range(repeats):
+        gc.collect()
+        began = time.perf_counter()
+        found = lookup_many(ids)
+        best = min(best, time.perf_counter() - began)
+        assert all(f is not None for f in found)
+    return {"lookups_per_s": len(ids) / best, "us_per_lookup": best / len(ids) * 1e6}
+
+
+def cases(n: int, seed: int = 0) -> Dict[str, Callable[[], LookupMeasurement]]:
+    tasks = synthetic_tasks(n)
+    runs = synthetic_runs(tasks)
+    task_store, run_store, catalog = MemoryTaskStore(tasks), MemoryTaskRunStore(runs), synthetic_catalog(tasks)
+
+    rng = random.Random(seed)
+    task_ids = [t.task_id for t in tasks]
+    run_ids = [r.id for r in runs]
+    rng.shuffle(task_ids)
+    rng.shuffle(run_ids)
+    task_sample, run_sample = task_ids[:SCAN_SAMPLE], run_ids[:SCAN_SAMPLE]
+    find_task = scan(tasks, lambda t: t.task_id)
+    find_run = scan(runs, lambda r: r.id)
+
+    return {
+        "tasks/scan": lambda: measure_lookups(lambda ids: [find_task(id) for id in ids], task_sample, repeats=1),
+        "tasks/get_single": lambda: measure_lookups(lambda ids: [task_store.get_single(id) for id in ids], task_ids),
+        "tasks/get_many": lambda: measure_lookups(task_store.get_many, task_ids),
+        "catalog/get": lambda: measure_lookups(lambda ids: [catalog.get(id) for id in ids], task_sample),
+        "catalog/get_many": lambda: measure_lookups(catalog.get_many, task_ids),
+        "runs/scan": lambda: measure_lookups(lambda ids: [find_run(id) for id in ids], run_sample, repeats=1),
+        "runs/get": lambda: measure_lookups(lambda ids: [run_store.get(id) for id in ids], run_ids),
+        "runs/get_many": lambda: measure_lookups(run_store.get_many, run_ids),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100_000, help="how many tasks, and how many runs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'case':<24}{'lookups/s':>14}{'us/lookup':>12}")
+    for name, case in cases(args.n, args.seed).items():
+        m = case()
+        print(f"{name:<24}{m['lookups_per_s']:>14.0f}{m['us_per_lookup']:>12.2f}")
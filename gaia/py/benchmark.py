@@ -1,32 +1,43 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
+import statistics
+import time
 import traceback
 from dataclasses import dataclass
-from queue import Queue
-from threading import Thread
+from queue import Empty, Queue
+from threading import Thread, local
 from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from typing import Callable, Dict, Generic, List, Literal, NotRequired, Tuple, TypeVar, TypedDict, cast
+from typing import Any, Callable, ContextManager, Dict, Generic, Iterator, List, Literal, NamedTuple, NotRequired, Tuple, TypeVar, TypedDict, cast
 import uuid
 from git import Optional
 
 from interpreter import OpenInterpreter
 
+from budget import Budget
+from chat import chat
+from models import TaskMetrics
+from profiling import profile_task
+from progress import SweepProgress
+from sandbox import WORKDIR, ContainerPool, sandboxed_languages
+from staging import attachment_prompt, scratch, scratch_languages, stage, staged
 
+
+# nothing is attached here; the entry points decide where (and whether) these go.
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-logger.addHandler(console_handler)
 
 Task = TypeVar("Task")
 LMC = Dict[str, str]
-ResultStatus = Literal["correct", "incorrect", "unknown", "error"]
+ResultStatus = Literal["correct", "incorrect", "unknown", "error", "timeout", "budget-exhausted"]
 
 
 class ZeroShotTask(TypedDict):
     id: str
     prompt: str
+    # the name of the task's file in files/, if it has one.  it's staged for each run and its path
+    # goes at the top of the prompt.
+    attachment: NotRequired[Optional[str]]
 
 
 class OpenInterpreterCommand(TypedDict):
@@ -37,6 +48,10 @@ class OpenInterpreterCommand(TypedDict):
     api_base: NotRequired[str]
     api_key: NotRequired[str]
     custom_instructions: NotRequired[str]
+    # per-task limits (see budget.py).
+    max_turns: NotRequired[int]
+    max_tokens: NotRequired[int]
+    max_repeats: NotRequired[int]
 
 
 def command_to_interpreter(cmd: OpenInterpreterCommand) -> OpenInterpreter:
@@ -59,6 +74,15 @@ class TaskResult(TypedDict):
     end: datetime
     messages: List[LMC]
     status: ResultStatus
+    # TaskMetrics.model_dump(), when the runner measured any.
+    metrics: NotRequired[Optional[Dict[str, Any]]]
+
+
+class RunOutput(NamedTuple):
+    start: datetime
+    messages: List[LMC]
+    end: datetime
+    metrics: Optional[TaskMetrics] = None
 
 
 @dataclass
@@ -66,21 +90,103 @@ class Benchmark(Generic[Task]):
     get_tasks: Callable[[], List[Task]]
     task_to_id_prompt: Callable[[Task], ZeroShotTask]
     task_result_status: Callable[[Task, List[LMC]], ResultStatus]
+    # estimated cost of running a task (any unit, bigger is slower).  when given, the engines
+    # dispatch the most expensive tasks first so the slow ones don't end up running alone at the end.
+    task_cost: Optional[Callable[[Task], float]] = None
+
+
+def schedule_tasks(benchmark: Benchmark[Task], tasks: List[Task]) -> List[Task]:
+    if benchmark.task_cost is None:
+        return tasks
+    # sorted is stable, so tasks with the same cost keep their original order.
+    return sorted(tasks, key=benchmark.task_cost, reverse=True)
 
 
 class BenchmarkRunner(ABC):
     @abstractmethod
-    def run(self, command: OpenInterpreterCommand, prompt: str) -> List[LMC]:
+    def run(self, command: OpenInterpreterCommand, prompt: str, timeout_s: Optional[float] = None) -> RunOutput | Tuple[datetime, List[LMC], datetime]:
         ...
 
+    def stage(self, attachment: str) -> ContextManager[str]:
+        # where the agent will find the attachment while the task runs.
+        return staged(attachment)
+
+
+def timeout_message(timeout_s: float) -> LMC:
+    return { "role": "timeout", "content": f"Timed out after {timeout_s:g}s" }
+
+
+def timed_out(messages: List[LMC]) -> bool:
+    return len(messages) > 0 and messages[-1].get("role") == "timeout"
+
+
+def budget_message(reason: str) -> LMC:
+    return { "role": "budget-exhausted", "content": f"Stopped: {reason}" }
+
+
+def budget_exhausted(messages: List[LMC]) -> bool:
+    return len(messages) > 0 and messages[-1].get("role") == "budget-exhausted"
+
+
+def command_budget(command: OpenInterpreterCommand) -> Budget:
+    return Budget(command.get("max_turns"), command.get("max_tokens"), command.get("max_repeats"))
+
 
 class DefaultBenchmarkRunner(BenchmarkRunner):
-    def run(self, command: OpenInterpreterCommand, prompt: str) -> Tuple[datetime, List[LMC], datetime]:
-        interpreter = command_to_interpreter(command)
+    def __init__(self, sandbox: Optional[ContainerPool] = None, stop_on_answer: bool = False):
+        # when given, the agent's code runs in a container borrowed from the pool rather than on the host.
+        self.sandbox = sandbox
+        # stop the chat as soon as a FINAL ANSWER line has been written (see chat.py).
+        self.stop_on_answer = stop_on_answer
+        # what stage() did for the task this thread is on: the scratch directory it made, or (in a
+        # container) the attachment the container needs.  run_single_task stages and runs a task on the
+        # same thread, so run() finds it here.
+        self.staging = local()
+
+    def run(self, command: OpenInterpreterCommand, prompt: str, timeout_s: Optional[float] = None) -> RunOutput:
+        attachment = getattr(self.staging, "attachment", None)
+        with self.sandbox.lease(attachment) if self.sandbox is not None else nullcontext() as container:
+            interpreter = command_to_interpreter(command)
+            if container is not None:
+                interpreter.computer.terminal.languages = sandboxed_languages(container)
+                return self.__run(interpreter, prompt, timeout_s, command_budget(command))
+            # on the host the agent works in the task's scratch directory, or an empty one if it has no attachment.
+            staged_in = getattr(self.staging, "directory", None)
+            with nullcontext(staged_in) if staged_in is not None else scratch() as directory:
+                interpreter.computer.terminal.languages = scratch_languages(directory, interpreter.computer.terminal.languages)
+                return self.__run(interpreter, prompt, timeout_s, command_budget(command))
+
+    @contextmanager
+    def stage(self, attachment: str) -> Iterator[str]:
+        # the pool puts it in the container's files/ when run() leases one.
+        if self.sandbox is not None:
+            self.staging.attachment = attachment
+            try:
+                yield f"{WORKDIR}/files/{attachment}"
+            finally:
+                self.staging.attachment = None
+            return
+        with scratch() as directory:
+            self.staging.directory = directory
+            try:
+                yield stage(attachment, directory)
+            finally:
+                self.staging.directory = None
+
+    def __run(self, interpreter: OpenInterpreter, prompt: str, timeout_s: Optional[float], budget: Budget) -> RunOutput:
         start = datetime.now()
+        metrics = None
 
         try:
-            output = cast(List, interpreter.chat(prompt, display=False, stream=False))
+            outcome = chat(interpreter, prompt, timeout_s, stop_on_answer=self.stop_on_answer, budget=budget)
+            metrics = outcome.metrics
+            output = outcome.messages
+            if outcome.timed_out:
+                output = [*output, timeout_message(cast(float, timeout_s))]
+            elif outcome.budget_exhausted is not None:
+                output = [*output, budget_message(outcome.budget_exhausted)]
+            elif outcome.error is not None:
+                output = [*output, { "role": "error", "content": outcome.error }]
         except KeyboardInterrupt:
             output = [*interpreter.messages, { "role": "error", "content": "KeyboardInterrupt" }]
         except Exception as e:
@@ -89,73 +195,145 @@ class DefaultBenchmarkRunner(BenchmarkRunner):
         finally:
             end = datetime.now()
             interpreter.computer.terminate()
-            return start, output, end
-
-
-def run_benchmark(benchmark: Benchmark, command: OpenInterpreterCommand) -> List[TaskResult]:
-    all_tasks = benchmark.get_tasks()
-    runner = DefaultBenchmarkRunner()
-    results: List[TaskResult] = []
-
-    logger.debug(f"Running {len(all_tasks)} task(s)...")
-
-    for task in all_tasks:
+            return RunOutput(start, output, end, metrics)
+
+
+class Deadline:
+    """
+    Hands out per-task time limits that never run past the end of the sweep.
+    """
+    def __init__(self, task_timeout_s: Optional[float] = None, sweep_timeout_s: Optional[float] = None):
+        self.task_timeout_s = task_timeout_s
+        self.sweep_end = time.monotonic() + sweep_timeout_s if sweep_timeout_s is not None else None
+
+    def remaining(self) -> Optional[float]:
+        if self.sweep_end is None:
+            return self.task_timeout_s
+        left = max(0.0, self.sweep_end - time.monotonic())
+        return left if self.task_timeout_s is None else min(left, self.task_timeout_s)
+
+
+def run_single_task(
+    benchmark: Benchmark[Task],
+    runner: BenchmarkRunner,
+    command: OpenInterpreterCommand,
+    task: Task,
+    deadline: Optional[Deadline] = None,
+    progress: Optional[SweepProgress] = None
+) -> TaskResult:
+    if progress is not None:
+        progress.started()
+    status = "error"
+    try:
         zstask = benchmark.task_to_id_prompt(task)
-
-        logger.debug(f"  Running task {zstask['id']}...")
-        start, messages, end  = runner.run(command, zstask["prompt"])
-
-        status = benchmark.task_result_status(task, messages)
-        result: TaskResult = {
+        timeout_s = deadline.remaining() if deadline is not None else None
+        attachment = zstask.get("attachment")
+        prompt = zstask["prompt"]
+
+        if timeout_s is not None and timeout_s <= 0:
+            # the sweep ran out of time before this task got a turn.
+            now = datetime.now()
+            start, messages, end, metrics = now, [timeout_message(0)], now, None
+        else:
+            with runner.stage(attachment) if attachment else nullcontext(None) as path:
+                prompt = attachment_prompt(prompt, path)
+                # plain (start, messages, end) tuples are fine too, for runners that don't measure anything.
+                with profile_task(zstask["id"]):
+                    start, messages, end, *rest = runner.run(command, prompt, timeout_s)
+            metrics = rest[0] if len(rest) > 0 else None
+
+        if timed_out(messages):
+            status = "timeout"
+        elif budget_exhausted(messages):
+            status = "budget-exhausted"
+        else:
+            status = benchmark.task_result_status(task, messages)
+        return {
             "task_id": zstask["id"],
             "command": command,
-            "prompt": zstask["prompt"],
+            "prompt": prompt,
             "start": start,
             "end": end,
-            "status": status,
             "messages": messages,
+            "status": status,
+            "metrics": metrics.model_dump() if metrics is not None else None
         }
+    finally:
+        if progress is not None:
+            progress.finished(status)
+
+
+def run_benchmark(
+    benchmark: Benchmark,
+    command: OpenInterpreterCommand,
+    runner: Optional[BenchmarkRunner] = None,
+    task_timeout_s: Optional[float] = None,
+    sweep_timeout_s: Optional[float] = None,
+    progress: Optional[SweepProgress] = None
+) -> List[TaskResult]:
+    all_tasks = schedule_tasks(benchmark, benchmark.get_tasks())
+    runner = runner if runner is not None else DefaultBenchmarkRunner()
+    deadline = Deadline(task_timeout_s, sweep_timeout_s)
+    if progress is not None:
+        progress.add(len(all_tasks))
+    results: List[TaskResult] = []
+
+    logger.debug(f"Running {len(all_tasks)} task(s)...")
 
-        results.append(result)
+    for task in all_tasks:
+        logger.debug(f"  Running task {benchmark.task_to_id_prompt(task)['id']}...")
+        results.append(run_single_task(benchmark, runner, command, task, deadline, progress))
 
     logger.debug("done!")
 
     return results
 
 
-def run_benchmark_threaded_pool(benchmark: Benchmark[Task], command: OpenInterpreterCommand, n_threads: Optional[int] = None) -> List[TaskResult]:
-    all_tasks = benchmark.get_tasks()
-    runner = DefaultBenchmarkRunner()
+def error_result(benchmark: Benchmark[Task], command: OpenInterpreterCommand, task: Task, e: BaseException) -> TaskResult:
+    zstask = benchmark.task_to_id_prompt(task)
+    logger.debug(f"  task {zstask['id']}: EXCEPTION!")
+    logger.debug(e)
+    now = datetime.now()
+    return {
+        "task_id": zstask["id"],
+        "command": command,
+        "prompt": zstask["prompt"],
+        "start": now,
+        "end": now,
+        "messages": [{ "role": "error", "content": "".join(traceback.format_exception(e)) }],
+        "status": "error",
+        "metrics": None
+    }
+
+
+def run_benchmark_threaded_pool(
+    benchmark: Benchmark[Task],
+    command: OpenInterpreterCommand,
+    n_threads: Optional[int] = None,
+    runner: Optional[BenchmarkRunner] = None,
+    task_timeout_s: Optional[float] = None,
+    sweep_timeout_s: Optional[float] = None,
+    progress: Optional[SweepProgress] = None
+) -> List[TaskResult]:
+    all_tasks = schedule_tasks(benchmark, benchmark.get_tasks())
+    runner = runner if runner is not None else DefaultBenchmarkRunner()
+    deadline = Deadline(task_timeout_s, sweep_timeout_s)
+    if progress is not None:
+        progress.add(len(all_tasks))
     task_results: List[TaskResult] = []
 
     def run_task(task: Task) -> TaskResult:
         zstask = benchmark.task_to_id_prompt(task)
         logger.debug(f"  task {zstask['id']}: RUNNING...")
         try:
-            start, messages, end = runner.run(command, zstask["prompt"])
-            status = benchmark.task_result_status(task, messages)
+            result = run_single_task(benchmark, runner, command, task, deadline, progress)
         except Exception as e:
-            logger.debug(f"  task {zstask['id']}: EXCEPTION!")
-            logger.debug(e)
-            status = "error"
-        finally:
-            logger.debug(f"  task {zstask['id']}: DONE!")
-            # the face that start, messages, and end are visible in this block
-            # is very strange and likely unsound.
-            # Python was a mistake.
-            return {
-                "task_id": zstask["id"],
-                "command": command,
-                "prompt": zstask["prompt"],
-                "start": start,
-                "end": end,
-                "messages": messages,
-                "status": status
-            }
+            result = error_result(benchmark, command, task, e)
+        logger.debug(f"  task {zstask['id']}: {result['status'].upper()}!")
+        return result
 
     with ThreadPoolExecutor(max_workers=n_threads) as pool:
         logger.debug(f"Running {len(all_tasks)} tasks across {pool._max_workers} threads...")
-        pool._max_workers
         results = pool.map(run_task, all_tasks)
         for r in results:
             task_results.append(r)
@@ -164,67 +342,198 @@ def run_benchmark_threaded_pool(benchmark: Benchmark[Task], command: OpenInterpr
     return task_results
 
 
-def run_benchmark_threaded(benchmark: Benchmark[Task], command: OpenInterpreterCommand, n_threads: int = 2) -> List[TaskResult]:
-    all_tasks = benchmark.get_tasks()
-    runner = DefaultBenchmarkRunner()
+@dataclass
+class WorkerStats:
+    worker_id: str
+    tasks_run: int = 0
+    # both in seconds.  idle is whatever part of the sweep the worker spent not running a task.
+    busy: float = 0.0
+    idle: float = 0.0
+
+
+def run_benchmark_threaded(
+    benchmark: Benchmark[Task],
+    command: OpenInterpreterCommand,
+    n_threads: int = 2,
+    runner: Optional[BenchmarkRunner] = None,
+    worker_stats: Optional[List[WorkerStats]] = None,
+    task_timeout_s: Optional[float] = None,
+    sweep_timeout_s: Optional[float] = None,
+    progress: Optional[SweepProgress] = None
+) -> List[TaskResult]:
+    all_tasks = schedule_tasks(benchmark, benchmark.get_tasks())
+    runner = runner if runner is not None else DefaultBenchmarkRunner()
+    deadline = Deadline(task_timeout_s, sweep_timeout_s)
+    if progress is not None:
+        progress.add(len(all_tasks))
     results: Queue[TaskResult] = Queue()
-    threads: List[Tuple[Queue, Thread]] = []
-
-    def run_task(task_queue: Queue):
-        thread_id = uuid.uuid4()
-        # THERE IS A RACE CONDITION -- check if empty, then get will NOT work.  Should be atomic op.
-        # actually jk this isn't a problem because tasks are assigned before any threads are started,
-        # and we aren't assigning anything after thread creation.
-        # YES I am cheating but it's fine.
-        while not task_queue.empty():
-            task = task_queue.get()
-            zstask = benchmark.task_to_id_prompt(task)
-            logger.debug(f"  task {zstask['id']} on thread {thread_id}: RUNNING...")
-            start, messages, end = runner.run(command, zstask["prompt"])
-            status = benchmark.task_result_status(task, messages)
-            logger.debug(f"  task {zstask['id']} on thread {thread_id}: DONE!")
-            results.put({
-                "task_id": zstask["id"],
-                "command": command,
-                "prompt": zstask["prompt"],
-                "start": start,
-                "end": end,
-                "messages": messages,
-                "status": status
-            })
-
-    logger.debug(f"Setting up {n_threads} thread(s)...")
-
-    # setting up threads.
-    for _ in range(0, n_threads):
-        q = Queue()
-        threads.append((q, Thread(target=run_task, args=(q,))))
-    
-    logger.debug("done!")
-    logger.debug(f"Assigning {len(all_tasks)} tasks to {n_threads} threads...")
-    
-    # assigning tasks to threads in a round-robin manner.
-    th_index = 0
+    task_queue: Queue[Task] = Queue()
+    stats = [WorkerStats(worker_id=str(uuid.uuid4())) for _ in range(n_threads)]
+
+    def run_task(s: WorkerStats):
+        # every thread pulls from the same queue, so whichever thread frees up first takes the next task
+        # and a thread stuck on a long task doesn't hold up the ones queued behind it.
+        while True:
+            try:
+                task = task_queue.get_nowait()
+            except Empty:
+                return
+            began = time.perf_counter()
+            task_id = benchmark.task_to_id_prompt(task)["id"]
+            logger.debug(f"  task {task_id} on thread {s.worker_id}: RUNNING...")
+            try:
+                result = run_single_task(benchmark, runner, command, task, deadline, progress)
+            except Exception as e:
+                # the thread keeps going, so the rest of its share of the queue still gets run.
+                result = error_result(benchmark, command, task, e)
+            logger.debug(f"  task {task_id} on thread {s.worker_id}: {result['status'].upper()}!")
+            results.put(result)
+            s.busy += time.perf_counter() - began
+            s.tasks_run += 1
+
     for task in all_tasks:
-        q, _ = threads[th_index]
-        q.put(task)
-        th_index = (th_index + 1) % n_threads
-    
-    logger.debug("done!")
-    logger.debug(f"Starting {n_threads} thread(s)...")
-    
-    # starting threads.
-    for q, th in threads:
-        th.start()
-        logger.debug(f"  Started thread with {q.qsize()} tasks.")
-    
-    logger.debug("done!")
+        task_queue.put(task)
+
     logger.debug(f"Running {len(all_tasks)} tasks across {n_threads} thread(s)...")
 
-    # joining threads.
-    for _, th in threads:
+    sweep_start = time.perf_counter()
+    threads = [Thread(target=run_task, args=(s,)) for s in stats]
+    for th in threads:
+        th.start()
+    for th in threads:
         th.join()
-    
-    logger.debug("done!")
+    makespan = time.perf_counter() - sweep_start
+
+    logger.debug(f"done in {makespan:.2f}s!")
+    for s in stats:
+        s.idle = max(0.0, makespan - s.busy)
+        logger.debug(f"  thread {s.worker_id}: {s.tasks_run} task(s), {s.busy:.2f}s busy, {s.idle:.2f}s idle")
+
+    if worker_stats is not None:
+        worker_stats.extend(stats)
 
     return list(results.queue)
+
+
+def command_backend(command: OpenInterpreterCommand) -> str:
+    # litellm-style "provider/model" names.  no provider means the interpreter's default, which is openai.
+    model = command.get("model", "")
+    return model.split("/", 1)[0] if "/" in model else "openai"
+
+
+def run_benchmark_sweep(
+    benchmark: Benchmark[Task],
+    commands: Dict[str, OpenInterpreterCommand],
+    backend_limits: Dict[str, int],
+    default_limit: int = 4,
+    runner: Optional[BenchmarkRunner] = None,
+    task_timeout_s: Optional[float] = None,
+    sweep_timeout_s: Optional[float] = None,
+    progress: Optional[SweepProgress] = None
+) -> Dict[str, List[TaskResult]]:
+    """
+    Runs every command over every task in one go.  Each backend gets its own pool sized by
+    backend_limits (so a local model can get 1 slot while openai gets 16), and work is submitted
+    task-by-task across commands so commands sharing a backend make progress together.
+    """
+    all_tasks = schedule_tasks(benchmark, benchmark.get_tasks())
+    runner = runner if runner is not None else DefaultBenchmarkRunner()
+    deadline = Deadline(task_timeout_s, sweep_timeout_s)
+    backends = {name: command_backend(cmd) for name, cmd in commands.items()}
+    pools = {
+        backend: ThreadPoolExecutor(max_workers=backend_limits.get(backend, default_limit))
+        for backend in set(backends.values())
+    }
+    futures: Dict[str, List[Future[TaskResult]]] = {name: [] for name in commands}
+    if progress is not None:
+        progress.add(len(all_tasks) * len(commands))
+
+    def task_result(future: Future[TaskResult], command: OpenInterpreterCommand, task: Task) -> TaskResult:
+        # one failed task shouldn't throw away everything the rest of the sweep has finished.
+        try:
+            return future.result()
+        except Exception as e:
+            return error_result(benchmark, command, task, e)
+
+    logger.debug(f"Sweeping {len(all_tasks)} task(s) over {len(commands)} command(s)...")
+    for backend, pool in pools.items():
+        logger.debug(f"  {backend}: {pool._max_workers} slot(s)")
+
+    try:
+        for task in all_tasks:
+            for name, cmd in commands.items():
+                futures[name].append(pools[backends[name]].submit(run_single_task, benchmark, runner, cmd, task, deadline, progress))
+        results = {
+            name: [task_result(f, commands[name], task) for f, task in zip(fs, all_tasks)]
+            for name, fs in futures.items()
+        }
+    finally:
+        for pool in pools.values():
+            pool.shutdown(cancel_futures=True)
+
+    logger.debug("done!")
+
+    return results
+
+
+class SweepSummary(TypedDict):
+    command: str
+    tasks: int
+    correct: int
+    incorrect: int
+    unknown: int
+    error: int
+    timeout: int
+    budget_exhausted: int
+    # tokens spent on runs that went over their budget.
+    wasted_tokens: int
+    accuracy: float
+    # all latencies are in seconds.
+    mean_latency: float
+    p50_latency: float
+    p90_latency: float
+
+
+def summarize_sweep(results: Dict[str, List[TaskResult]]) -> List[SweepSummary]:
+    summaries: List[SweepSummary] = []
+    for name, rs in results.items():
+        latencies = sorted((r["end"] - r["start"]).total_seconds() for r in rs)
+        counts = {status: sum(1 for r in rs if r["status"] == status) for status in ["correct", "incorrect", "unknown", "error", "timeout", "budget-exhausted"]}
+        summaries.append({
+            "command": name,
+            "tasks": len(rs),
+            "correct": counts["correct"],
+            "incorrect": counts["incorrect"],
+            "unknown": counts["unknown"],
+            "error": counts["error"],
+            "timeout": counts["timeout"],
+            "budget_exhausted": counts["budget-exhausted"],
+            "wasted_tokens": sum(tokens(r) for r in rs if r["status"] == "budget-exhausted"),
+            "accuracy": counts["correct"] / len(rs) if len(rs) > 0 else 0.0,
+            "mean_latency": statistics.mean(latencies) if len(latencies) > 0 else 0.0,
+            "p50_latency": percentile(latencies, 0.5),
+            "p90_latency": percentile(latencies, 0.9),
+        })
+    return summaries
+
+
+def tokens(result: TaskResult) -> int:
+    metrics = result.get("metrics")
+    return metrics["prompt_tokens"] + metrics["completion_tokens"] if metrics is not None else 0
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def format_sweep_report(summaries: List[SweepSummary]) -> str:
+    header = f"{'command':<16}{'tasks':>7}{'accuracy':>10}{'correct':>9}{'wrong':>7}{'unk':>5}{'err':>5}{'t/o':>5}{'bud':>5}{'wasted tok':>12}{'mean s':>9}{'p50 s':>9}{'p90 s':>9}"
+    lines = [header, "-" * len(header)]
+    for s in summaries:
+        lines.append(
+            f"{s['command']:<16}{s['tasks']:>7}{s['accuracy']:>10.1%}{s['correct']:>9}{s['incorrect']:>7}{s['unknown']:>5}"
+            f"{s['error']:>5}{s['timeout']:>5}{s['budget_exhausted']:>5}{s['wasted_tokens']:>12}{s['mean_latency']:>9.1f}{s['p50_latency']:>9.1f}{s['p90_latency']:>9.1f}"
+        )
+    return "\n".join(lines)
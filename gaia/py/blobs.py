@@ -0,0 +1,170 @@
+"""
+Keeps transcripts small by moving their big payloads -- base64 screenshots, long console output, the
+system prompt every run shares -- out into gzipped blobs named by the sha256 of their contents, and
+leaving a "blob:sha256:<digest>" reference where they were.  The same payload is only ever stored once
+no matter how many runs it shows up in.
+
+    python blobs.py jsonl output.jsonl --out output.compact.jsonl
+    python blobs.py show blob:sha256:<digest>
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from threading import get_ident
+from typing import Any, Dict, List, Optional
+
+from models import CommandConfiguration, TaskResult, TaskRun
+
+
+BLOB_DIR = ".blobs"
+# anything shorter stays inline; it'd cost more to look up than to keep.
+MIN_SIZE = 2048
+REF_PREFIX = "blob:sha256:"
+REF_RE = re.compile("^(?:blob:sha256:)?([0-9a-f]{64})$")
+# these are the same for every run of a command, so they're worth sharing however short they are.
+ALWAYS_OFFLOADED_ROLES = {"system"}
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX) and REF_RE.match(value) is not None
+
+
+class BlobStore:
+    def __init__(self, root: str = BLOB_DIR):
+        # nothing is created until there's something to put, so readers can point one anywhere.
+        self.root = root
+
+    def put(self, text: str) -> str:
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write-then-rename, so a reader never sees half a blob.
+            tmp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(gzip.compress(data, mtime=0))
+            os.replace(tmp_path, path)
+        return f"{REF_PREFIX}{digest}"
+
+    def get(self, ref: str) -> Optional[str]:
+        # takes a reference or just its digest.
+        match = REF_RE.match(ref)
+        if match is None:
+            return None
+        path = self.path(match.group(1))
+        if not os.path.exists(path):
+            return None
+        return read_blob(path)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.gz")
+
+
+@lru_cache(maxsize=256)
+def read_blob(path: str) -> str:
+    # blobs never change, so there's no invalidating to do.
+    with open(path, "rb") as file:
+        return gzip.decompress(file.read()).decode("utf-8")
+
+
+def offload(text: str, blobs: BlobStore) -> str:
+    return text if is_ref(text) else blobs.put(text)
+
+
+def compact_messages(messages: List[Dict], blobs: BlobStore, min_size: int = MIN_SIZE) -> List[Dict]:
+    # only the content is ever big; role, type and format stay readable.
+    compacted = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str) and (message.get("role") in ALWAYS_OFFLOADED_ROLES or len(content) >= min_size):
+            message = {**message, "content": offload(content, blobs)}
+        compacted.append(message)
+    return compacted
+
+
+def expand_messages(messages: List[Dict], blobs: BlobStore) -> List[Dict]:
+    # references to blobs that have gone missing are left as they are.
+    return [{k: (blobs.get(v) or v) if is_ref(v) else v for k, v in message.items()} for message in messages]
+
+
+def compact_command(command: CommandConfiguration, blobs: BlobStore) -> CommandConfiguration:
+    if command.system_prompt == "":
+        return command
+    return command.model_copy(update={"system_prompt": offload(command.system_prompt, blobs)})
+
+
+def expand_command(command: CommandConfiguration, blobs: BlobStore) -> CommandConfiguration:
+    if not is_ref(command.system_prompt):
+        return command
+    return command.model_copy(update={"system_prompt": blobs.get(command.system_prompt) or command.system_prompt})
+
+
+def compact_result(result: TaskResult, blobs: BlobStore, min_size: int = MIN_SIZE) -> TaskResult:
+    return result.model_copy(update={"conversation": compact_messages(result.conversation, blobs, min_size)})
+
+
+def expand_result(result: TaskResult, blobs: BlobStore) -> TaskResult:
+    return result.model_copy(update={"conversation": expand_messages(result.conversation, blobs)})
+
+
+def compact_run(run: TaskRun, blobs: BlobStore, min_size: int = MIN_SIZE) -> TaskRun:
+    return run.model_copy(update={
+        "command": compact_command(run.command, blobs),
+        "result": compact_result(run.result, blobs, min_size) if run.result is not None else None,
+    })
+
+
+def expand_run(run: TaskRun, blobs: BlobStore) -> TaskRun:
+    return run.model_copy(update={
+        "command": expand_command(run.command, blobs),
+        "result": expand_result(run.result, blobs) if run.result is not None else None,
+    })
+
+
+# benchmark.py's results are plain dicts, with the system prompt in the command's custom_instructions.
+def compact_benchmark_result(result: Dict[str, Any], blobs: BlobStore, min_size: int = MIN_SIZE) -> Dict[str, Any]:
+    command = dict(result["command"])
+    if isinstance(command.get("custom_instructions"), str) and command["custom_instructions"] != "":
+        command["custom_instructions"] = offload(command["custom_instructions"], blobs)
+    return {**result, "command": command, "messages": compact_messages(result["messages"], blobs, min_size)}
+
+
+def expand_benchmark_result(result: Dict[str, Any], blobs: BlobStore) -> Dict[str, Any]:
+    command = dict(result["command"])
+    if is_ref(command.get("custom_instructions")):
+        command["custom_instructions"] = blobs.get(command["custom_instructions"]) or command["custom_instructions"]
+    return {**result, "command": command, "messages": expand_messages(result["messages"], blobs)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    jsonl_parser = subparsers.add_parser("jsonl", help="compact the conversations in a .jsonl written by run_benchmarks.py")
+    jsonl_parser.add_argument("path", type=str)
+    jsonl_parser.add_argument("--out", type=str, required=True)
+    jsonl_parser.add_argument("--min-size", type=int, default=MIN_SIZE)
+    show_parser = subparsers.add_parser("show", help="print a blob")
+    show_parser.add_argument("ref", type=str)
+    parser.add_argument("--blobs", type=str, default=BLOB_DIR)
+    args = parser.parse_args()
+
+    blobs = BlobStore(args.blobs)
+    if args.action == "show":
+        text = blobs.get(args.ref)
+        if text is None:
+            parser.error(f"no blob {args.ref} in {args.blobs}")
+        print(text)
+    else:
+        before = os.path.getsize(args.path)
+        tmp_path = f"{args.out}.tmp"
+        with open(args.path) as file, open(tmp_path, "w") as out:
+            for line in file:
+                if line.strip() != "":
+                    out.write(json.dumps(compact_benchmark_result(json.loads(line), blobs, args.min_size)) + "\n")
+        os.replace(tmp_path, args.out)
+        print(f"{before} -> {os.path.getsize(args.out)} bytes; the rest is in {args.blobs}.")
@@ -0,0 +1,85 @@
+"""
+Per-command limits on how much a single task may spend: how many times the agent may run code, how
+many tokens it may use, and how many times it may run the same code (or hit the same error) before
+we decide it's going around in circles.  chat() checks them as the conversation streams and stops the
+run once one is used up.  Turns are code runs only: the LLM calls between them are limited through
+max_tokens, since that's what they cost.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from models import TaskMetrics
+
+
+# the last line of a python traceback, or a shell complaining.
+ERROR_LINE_RE = re.compile(r"^(?:[\w.]*(?:Error|Exception)\b.*|.*: (?:command not found|No such file or directory))$")
+
+
+@dataclass
+class Budget:
+    # code runs (not LLM calls).
+    max_turns: Optional[int] = None
+    # prompt and completion tokens together.
+    max_tokens: Optional[int] = None
+    # runs of identical code, or runs ending in an identical error.
+    max_repeats: Optional[int] = None
+
+    def is_set(self) -> bool:
+        return self.max_turns is not None or self.max_tokens is not None or self.max_repeats is not None
+
+
+def error_line(output: str) -> Optional[str]:
+    for line in reversed(output.strip().splitlines()):
+        if ERROR_LINE_RE.match(line.strip()):
+            return line.strip()
+    return None
+
+
+class BudgetWatcher:
+    """
+    Keeps track of what a task has spent.  Hand may_run and code_ran to Instrumentation so it asks
+    before every code run and hears about it afterwards, and call exhausted whenever there's a chance
+    to stop.
+    """
+    def __init__(self, budget: Budget, metrics: TaskMetrics):
+        self.budget = budget
+        self.metrics = metrics
+        self.codes: Counter[Tuple[str, str]] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.repeated: Optional[str] = None
+        self.refused: Optional[str] = None
+
+    def may_run(self) -> Optional[str]:
+        # why the next code run shouldn't start, if it shouldn't.  a refused run never counts as a turn.
+        if self.budget.max_turns is not None and self.metrics.turns >= self.budget.max_turns:
+            self.refused = f"used up its {self.budget.max_turns} turns"
+        return self.refused
+
+    def code_ran(self, language: str, code: str, output: str):
+        self.codes[(language, code.strip())] += 1
+        error = error_line(output)
+        if error is not None:
+            self.errors[error] += 1
+
+        if self.budget.max_repeats is None or self.repeated is not None:
+            return
+        if self.codes[(language, code.strip())] >= self.budget.max_repeats:
+            self.repeated = f"ran the same {language} code {self.budget.max_repeats} times"
+        elif error is not None and self.errors[error] >= self.budget.max_repeats:
+            self.repeated = f"hit the same error {self.budget.max_repeats} times: {error}"
+
+    def exhausted(self) -> Optional[str]:
+        # the reason the run should stop, if it should.
+        if self.repeated is not None:
+            return self.repeated
+        if self.refused is not None:
+            return self.refused
+        # turns that got past may_run (or were counted without it) can only be stopped after they've started.
+        if self.budget.max_turns is not None and self.metrics.turns > self.budget.max_turns:
+            return f"used up its {self.budget.max_turns} turns"
+        tokens = self.metrics.prompt_tokens + self.metrics.completion_tokens
+        if self.budget.max_tokens is not None and tokens > self.budget.max_tokens:
+            return f"used {tokens} of its {self.budget.max_tokens} tokens"
+        return None
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import json
+import os
+from functools import cache
+from typing import Any, Dict, List, Optional, Tuple
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import Dataset, load_dataset
+
+from staging import cache_files
+
+
+# where the snapshot lives unless GAIA_CATALOG says otherwise.  relative to the working directory,
+# just like files/ is.
+DEFAULT_CATALOG_PATH = "gaia-validation.arrow"
+FILES_METADATA_KEY = b"gaia.files"
+
+
+def file_manifest(files_dir: str) -> List[Dict[str, Any]]:
+    manifest = []
+    if not os.path.isdir(files_dir):
+        return manifest
+    for name in sorted(os.listdir(files_dir)):
+        path = os.path.join(files_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        manifest.append({"file_name": name, "size": os.path.getsize(path), "sha256": digest})
+    return manifest
+
+
+def dataset_table(dataset: Dataset) -> pa.Table:
+    if dataset._indices is not None:
+        dataset = dataset.flatten_indices()
+    return dataset.data.table
+
+
+class TaskCatalog:
+    """
+    The GAIA validation split as a single arrow table, plus a task_id -> row index.
+    When it comes from a snapshot the table is memory-mapped, so opening it costs next to nothing.
+    """
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self.index: Dict[str, int] = {t: i for i, t in enumerate(table.column("task_id").to_pylist())}
+        metadata = table.schema.metadata or {}
+        self.files: List[Dict[str, Any]] = json.loads(metadata.get(FILES_METADATA_KEY, b"[]"))
+
+    @staticmethod
+    def from_file(path: str) -> "TaskCatalog":
+        source = pa.memory_map(path, "r")
+        return TaskCatalog(pa.ipc.open_file(source).read_all())
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self.index
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        i = self.index.get(task_id)
+        if i is None:
+            return None
+        return self.table.slice(i, 1).to_pylist()[0]
+
+    def get_many(self, task_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        # one take for all of them, rather than a slice each.
+        found = [i for i in (self.index.get(t) for t in task_ids) if i is not None]
+        rows = iter(self.table.take(found).to_pylist())
+        return [next(rows) if t in self.index else None for t in task_ids]
+
+    def find(self, columns: List[str], start: int = 0, level: Optional[int] = None, limit: Optional[int] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        # (row number, row) for the rows from start on that are at the given level, with only the
+        # columns asked for.  the filtering happens on the arrow table, so only the rows returned
+        # are ever turned into python.
+        table = self.table.slice(start)
+        if level is not None:
+            positions = pc.indices_nonzero(pc.equal(pc.cast(table.column("Level"), pa.int64()), level))
+        else:
+            positions = pa.array(range(table.num_rows), pa.uint64())
+        if limit is not None:
+            positions = positions.slice(0, limit)
+        rows = table.select(columns).take(positions).to_pylist()
+        return [(start + p, row) for p, row in zip(positions.to_pylist(), rows)]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return self.table.to_pylist()
+
+    def columns(self, columns: List[str]) -> List[Dict[str, Any]]:
+        return self.table.select(columns).to_pylist()
+
+    def to_dataset(self) -> Dataset:
+        return Dataset(self.table)
+
+
+def snapshot(out_path: str = DEFAULT_CATALOG_PATH, files_dir: str = "files") -> TaskCatalog:
+    validation = load_dataset("gaia-benchmark/GAIA", "2023_all", split="validation")
+    table = dataset_table(validation)
+    manifest = file_manifest(files_dir)
+    metadata = {**(table.schema.metadata or {}), FILES_METADATA_KEY: json.dumps(manifest).encode()}
+    table = table.replace_schema_metadata(metadata)
+
+    # write to a temporary file first so a half-written snapshot never gets picked up.
+    tmp_path = f"{out_path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, out_path)
+    # the read-only copies tasks' scratch directories link to (see staging.py), made now rather than on
+    # the first run that needs each one.
+    if os.path.isdir(files_dir):
+        cache_files(files_dir)
+    return TaskCatalog.from_file(out_path)
+
+
+@cache
+def validation_catalog() -> TaskCatalog:
+    # falls back to the hugging face loader if nobody has taken a snapshot yet.
+    path = os.getenv("GAIA_CATALOG", DEFAULT_CATALOG_PATH)
+    if os.path.exists(path):
+        return TaskCatalog.from_file(path)
+    return TaskCatalog(dataset_table(load_dataset("gaia-benchmark/GAIA", "2023_all", split="validation")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    snapshot_parser = subparsers.add_parser("snapshot")
+    snapshot_parser.add_argument("--out", type=str, default=DEFAULT_CATALOG_PATH)
+    snapshot_parser.add_argument("--files", type=str, default="files")
+    info_parser = subparsers.add_parser("info")
+    info_parser.add_argument("--path", type=str, default=DEFAULT_CATALOG_PATH)
+    args = parser.parse_args()
+
+    if args.action == "snapshot":
+        c = snapshot(args.out, args.files)
+        print(f"Wrote {len(c)} task(s) and {len(c.files)} attachment(s) to {args.out}")
+    else:
+        c = TaskCatalog.from_file(args.path)
+        print(f"{args.path}: {len(c)} task(s), {len(c.files)} attachment(s)")
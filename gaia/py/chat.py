@@ -0,0 +1,119 @@
+import re
+import time
+import traceback
+from contextvars import copy_context
+from dataclasses import dataclass
+from threading import Event, Thread
+from typing import Dict, List, Optional
+from interpreter import OpenInterpreter
+
+from budget import Budget, BudgetWatcher
+from instrumentation import Instrumentation
+from models import TaskMetrics
+from profiling import adopt_current_thread
+from scoring import FINAL_ANSWER_RE
+
+
+@dataclass
+class ChatOutcome:
+    # everything the interpreter said (or managed to say before it was stopped).
+    messages: List[Dict]
+    timed_out: bool = False
+    # the formatted traceback if the chat raised.
+    error: Optional[str] = None
+    metrics: Optional[TaskMetrics] = None
+    # why the run was stopped, if it went over its budget.
+    budget_exhausted: Optional[str] = None
+
+
+# a final answer is only complete once its line is: either a newline follows it or the message ends.
+FINAL_ANSWER_LINE_RE = re.compile("FINAL ANSWER: .+\n")
+
+
+class FinalAnswerWatcher:
+    """
+    Follows the streamed chunks of the assistant's messages and says when one of them has given a
+    complete final answer.
+    """
+    def __init__(self):
+        self.text = ""
+
+    def feed(self, chunk: Dict) -> bool:
+        if chunk.get("role") != "assistant" or chunk.get("type") != "message":
+            return False
+        if chunk.get("start"):
+            self.text = ""
+        content = chunk.get("content")
+        if isinstance(content, str):
+            self.text += content
+        if chunk.get("end"):
+            return FINAL_ANSWER_RE.search(self.text) is not None
+        return FINAL_ANSWER_LINE_RE.search(self.text) is not None
+
+
+def chat(
+    interpreter: OpenInterpreter,
+    prompt: str,
+    timeout_s: Optional[float] = None,
+    display: bool = False,
+    stop_on_answer: bool = False,
+    budget: Optional[Budget] = None
+) -> ChatOutcome:
+    """
+    Runs interpreter.chat with a wall-clock limit.  The chat is streamed on its own thread so it can be
+    abandoned once the deadline passes: the caller gets the partial transcript right away, the code
+    execution processes get terminated, and the chat thread bails out at its next chunk.
+
+    With stop_on_answer, the chat is also stopped as soon as the assistant has written a complete
+    FINAL ANSWER line, instead of letting it carry on running code or chatting.  With a budget, it's
+    stopped once the budget runs out (see budget.py).
+    """
+    cancelled = Event()
+    instrumentation = Instrumentation(interpreter)
+    spending = BudgetWatcher(budget, instrumentation.metrics) if budget is not None and budget.is_set() else None
+    if spending is not None:
+        instrumentation.on_code_run = spending.code_ran
+        instrumentation.may_run_code = spending.may_run
+    instrumentation.install()
+    outcome = ChatOutcome(messages=[], metrics=instrumentation.metrics)
+    watcher = FinalAnswerWatcher() if stop_on_answer else None
+
+    def consume():
+        try:
+            with adopt_current_thread():
+                for chunk in interpreter.chat(prompt, display=display, stream=True):
+                    if cancelled.is_set():
+                        break
+                    if watcher is not None and watcher.feed(chunk):
+                        # leaving the loop closes the stream, which stops the LLM call (and anything after it).
+                        outcome.metrics.stopped_early_s = time.perf_counter() - instrumentation.started
+                        outcome.metrics.stopped_early_message = len(interpreter.messages)
+                        break
+                    if spending is not None:
+                        outcome.budget_exhausted = spending.exhausted()
+                        if outcome.budget_exhausted is not None:
+                            break
+        except Exception:
+            if not cancelled.is_set():
+                outcome.error = traceback.format_exc()
+
+    # the copied context carries the profiled task (if any) over to the chat thread.
+    worker = Thread(target=copy_context().run, args=(consume,), daemon=True)
+    worker.start()
+    try:
+        worker.join(timeout_s)
+    except KeyboardInterrupt:
+        cancelled.set()
+        raise
+
+    if worker.is_alive():
+        cancelled.set()
+        outcome.timed_out = True
+        # kills whatever code is running, which also unblocks the chat thread if it's waiting on it.
+        interpreter.computer.terminate()
+    elif outcome.metrics.stopped_early_s is not None or outcome.budget_exhausted is not None:
+        # the agent may have left code running in the background.
+        interpreter.computer.terminate()
+
+    outcome.messages = list(interpreter.messages)
+    return outcome
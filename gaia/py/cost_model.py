@@ -0,0 +1,133 @@
+import csv
+import os
+import re
+import statistics
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+
+# rough seconds-per-thing weights for tasks we've never run.  they only need to get the ordering
+# right, and once there's history the whole prior gets rescaled to match it anyway.
+LEVEL_BASE_SECONDS = {1: 60.0, 2: 120.0, 3: 240.0}
+SECONDS_PER_STEP = 20.0
+SECONDS_PER_TOOL = 15.0
+SECONDS_PER_HUMAN_MINUTE = 3.0
+# every run's duration, appended to after each sweep so nothing a later run writes can lose them.
+DEFAULT_HISTORY_PATH = "durations.csv"
+HISTORY_FIELDS = ["task_id", "command", "seconds", "finished"]
+
+
+def first_number(s: Optional[str]) -> Optional[float]:
+    if s is None:
+        return None
+    m = re.search(r"\d+(?:\.\d+)?", str(s))
+    return float(m.group(0)) if m is not None else None
+
+
+def parse_minutes(s: Optional[str]) -> Optional[float]:
+    """
+    Turns annotator answers like "5-10 minutes", "1 hour" or "about 30 mins" into minutes.
+    Ranges become their midpoint.
+    """
+    if s is None:
+        return None
+    numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", s)]
+    if len(numbers) == 0:
+        return None
+    value = sum(numbers[:2]) / len(numbers[:2])
+    lowered = s.lower()
+    if "hour" in lowered or re.search(r"\bhrs?\b", lowered):
+        return value * 60
+    if "second" in lowered or re.search(r"\bsecs?\b", lowered):
+        return value / 60
+    return value
+
+
+def prior_seconds(level: Any, annotator_metadata: Optional[Mapping[str, Any]]) -> float:
+    level_n = int(first_number(str(level)) or 1)
+    cost = LEVEL_BASE_SECONDS.get(level_n, LEVEL_BASE_SECONDS[3])
+    if annotator_metadata is not None:
+        cost += SECONDS_PER_STEP * (first_number(annotator_metadata.get("Number of steps")) or 0)
+        cost += SECONDS_PER_TOOL * (first_number(annotator_metadata.get("Number of tools")) or 0)
+        cost += SECONDS_PER_HUMAN_MINUTE * (parse_minutes(annotator_metadata.get("How long did this take?")) or 0)
+    return cost
+
+
+@dataclass
+class CostModel:
+    """
+    Estimates how long (in seconds) a GAIA task will take to run.  Tasks with recorded durations
+    use the mean of those, everything else uses the metadata-based prior, rescaled by how far off
+    the prior has been on the tasks we do have history for.
+    """
+    history: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    # observed / prior, as a median over the tasks we have history for.  set by calibrate().
+    calibration: float = 1.0
+
+    def observe(self, task_id: str, seconds: float):
+        self.history[task_id].append(seconds)
+
+    def calibrate(self, tasks: Iterable[Mapping[str, Any]]):
+        ratios = []
+        for t in tasks:
+            durations = self.history.get(t["task_id"])
+            prior = prior_seconds(t["Level"], t.get("Annotator Metadata"))
+            if durations and prior > 0:
+                ratios.append(statistics.mean(durations) / prior)
+        self.calibration = statistics.median(ratios) if len(ratios) > 0 else 1.0
+
+    def estimate(self, task: Mapping[str, Any]) -> float:
+        durations = self.history.get(task["task_id"])
+        if durations:
+            return statistics.mean(durations)
+        return self.calibration * prior_seconds(task["Level"], task.get("Annotator Metadata"))
+
+    @staticmethod
+    def from_results(results: Iterable[Mapping[str, Any]]) -> "CostModel":
+        model = CostModel()
+        for r in results:
+            model.observe(r["task_id"], duration(r))
+        return model
+
+    @staticmethod
+    def from_history(path: str = DEFAULT_HISTORY_PATH, commands: Optional[Iterable[str]] = None) -> "CostModel":
+        # just the durations recorded for these commands, when given.
+        model = CostModel()
+        if not os.path.exists(path):
+            return model
+        wanted = set(commands) if commands is not None else None
+        with open(path, newline="") as file:
+            for row in csv.DictReader(file):
+                if wanted is None or row["command"] in wanted:
+                    model.observe(row["task_id"], float(row["seconds"]))
+        return model
+
+
+def duration(result: Mapping[str, Any]) -> float:
+    start, end = result["start"], result["end"]
+    if isinstance(start, str):
+        start, end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+    return (end - start).total_seconds()
+
+
+def append_history(command: str, results: Iterable[Mapping[str, Any]], path: str = DEFAULT_HISTORY_PATH) -> int:
+    """
+    Appends how long each of command's results took to the history, and says how many it added.
+    Errors are left out: they say how soon something broke, not how long the task takes.
+    """
+    rows = [
+        {"task_id": r["task_id"], "command": command, "seconds": duration(r), "finished": str(r["end"])}
+        for r in results
+        if r["status"] != "error"
+    ]
+    if len(rows) == 0:
+        return 0
+    new = not os.path.exists(path)
+    with open(path, "a", newline="") as file:
+        writer = csv.DictWriter(file, HISTORY_FIELDS)
+        if new:
+            writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
@@ -1,12 +1,13 @@
 import pprint
-import re
 import sys
 from typing import Dict, List
-from datasets import Dataset, load_dataset
+from datasets import Dataset
 from interpreter import OpenInterpreter
 import pexpect
 from models import CommandConfiguration
 
+from catalog import validation_catalog
+from scoring import final_answer
 from helpers import OutputWrapper
 
 
@@ -21,7 +22,7 @@ def pull_out(ds: Dataset, columns: List[str]) -> List[Dict]:
 
 
 def all_of_the_validation_tests() -> Dataset:
-    return load_dataset("gaia-benchmark/GAIA", "2023_all", split="validation")
+    return validation_catalog().to_dataset()
 
 
 def run_gaia_task_from_command_line(entry, command: str) -> bool:
@@ -70,13 +71,8 @@ def run_gaia_task_from_library(command: CommandConfiguration, question: str, fil
         # We're assuming:
         # - the "FINAL ANSWER: " text is the last thing that appears in the last message of the LLM's response.
         output = interpreter.chat(prompt, display=True, stream=False)
-        final_message = output[-1]["content"]
-        final_answer_re = re.search("FINAL ANSWER: (.+)", final_message)
-        if final_answer_re is None:
-            return None
-        final_answer = final_answer_re.group(1).strip().lower()
-
-        return final_answer
+        answer = final_answer(output)
+        return answer.lower() if answer is not None else None
     except KeyboardInterrupt:
         ...
     finally:
@@ -1,13 +1,16 @@
 from asyncio import Queue
 import json
-from typing import List, Literal, Optional
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+from datetime import datetime
+from typing import Callable, Dict, List, Literal, Optional, Union, cast
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
+from blobs import BlobStore
+from leases import LeaseQueue
 from runner import DefaultTaskRunner, TaskRunner
-from store import DefaultTaskRunStore, DefaultTaskStore, TaskRunStore, TaskStore
-from models import CommandConfiguration, FullTask, RunQuery, TaskFinished, TaskPreview, TaskResult, TaskRun, TaskRunPreview, TaskRunRequest, TaskStarted, TaskUpdate
+from store import DefaultTaskRunStore, DefaultTaskStore, Page, TaskRunStore, TaskStore
+from models import NEXT_CURSOR_HEADER, CommandConfiguration, FullTask, Lease, LeaseRequest, RunFilter, RunQuery, SweepRequest, TaskFinished, TaskPreview, TaskResult, TaskRun, TaskResultStatus, TaskRunPreview, TaskRunRequest, TaskStarted, TaskUpdate
 
 
 """
@@ -25,7 +28,11 @@ POST /gaia/runs
 body { query: { tag: 'all' } | { tag: 'for-tasks', ids: string[] } }
 resp TaskRunPreview[]
 
-GET /gaia/runs/{run_id}
+GET /gaia/runs/{run_id}?form=expanded|compact
+compact leaves big payloads as "blob:sha256:<digest>" references (see blobs.py).
+
+GET /gaia/blobs/{ref}
+resp the blob's text
 
 POST /gaia/tasks
 body { query: { tag: 'all' } }
@@ -36,6 +43,23 @@ GET /gaia/tasks/{task_id}
 POST /gaia/invoke
 body { task_id: string, command: CommandConfiguration }
 resp TaskResult
+
+POST /gaia/sweeps
+body { command: CommandConfiguration, task_ids: string[] | null }
+resp string[] (the queued run ids)
+
+POST /gaia/leases
+body { worker_id: string, lease_s: number }
+resp Lease | null
+
+POST /gaia/leases/{lease_id}/heartbeat
+body { worker_id: string, lease_s: number }
+resp Lease
+
+POST /gaia/leases/{lease_id}/result?worker_id=string
+body TaskResult
+
+(both 404 for a lease that expired, doesn't exist, or is held by another worker.)
 """
 
 
@@ -47,24 +71,73 @@ POST /invoke
 """
 
 
+def local_time(t: Optional[datetime]) -> Optional[datetime]:
+    # runs are started with a naive datetime.now(), so a bound with a timezone (e.g. "...Z") has to be
+    # brought into local time before it can be compared with them.
+    return t.astimezone().replace(tzinfo=None) if t is not None and t.tzinfo is not None else t
+
+
+def run_filter(
+    level: Optional[int] = None,
+    status: Optional[Union[TaskResultStatus, Literal["running"]]] = None,
+    model: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None
+) -> RunFilter:
+    return RunFilter(level=level, status=status, model=model, started_after=local_time(started_after), started_before=local_time(started_before))
+
+
+def paged(response: Response, get_page: Callable[[], Page]) -> List:
+    try:
+        items, next_cursor = get_page()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return items
+
+
 class Server:
-    def __init__(self, tasks: TaskStore, runner: TaskRunner, runs: TaskRunStore):
+    def __init__(self, tasks: TaskStore, runner: TaskRunner, runs: TaskRunStore, blobs: Optional[BlobStore] = None, lease_journal: Optional[str] = None):
         self.tasks = tasks
         self.runner = runner
         self.runs = runs
+        # where the runs' offloaded payloads are, when they're stored compacted.
+        self.blobs = blobs
         self.updates: Queue[TaskUpdate] = Queue()
+        # runs queued by /gaia/sweeps, waiting for remote workers to lease them.
+        self.leases = LeaseQueue(journal=lease_journal)
+
+    def requeue_unfinished(self) -> int:
+        """
+        Queues every run the lease journal has seen that still has no result for the workers again, and
+        says how many there were.  Meant for startup: nothing is running yet, so these are runs the last
+        server lost track of when it went down (the lease queue only lives in memory).  Runs started any
+        other way aren't in the journal, and never go to the workers.
+        """
+        unfinished = [run for run in self.runs.get_many(self.leases.journaled()) if run is not None and run.result is None]
+        self.leases.restore(unfinished)
+        return len(unfinished)
 
     def make_app(self) -> FastAPI:
         app = FastAPI()
         app.add_middleware(
             CORSMiddleware,
             allow_origins=["*"],
-            allow_methods=["*"]
+            allow_methods=["*"],
+            expose_headers=[NEXT_CURSOR_HEADER]
         )
 
         @app.get("/gaia/tasks")
-        async def get_all() -> List[TaskPreview]:
-            return self.tasks.get_all()
+        async def get_all(
+            response: Response,
+            level: Optional[int] = None,
+            cursor: Optional[str] = None,
+            limit: Optional[int] = Query(None, ge=1)
+        ) -> List[TaskPreview]:
+            if level is None and cursor is None and limit is None:
+                return self.tasks.get_all()
+            return paged(response, lambda: self.tasks.get_page(level, cursor, limit))
         
         @app.get("/gaia/tasks/{task_id}")
         async def get_single(task_id: str) -> Optional[FullTask]:
@@ -75,27 +148,46 @@ class Server:
             return self.tasks.get_single(task_id)
 
         @app.get("/gaia/runs")
-        async def get_all_runs() -> List[TaskRunPreview]:
+        async def get_all_runs(
+            response: Response,
+            filter: RunFilter = Depends(run_filter),
+            cursor: Optional[str] = None,
+            limit: Optional[int] = Query(None, ge=1)
+        ) -> List[TaskRunPreview]:
             print('getting all runs!')
-            return self.runs.get_previews()
+            return paged(response, lambda: self.runs.get_preview_page(filter, cursor, limit))
 
         @app.get("/gaia/runs/{run_id}")
-        async def get_single_run(run_id: str) -> TaskRun:
+        async def get_single_run(run_id: str, form: Literal["expanded", "compact"] = "expanded") -> TaskRun:
             print("getting single run!", run_id)
-            run = self.runs.get(run_id)
+            run = self.runs.get(run_id) if form == "expanded" else self.runs.get_compact(run_id)
             if run is None:
                 raise HTTPException(status_code=404, detail="Task run doesn't exist!")
             else:
                 return run
 
+        @app.get("/gaia/blobs/{ref}", response_class=PlainTextResponse)
+        async def get_blob(ref: str) -> str:
+            text = self.blobs.get(ref) if self.blobs is not None else None
+            if text is None:
+                raise HTTPException(status_code=404, detail="Blob doesn't exist!")
+            return text
+
         @app.get("/gaia/tasks/{task_id}/runs")
-        async def get_task_runs(task_id: str) -> List[TaskRunPreview]:
+        async def get_task_runs(
+            task_id: str,
+            response: Response,
+            filter: RunFilter = Depends(run_filter),
+            cursor: Optional[str] = None,
+            limit: Optional[int] = Query(None, ge=1)
+        ) -> List[TaskRunPreview]:
             print("getting all runs for task!", task_id)
             task = self.tasks.get_single(task_id)
             if task is None:
                 raise HTTPException(status_code=404, detail="Task doesn't exist!")
             else:
-                return self.runs.get_task_runs(task)
+                task_filter = filter.model_copy(update={"task_id": task_id})
+                return paged(response, lambda: self.runs.get_preview_page(task_filter, cursor, limit))
         
         async def run_task(run: TaskRun):
             await self.updates.put({"tag": "started", "run_id": run.id})
@@ -125,6 +217,40 @@ class Server:
                 bg_tasks.add_task(run_task, run)
                 return run.id
         
+        @app.post("/gaia/sweeps")
+        async def queue_sweep(request: SweepRequest) -> List[str]:
+            task_ids = request.task_ids if request.task_ids is not None else [t.task_id for t in self.tasks.get_all()]
+            tasks = self.tasks.get_many(task_ids)
+            if any(t is None for t in tasks):
+                raise HTTPException(status_code=404, detail="Task doesn't exist!")
+            run_ids = []
+            for run in self.runs.start_many([(cast(FullTask, task), request.command) for task in tasks]):
+                self.leases.enqueue(run)
+                run_ids.append(run.id)
+            return run_ids
+
+        @app.post("/gaia/leases")
+        async def claim_lease(request: LeaseRequest) -> Optional[Lease]:
+            lease = self.leases.claim(request.worker_id, request.lease_s)
+            if lease is not None:
+                await self.updates.put({"tag": "started", "run_id": lease.run_id})
+            return lease
+
+        @app.post("/gaia/leases/{lease_id}/heartbeat")
+        async def heartbeat_lease(lease_id: str, request: LeaseRequest) -> Lease:
+            lease = self.leases.heartbeat(lease_id, request.worker_id, request.lease_s)
+            if lease is None:
+                raise HTTPException(status_code=404, detail="Lease expired or doesn't exist!")
+            return lease
+
+        @app.post("/gaia/leases/{lease_id}/result")
+        async def submit_lease_result(lease_id: str, worker_id: str, result: TaskResult):
+            run = self.leases.complete(lease_id, worker_id)
+            if run is None:
+                raise HTTPException(status_code=404, detail="Lease expired or doesn't exist!")
+            self.runs.finish(run, result)
+            await self.updates.put({"tag": "finished", "run_id": run.id, "result": result.status})
+
         async def update_events():
             try:
                 while True:
@@ -138,6 +264,10 @@ class Server:
         def check_runs():
             return StreamingResponse(update_events(), media_type="text/event-stream")
 
+        @app.get("/gaia/store-metrics")
+        def get_store_metrics() -> Dict[str, float]:
+            return self.runs.metrics()
+
         @app.get("/gaia/check-connection")
         def check_connection() -> Literal["good"]:
             return "good"
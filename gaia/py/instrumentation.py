@@ -0,0 +1,99 @@
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import litellm
+from interpreter import OpenInterpreter
+
+from models import TaskMetrics
+
+
+def count_tokens(model: str, messages: List[Dict[str, Any]] | None = None, text: str | None = None) -> int:
+    # litellm's counter uses the right tokenizer for openai models and falls back to an estimate for
+    # everything else.  a bad guess should never take down a run, though.
+    try:
+        if messages is not None:
+            return litellm.token_counter(model=model, messages=messages)
+        return litellm.token_counter(model=model, text=text or "")
+    except Exception:
+        return 0
+
+
+class Instrumentation:
+    """
+    Wraps an interpreter's LLM completions and code execution to measure where a task's time and
+    tokens go.  Install it before chatting; the numbers accumulate in self.metrics.
+
+    on_code_run, when given, is called with the language, code and output of every run of the agent's
+    code once it's done.  may_run_code, when given, is asked before every run; if it gives a reason, the
+    code isn't run (or counted) and the reason is its only output.
+    """
+    def __init__(
+        self,
+        interpreter: OpenInterpreter,
+        on_code_run: Optional[Callable[[str, str, str], None]] = None,
+        may_run_code: Optional[Callable[[], Optional[str]]] = None
+    ):
+        self.interpreter = interpreter
+        self.on_code_run = on_code_run
+        self.may_run_code = may_run_code
+        self.metrics = TaskMetrics()
+        self.started = time.perf_counter()
+        self.__completions = interpreter.llm.completions
+        self.__computer_run = interpreter.computer.run
+
+    def install(self) -> "Instrumentation":
+        self.interpreter.llm.completions = self.__timed_completions
+        self.interpreter.computer.run = self.__timed_computer_run
+        return self
+
+    def __timed_completions(self, **params) -> Iterator[Any]:
+        model = params.get("model", self.interpreter.llm.model)
+        self.metrics.llm_calls += 1
+        self.metrics.prompt_tokens += count_tokens(model, messages=params.get("messages", []))
+
+        completion = []
+        began = time.perf_counter()
+        try:
+            for chunk in self.__completions(**params):
+                if self.metrics.time_to_first_token is None:
+                    self.metrics.time_to_first_token = time.perf_counter() - self.started
+                try:
+                    delta = chunk["choices"][0]["delta"]
+                    completion.append(delta.get("content") or "")
+                    function_call = delta.get("function_call")
+                    if function_call is not None:
+                        completion.append(function_call.get("arguments") or "")
+                except (KeyError, IndexError, TypeError, AttributeError):
+                    pass
+                yield chunk
+        finally:
+            self.metrics.llm_time += time.perf_counter() - began
+            self.metrics.completion_tokens += count_tokens(model, text="".join(completion))
+
+    def __timed_computer_run(self, *args, **kwargs):
+        if not kwargs.get("stream", False):
+            began = time.perf_counter()
+            try:
+                return self.__computer_run(*args, **kwargs)
+            finally:
+                self.metrics.code_time += time.perf_counter() - began
+        refusal = self.may_run_code() if self.may_run_code is not None else None
+        if refusal is not None:
+            return iter([{"type": "console", "format": "output", "content": f"Not run: {refusal}.\n"}])
+        language = args[0] if len(args) > 0 else kwargs.get("language")
+        code = args[1] if len(args) > 1 else kwargs.get("code")
+        return self.__timed_stream(self.__computer_run(*args, **kwargs), str(language), str(code))
+
+    def __timed_stream(self, chunks: Iterator[Any], language: str, code: str) -> Iterator[Any]:
+        # only the streamed runs are the agent's code; the rest is the interpreter's own bookkeeping.
+        self.metrics.turns += 1
+        output = []
+        began = time.perf_counter()
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, dict) and chunk.get("type") == "console" and isinstance(chunk.get("content"), str):
+                    output.append(chunk["content"])
+                yield chunk
+        finally:
+            self.metrics.code_time += time.perf_counter() - began
+            if self.on_code_run is not None:
+                self.on_code_run(language, code, "".join(output))
@@ -0,0 +1,98 @@
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from models import Lease, TaskRun
+
+
+class LeaseQueue:
+    """
+    Runs waiting for a worker, plus the ones workers are currently holding.  A lease that isn't
+    heartbeated before it expires goes back to the front of the queue for someone else to pick up.
+    It only lives in memory, but given a journal it appends the id of every run it's handed there, so that
+    after a restart Server.requeue_unfinished can queue the ones that never finished again -- and only those,
+    not runs started some other way (like /gaia/invoke).
+    """
+    def __init__(self, now: Callable[[], datetime] = datetime.now, journal: Optional[str] = None):
+        self.now = now
+        self.journal = journal
+        self.queued: Deque[TaskRun] = deque()
+        self.leased: Dict[str, Tuple[Lease, TaskRun]] = {}
+        self.lock = Lock()
+
+    def enqueue(self, run: TaskRun):
+        with self.lock:
+            if self.journal is not None:
+                with open(self.journal, "a") as f:
+                    f.write(run.id + "\n")
+            self.queued.append(run)
+
+    def journaled(self) -> List[str]:
+        # ids of every run the journal has seen queued, oldest first.
+        if self.journal is None:
+            return []
+        try:
+            with open(self.journal) as f:
+                return list(dict.fromkeys(line.strip() for line in f if line.strip() != ""))
+        except FileNotFoundError:
+            return []
+
+    def restore(self, runs: Iterable[TaskRun]):
+        # queues these again and rewrites the journal to hold just them, so it doesn't keep growing with
+        # runs that finished long ago.
+        with self.lock:
+            self.queued.extend(runs)
+            if self.journal is not None:
+                with open(self.journal, "w") as f:
+                    f.writelines(run.id + "\n" for run in self.queued)
+
+    def claim(self, worker_id: str, lease_s: float) -> Optional[Lease]:
+        with self.lock:
+            self.__reap()
+            if len(self.queued) == 0:
+                return None
+            run = self.queued.popleft()
+            lease = Lease(
+                run_id=run.id,
+                worker_id=worker_id,
+                task=run.task,
+                command=run.command,
+                expires=self.now() + timedelta(seconds=lease_s)
+            )
+            self.leased[lease.id] = (lease, run)
+            return lease
+
+    def heartbeat(self, lease_id: str, worker_id: str, lease_s: float) -> Optional[Lease]:
+        # only the worker holding a lease can extend it.
+        with self.lock:
+            self.__reap()
+            held = self.leased.get(lease_id)
+            if held is None or held[0].worker_id != worker_id:
+                return None
+            lease, _ = held
+            lease.expires = self.now() + timedelta(seconds=lease_s)
+            return lease
+
+    def complete(self, lease_id: str, worker_id: str) -> Optional[TaskRun]:
+        # returns None if the lease expired (and the run was handed to someone else), never existed, or
+        # belongs to another worker.
+        with self.lock:
+            self.__reap()
+            held = self.leased.get(lease_id)
+            if held is None or held[0].worker_id != worker_id:
+                return None
+            del self.leased[lease_id]
+            return held[1]
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            self.__reap()
+            return {"queued": len(self.queued), "leased": len(self.leased)}
+
+    def __reap(self):
+        now = self.now()
+        expired = [lease_id for lease_id, (lease, _) in self.leased.items() if lease.expires <= now]
+        for lease_id in expired:
+            _, run = self.leased.pop(lease_id)
+            self.queued.appendleft(run)
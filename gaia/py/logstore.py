@@ -0,0 +1,477 @@
+"""
+An append-only TaskRunStore for places where SQLite's file locking can't be trusted (network volumes,
+mostly).  Every start and finish is one JSON line appended to the current segment file; an in-memory
+index says where each run's latest records are.  The index is checkpointed now and then so startup
+only has to replay what was written since, and a background thread compacts the older segments,
+dropping superseded records and whatever the retention rules say can go.
+
+One process owns a directory at a time.
+
+    python run_server.py --log runs.log/
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, cast
+
+from pydantic import TypeAdapter
+
+from models import CommandConfiguration, FullTask, RunFilter, TaskPreview, TaskResult, TaskRun, TaskRunPreview
+from store import Page, TaskRunStore, decode_run_cursor, encode_cursor, take_page
+
+
+SEGMENT_BYTES = 16 * 2**20
+CHECKPOINT = "checkpoint.json"
+# bump this whenever IndexEntry changes; checkpoints from other versions are ignored (and rebuilt).
+CHECKPOINT_VERSION = 3
+
+TaskResultAdapter: TypeAdapter[TaskResult] = TypeAdapter(TaskResult)
+
+
+class Location(NamedTuple):
+    segment: int
+    offset: int
+    length: int
+
+
+@dataclass
+class IndexEntry:
+    # everything the listings need is in here, so they never have to read a segment.
+    task: TaskPreview
+    started: datetime
+    start: Location
+    # where the latest result is, once there is one.
+    finish: Optional[Location] = None
+    status: Optional[str] = None
+    finished: Optional[datetime] = None
+    model: Optional[str] = None
+
+
+@dataclass
+class Retention:
+    # finished runs older than this are dropped when they're compacted.
+    max_age: Optional[timedelta] = None
+    # only the newest max_runs finished runs are kept.
+    max_runs: Optional[int] = None
+
+
+class LogTaskRunStore(TaskRunStore):
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = SEGMENT_BYTES,
+        # fsync at least once every fsync_batch appends; 1 makes every write durable before it returns.
+        # either way, writers that arrive while an fsync is happening share the next one.
+        fsync_batch: int = 1,
+        # how long an append can go unsynced when fsync_batch > 1.
+        fsync_interval_s: float = 1.0,
+        retention: Retention = Retention(),
+        # None turns off background compaction; compact() can still be called.
+        compact_interval_s: Optional[float] = 300.0,
+        checkpoint_every: int = 10_000,
+        clock: Callable[[], datetime] = datetime.now
+    ):
+        self.directory = directory
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT)
+        self.segment_bytes = segment_bytes
+        self.fsync_batch = fsync_batch
+        self.fsync_interval_s = fsync_interval_s
+        self.retention = retention
+        self.compact_interval_s = compact_interval_s
+        self.checkpoint_every = checkpoint_every
+        self.clock = clock
+
+        # guards the index and the active segment.  reads take it too, so compaction can't pull a
+        # segment out from under them.
+        self.lock = threading.RLock()
+        self.sync_lock = threading.Lock()
+        self.compact_lock = threading.Lock()
+        self.index: Dict[str, IndexEntry] = {}
+        self.appended = 0
+        self.synced = 0
+        self.since_checkpoint = 0
+        self.fsyncs = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.__load()
+        self.active = open(self.__path(self.active_id), "ab", buffering=0)
+
+        self.stopped = threading.Event()
+        self.background: Optional[threading.Thread] = None
+        if fsync_batch > 1 or compact_interval_s is not None:
+            self.background = threading.Thread(target=self.__maintain, daemon=True)
+            self.background.start()
+
+    def start(self, task: FullTask, command: CommandConfiguration) -> TaskRun:
+        return self.start_many([(task, command)])[0]
+
+    def start_many(self, requests: List[Tuple[FullTask, CommandConfiguration]]) -> List[TaskRun]:
+        started = [TaskRun(task=task, command=command, result=None) for task, command in requests]
+
+        def apply(locations: List[Location]):
+            for run, location in zip(started, locations):
+                self.index[run.id] = IndexEntry(run.to_preview().task, run.started, location, model=run.command.model)
+
+        self.__append([{"op": "start", "run": run.model_dump(mode="json")} for run in started], apply)
+        return started
+
+    def finish(self, run: TaskRun, result: TaskResult):
+        self.finish_many([(run, result)])
+
+    def finish_many(self, results: List[Tuple[TaskRun, TaskResult]]):
+        # all of them in one append (and one fsync).
+        def check():
+            if any(run.id not in self.index for run, _ in results):
+                raise RuntimeError("Not found!!")
+
+        def apply(locations: List[Location]):
+            for (run, result), location in zip(results, locations):
+                entry = self.index[run.id]
+                entry.finish, entry.status, entry.finished = location, result.status, result.created
+
+        self.__append([{"op": "finish", "id": run.id, "result": result.model_dump(mode="json")} for run, result in results], apply, check)
+
+    def get(self, id: str) -> Optional[TaskRun]:
+        with self.lock:
+            entry = self.index.get(id)
+            if entry is None:
+                return None
+            start = self.__read(entry.start)
+            finish = self.__read(entry.finish) if entry.finish is not None else None
+        run = TaskRun.model_validate(start["run"])
+        if finish is not None:
+            run.result = TaskResultAdapter.validate_python(finish["result"])
+        return run
+
+    def iter_runs(self) -> Iterator[TaskRun]:
+        with self.lock:
+            ids = list(self.index.keys())
+        for id in ids:
+            run = self.get(id)
+            if run is not None:
+                yield run
+
+    def get_previews(self) -> List[TaskRunPreview]:
+        return self.__previews(lambda entry: True)
+
+    def get_task_runs(self, task: FullTask) -> List[TaskRunPreview]:
+        return self.__previews(lambda entry: entry.task.task_id == task.task_id)
+
+    def get_preview_page(self, filter: RunFilter = RunFilter(), cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskRunPreview]:
+        # filtered and sorted on the index entries; only the page becomes previews.
+        after = decode_run_cursor(cursor) if cursor is not None else None
+        with self.lock:
+            matching = sorted(
+                (
+                    (e.started, id, e) for id, e in self.index.items()
+                    if filter.matches(e.task, e.started, e.status, e.model) and (after is None or (e.started, id) > after)
+                ),
+                key=lambda item: item[:2]
+            )
+        page, next_cursor = take_page(matching, limit, lambda item: encode_cursor(item[0].isoformat(), item[1]))
+        return [entry_preview(id, e) for _, id, e in page], next_cursor
+
+    def metrics(self) -> Dict[str, float]:
+        with self.lock:
+            return {"appends": self.appended, "fsyncs": self.fsyncs, "runs": len(self.index)}
+
+    def compact(self) -> int:
+        """
+        Rewrites every segment but the active one into a single segment holding only the records the
+        index still points at, minus the runs the retention rules drop.  Returns how many runs were
+        dropped.  Does nothing when that single segment is all there is and nothing in it can go.
+        """
+        with self.compact_lock:
+            with self.lock:
+                sealed = [s for s in self.__segments() if s != self.active_id]
+                if len(sealed) == 0:
+                    return 0
+                dropped = self.__expired(set(sealed))
+                for id in dropped:
+                    del self.index[id]
+                # only the start and finish records in the sealed segments are moving.
+                moving = {
+                    id: (entry.start, entry.finish)
+                    for id, entry in self.index.items()
+                    if entry.start.segment in sealed or (entry.finish is not None and entry.finish.segment in sealed)
+                }
+                # a segment that's already compacted and hasn't had anything superseded since would
+                # just be rewritten as it is.
+                live = sum(l.length for locations in moving.values() for l in locations if l is not None and l.segment in sealed)
+                if len(dropped) == 0 and len(sealed) == 1 and live == os.path.getsize(self.__path(sealed[0])):
+                    return 0
+
+            # the sealed segments never change, so they can be read without holding anything up.
+            target = max(sealed)
+            tmp_path = f"{self.__path(target)}.compact.tmp"
+            moved: Dict[str, Tuple[Optional[Location], Optional[Location]]] = {}
+            with open(tmp_path, "wb") as out:
+                offset = 0
+                for id, (start, finish) in sorted(moving.items(), key=lambda item: item[1][0]):
+                    new_locations: List[Optional[Location]] = []
+                    for location in (start, finish):
+                        if location is None or location.segment not in sealed:
+                            new_locations.append(None)
+                            continue
+                        data = self.__read_bytes(location)
+                        out.write(data)
+                        new_locations.append(Location(target, offset, len(data)))
+                        offset += len(data)
+                    moved[id] = (new_locations[0], new_locations[1])
+                out.flush()
+                os.fsync(out.fileno())
+
+            with self.lock:
+                # a crash from here until the new checkpoint is written just means a full replay.
+                if os.path.exists(self.checkpoint_path):
+                    os.remove(self.checkpoint_path)
+                os.replace(tmp_path, self.__path(target))
+                for segment in sealed:
+                    if segment != target:
+                        os.remove(self.__path(segment))
+                fsync_directory(self.directory)
+                for id, (start, finish) in moved.items():
+                    entry = self.index.get(id)
+                    if entry is None:
+                        continue
+                    if start is not None:
+                        entry.start = start
+                    # unless it was finished again while we were busy.
+                    if finish is not None and entry.finish == moving[id][1]:
+                        entry.finish = finish
+                self.__checkpoint()
+            return len(dropped)
+
+    def checkpoint(self):
+        with self.lock:
+            self.__checkpoint()
+
+    def close(self):
+        self.stopped.set()
+        if self.background is not None:
+            self.background.join()
+        with self.lock:
+            self.__checkpoint()
+            self.active.close()
+
+    def __append(self, records: List[Dict[str, Any]], apply: Callable[[List[Location]], None], check: Callable[[], None] = lambda: None):
+        # apply updates the index and check can refuse the write; both run while it's locked.  the
+        # fsync happens after it's unlocked, so other writers can pile up behind it and share the next.
+        lines = [(json.dumps(record, default=str) + "\n").encode("utf-8") for record in records]
+        data = b"".join(lines)
+        with self.lock:
+            check()
+            if self.active_size > 0 and self.active_size + len(data) > self.segment_bytes:
+                self.__roll()
+            locations, offset = [], self.active_size
+            for line in lines:
+                locations.append(Location(self.active_id, offset, len(line)))
+                offset += len(line)
+            # a single write, so a record is either all there or (after a crash) a torn tail that
+            # __replay cuts off.
+            self.active.write(data)
+            self.active_size += len(data)
+            self.appended += 1
+            self.since_checkpoint += len(records)
+            sequence = self.appended
+            apply(locations)
+            unsynced = self.appended - self.synced
+        if unsynced >= self.fsync_batch:
+            self.__sync(sequence)
+
+    def __sync(self, sequence: int):
+        with self.sync_lock:
+            if self.synced >= sequence:
+                # someone else's fsync already covered this write.
+                return
+            with self.lock:
+                target = self.appended
+                # a duplicate, so the segment can be rolled (and closed) while this is syncing.
+                fd = os.dup(self.active.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            with self.lock:
+                self.synced = max(self.synced, target)
+                self.fsyncs += 1
+
+    def __roll(self):
+        os.fsync(self.active.fileno())
+        self.active.close()
+        self.synced = self.appended
+        self.active_id += 1
+        self.active = open(self.__path(self.active_id), "ab", buffering=0)
+        self.active_size = 0
+        fsync_directory(self.directory)
+
+    def __maintain(self):
+        intervals = [i for i in [self.fsync_interval_s if self.fsync_batch > 1 else None, self.compact_interval_s] if i is not None]
+        last_compaction = time.monotonic()
+        while not self.stopped.wait(min(intervals)):
+            if self.appended > self.synced:
+                self.__sync(self.appended)
+            if self.since_checkpoint >= self.checkpoint_every:
+                self.checkpoint()
+            if self.compact_interval_s is not None and time.monotonic() - last_compaction >= self.compact_interval_s:
+                last_compaction = time.monotonic()
+                self.compact()
+
+    def __expired(self, sealed: Set[int]) -> List[str]:
+        # only runs that are entirely in the sealed segments can go.
+        finished = sorted(
+            ((id, e) for id, e in self.index.items() if e.finished is not None and e.finish is not None),
+            key=lambda item: item[1].finished or datetime.min,
+            reverse=True
+        )
+        expired = set()
+        if self.retention.max_age is not None:
+            cutoff = self.clock() - self.retention.max_age
+            expired |= {id for id, e in finished if e.finished is not None and e.finished < cutoff}
+        if self.retention.max_runs is not None:
+            expired |= {id for id, _ in finished[self.retention.max_runs:]}
+        return [id for id in expired if self.index[id].start.segment in sealed and cast(Location, self.index[id].finish).segment in sealed]
+
+    def __previews(self, include: Callable[[IndexEntry], bool]) -> List[TaskRunPreview]:
+        with self.lock:
+            return [entry_preview(id, e) for id, e in self.index.items() if include(e)]
+
+    def __read(self, location: Location) -> Dict[str, Any]:
+        return json.loads(self.__read_bytes(location))
+
+    def __read_bytes(self, location: Location) -> bytes:
+        with open(self.__path(location.segment), "rb") as file:
+            file.seek(location.offset)
+            return file.read(location.length)
+
+    def __load(self):
+        segments = self.__segments()
+        checkpoint = self.__load_checkpoint(segments)
+        if checkpoint is not None:
+            position = (checkpoint["segment"], checkpoint["offset"])
+            self.index = {id: entry_from_json(e) for id, e in checkpoint["index"].items()}
+        else:
+            position = (segments[0] if len(segments) > 0 else 1, 0)
+        for segment in segments:
+            if segment >= position[0]:
+                self.__replay(segment, position[1] if segment == position[0] else 0)
+        self.active_id = segments[-1] if len(segments) > 0 else 1
+        path = self.__path(self.active_id)
+        self.active_size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def __replay(self, segment: int, offset: int):
+        path = self.__path(segment)
+        with open(path, "rb") as file:
+            file.seek(offset)
+            data = file.read()
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("torn write")
+                record = json.loads(line)
+            except ValueError:
+                # whatever was being written when we went down.  nothing after it was acknowledged.
+                with open(path, "r+b") as file:
+                    file.truncate(offset)
+                return
+            location = Location(segment, offset, len(line))
+            if record["op"] == "start":
+                run = record["run"]
+                previous = self.index.get(run["id"])
+                task = TaskPreview(task_id=run["task"]["task_id"], level=run["task"]["level"], question=run["task"]["question"])
+                entry = IndexEntry(task, datetime.fromisoformat(run["started"]), location, model=run["command"]["model"])
+                if previous is not None:
+                    entry.finish, entry.status, entry.finished = previous.finish, previous.status, previous.finished
+                self.index[run["id"]] = entry
+            elif record["id"] in self.index:
+                entry = self.index[record["id"]]
+                result = record["result"]
+                entry.finish, entry.status, entry.finished = location, result["status"], datetime.fromisoformat(result["created"])
+            offset += len(line)
+
+    def __checkpoint(self):
+        # only what's on disk for sure goes in the checkpoint.
+        os.fsync(self.active.fileno())
+        self.synced = self.appended
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "segments": self.__segments(),
+            "segment": self.active_id,
+            "offset": self.active_size,
+            "index": {id: entry_to_json(e) for id, e in self.index.items()},
+        }
+        with open(f"{self.checkpoint_path}.tmp", "w") as file:
+            json.dump(checkpoint, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
+        self.since_checkpoint = 0
+
+    def __load_checkpoint(self, segments: List[int]) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path) as file:
+                checkpoint = json.load(file)
+        except ValueError:
+            return None
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            return None
+        # the segments it describes have to be exactly the ones still here.
+        if [s for s in segments if s <= checkpoint["segment"]] != checkpoint["segments"]:
+            return None
+        size = os.path.getsize(self.__path(checkpoint["segment"])) if checkpoint["segment"] in segments else 0
+        if size < checkpoint["offset"]:
+            return None
+        return checkpoint
+
+    def __segments(self) -> List[int]:
+        return sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def __path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:08d}.log")
+
+
+def fsync_directory(directory: str):
+    # makes new, renamed and removed files stick.
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def entry_preview(id: str, e: IndexEntry) -> TaskRunPreview:
+    return TaskRunPreview(id=id, task=e.task, started=e.started, result=cast(Any, e.status), finished=e.finished, model=e.model)
+
+
+def entry_to_json(e: IndexEntry) -> List[Any]:
+    return [
+        e.task.model_dump(),
+        e.started.isoformat(),
+        list(e.start),
+        list(e.finish) if e.finish is not None else None,
+        e.status,
+        e.finished.isoformat() if e.finished is not None else None,
+        e.model,
+    ]
+
+
+def entry_from_json(j: List[Any]) -> IndexEntry:
+    task, started, start, finish, status, finished, model = j
+    return IndexEntry(
+        TaskPreview(**task),
+        datetime.fromisoformat(started),
+        Location(*start),
+        Location(*finish) if finish is not None else None,
+        status,
+        datetime.fromisoformat(finished) if finished is not None else None,
+        model
+    )
@@ -46,58 +46,101 @@ class FullTask(TaskPreview):
         return self.model_copy()
 
 
+class TaskMetrics(BaseModel):
+    llm_calls: int = 0
+    # how many times the agent ran code and got its output back.
+    turns: int = 0
+    # all times are in seconds.  time_to_first_token is measured from the start of the task.
+    time_to_first_token: Optional[float] = None
+    llm_time: float = 0.0
+    code_time: float = 0.0
+    # counted with the model's tokenizer where litellm knows it, estimated otherwise.
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # set when the conversation was cut short because a final answer had been given: how far into the
+    # task that was, and how many messages there were by then.
+    stopped_early_s: Optional[float] = None
+    stopped_early_message: Optional[int] = None
+
+
 TaskResultStatus = Union[
     Literal["correct"],
     Literal["incorrect"],
     Literal["not-found"],
-    Literal["error"]
+    Literal["error"],
+    Literal["timeout"],
+    Literal["budget-exhausted"]
 ]
 
 
 class TR:
     @staticmethod
-    def correct(actual: str, conversation: List[Dict]) -> "CorrectTaskResult":
+    def correct(actual: str, conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> "CorrectTaskResult":
         return CorrectTaskResult(
             status="correct",
             actual=actual,
-            conversation=conversation
+            conversation=conversation,
+            metrics=metrics
         )
     
     @staticmethod
-    def incorrect(expected: str, actual: str, conversation: List[Dict]) -> "IncorrectTaskResult":
+    def incorrect(expected: str, actual: str, conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> "IncorrectTaskResult":
         return IncorrectTaskResult(
             status="incorrect",
             expected=expected,
             actual=actual,
-            conversation=conversation
+            conversation=conversation,
+            metrics=metrics
         )
     
     @staticmethod
-    def not_found(conversation: List[Dict]) -> "NotFoundTaskResult":
+    def not_found(conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> "NotFoundTaskResult":
         return NotFoundTaskResult(
             status="not-found",
-            conversation=conversation
+            conversation=conversation,
+            metrics=metrics
         )
     
     @staticmethod
-    def error(message: str, conversation: List[Dict]) -> "ErrorTaskResult":
+    def error(message: str, conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> "ErrorTaskResult":
         return ErrorTaskResult(
             status="error",
             message=message,
-            conversation=conversation
+            conversation=conversation,
+            metrics=metrics
+        )
+
+    @staticmethod
+    def timeout(timeout_s: float, conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> "TimeoutTaskResult":
+        return TimeoutTaskResult(
+            status="timeout",
+            timeout_s=timeout_s,
+            conversation=conversation,
+            metrics=metrics
+        )
+
+    @staticmethod
+    def budget_exhausted(reason: str, conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> "BudgetExhaustedTaskResult":
+        return BudgetExhaustedTaskResult(
+            status="budget-exhausted",
+            reason=reason,
+            conversation=conversation,
+            metrics=metrics
         )
 
 
 class CorrectTaskResult(BaseModel):
     status: Literal["correct"] = "correct"
-    created: datetime = datetime.now()
+    created: datetime = Field(default_factory=datetime.now)
+    metrics: Optional[TaskMetrics] = None
     actual: str
     conversation: List[Dict]
 
 
 class IncorrectTaskResult(BaseModel):
     status: Literal["incorrect"] = "incorrect"
-    created: datetime = datetime.now()
+    created: datetime = Field(default_factory=datetime.now)
+    metrics: Optional[TaskMetrics] = None
     expected: str
     actual: str
     conversation: List[Dict]
@@ -105,22 +148,44 @@ class IncorrectTaskResult(BaseModel):
 
 class NotFoundTaskResult(BaseModel):
     status: Literal["not-found"] = "not-found"
-    created: datetime = datetime.now()
+    created: datetime = Field(default_factory=datetime.now)
+    metrics: Optional[TaskMetrics] = None
     conversation: List[Dict]
 
 
 class ErrorTaskResult(BaseModel):
     status: Literal["error"] = "error"
-    created: datetime = datetime.now()
+    created: datetime = Field(default_factory=datetime.now)
+    metrics: Optional[TaskMetrics] = None
     message: str
     conversation: List[Dict]
 
 
+class TimeoutTaskResult(BaseModel):
+    status: Literal["timeout"] = "timeout"
+    created: datetime = Field(default_factory=datetime.now)
+    metrics: Optional[TaskMetrics] = None
+    timeout_s: float
+    # whatever the interpreter got through before it was stopped.
+    conversation: List[Dict]
+
+
+class BudgetExhaustedTaskResult(BaseModel):
+    status: Literal["budget-exhausted"] = "budget-exhausted"
+    created: datetime = Field(default_factory=datetime.now)
+    metrics: Optional[TaskMetrics] = None
+    # which limit ran out (see budget.py).
+    reason: str
+    conversation: List[Dict]
+
+
 TaskResult = Union[
     CorrectTaskResult,
     IncorrectTaskResult,
     NotFoundTaskResult,
-    ErrorTaskResult
+    ErrorTaskResult,
+    TimeoutTaskResult,
+    BudgetExhaustedTaskResult
 ]
 
 
@@ -131,6 +196,10 @@ class CommandConfiguration(BaseModel):
     api_base: str
     api_key: str
     system_prompt: str
+    # per-task limits (see budget.py); no limit when None.
+    max_turns: Optional[int] = None
+    max_tokens: Optional[int] = None
+    max_repeats: Optional[int] = None
 
 
 class TaskRunRequest(BaseModel):
@@ -138,17 +207,65 @@ class TaskRunRequest(BaseModel):
     task_id: str
 
 
+class SweepRequest(BaseModel):
+    command: CommandConfiguration
+    # every task when None.
+    task_ids: Optional[List[str]] = None
+
+
+class LeaseRequest(BaseModel):
+    worker_id: str
+    lease_s: float = 60
+
+
+class Lease(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    run_id: str
+    worker_id: str
+    task: FullTask
+    command: CommandConfiguration
+    expires: datetime
+
+
 class TaskRunPreview(BaseModel):
     id: str
     task: TaskPreview
     started: datetime
     result: Optional[TaskResultStatus]
     finished: Optional[datetime]
+    # the command's model, so the listings can be narrowed down to one.
+    model: Optional[str] = None
+
+
+# the listings hand back everything unless they're given a limit.  when there's more after the page,
+# the cursor for the next one is in this header.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class RunFilter(BaseModel):
+    # what a run listing can be narrowed down to; None lets anything through.
+    task_id: Optional[str] = None
+    level: Optional[int] = None
+    # "running" for the runs that don't have a result yet.
+    status: Optional[Union[TaskResultStatus, Literal["running"]]] = None
+    model: Optional[str] = None
+    started_after: Optional[datetime] = None
+    started_before: Optional[datetime] = None
+
+    def matches(self, task: TaskPreview, started: datetime, status: Optional[str], model: Optional[str]) -> bool:
+        return (
+            (self.task_id is None or task.task_id == self.task_id)
+            and (self.level is None or task.level == self.level)
+            and (self.status is None or (status or "running") == self.status)
+            and (self.model is None or model == self.model)
+            and (self.started_after is None or started >= self.started_after)
+            and (self.started_before is None or started < self.started_before)
+        )
 
 
 class TaskRun(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    started: datetime = datetime.now()
+    started: datetime = Field(default_factory=datetime.now)
     task: FullTask
     command: CommandConfiguration
     # if a result is None, then the task is still running.
@@ -158,10 +275,12 @@ class TaskRun(BaseModel):
         status, finished = (self.result.status, self.result.created) if self.result is not None else (None, None)
         return TaskRunPreview(
             id=self.id,
-            task=self.task,
+            # just what the listings show, so the stores' preview indexes stay small.
+            task=TaskPreview(task_id=self.task.task_id, level=self.task.level, question=self.task.question),
             started=self.started,
             result=status,
-            finished=finished
+            finished=finished,
+            model=self.command.model
         )
 
 
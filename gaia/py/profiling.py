@@ -0,0 +1,183 @@
+"""
+A small sampling profiler for benchmark sweeps.  A background thread looks at the stacks of the threads
+that are running tasks every few milliseconds, so the overhead stays low no matter how much python the
+harness, the interpreter or litellm run.  Samples are tagged with the task they belong to.
+"""
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Event, Lock, Thread, get_ident
+from types import FrameType
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+Stack = Tuple[str, ...]
+
+# the task the current thread (or anything it hands work to, see adopt_current_thread) is working on.
+_current_task: ContextVar[Optional["_Tagged"]] = ContextVar("profiled_task", default=None)
+_profiler: Optional["SweepProfiler"] = None
+
+
+def frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = os.path.normpath(code.co_filename).split(os.sep)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def stack_of(frame: Optional[FrameType]) -> Stack:
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+class SweepProfiler:
+    def __init__(self, interval_s: float = 0.01):
+        self.interval_s = interval_s
+        self.samples: Dict[str, Counter[Stack]] = defaultdict(Counter)
+        # thread ident -> task_id, for every thread currently working on a task.
+        self.threads: Dict[int, str] = {}
+        self.lock = Lock()
+        self.stopped = Event()
+        self.sampler = Thread(target=self.__sample, daemon=True)
+
+    def start(self) -> "SweepProfiler":
+        self.sampler.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def register(self, task_id: str):
+        with self.lock:
+            self.threads[get_ident()] = task_id
+
+    def __sample(self):
+        me = get_ident()
+        while not self.stopped.wait(self.interval_s):
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, task_id in self.threads.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != me:
+                        self.samples[task_id][stack_of(frame)] += 1
+
+    def hotspots(self, task_id: str, n: int = 10) -> List[Tuple[str, float]]:
+        # frames by self time (samples where they're at the top of the stack), in seconds.
+        leaves: Counter[str] = Counter()
+        for stack, count in self.samples[task_id].items():
+            leaves[stack[-1]] += count
+        return [(label, count * self.interval_s) for label, count in leaves.most_common(n)]
+
+    def summary(self, n: int = 10) -> str:
+        lines = []
+        for task_id, stacks in self.samples.items():
+            total = sum(stacks.values()) * self.interval_s
+            lines.append(f"task {task_id}: {total:.1f}s sampled")
+            for label, seconds in self.hotspots(task_id, n):
+                lines.append(f"  {seconds:>8.2f}s  {label}")
+        return "\n".join(lines)
+
+    def write_collapsed(self, path: str):
+        # brendan gregg's folded format, with the task as the root frame.  works with flamegraph.pl,
+        # speedscope, inferno, etc.
+        with open(path, "w") as file:
+            for task_id, stacks in self.samples.items():
+                for stack, count in stacks.items():
+                    file.write(f"{';'.join([f'task {task_id}', *stack])} {count}\n")
+
+    def write_speedscope(self, path: str):
+        frames: Dict[str, int] = {}
+        profiles = []
+        for task_id, stacks in self.samples.items():
+            samples, weights = [], []
+            for stack, count in stacks.items():
+                samples.append([frames.setdefault(label, len(frames)) for label in stack])
+                weights.append(count * self.interval_s)
+            profiles.append({
+                "type": "sampled",
+                "name": f"task {task_id}",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            })
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": "benchmark sweep",
+            "exporter": "gaia profiling.py",
+            "shared": {"frames": [{"name": label} for label in frames]},
+            "profiles": profiles,
+        }
+        with open(path, "w") as file:
+            json.dump(document, file)
+
+
+def enable(profiler: Optional[SweepProfiler]):
+    global _profiler
+    _profiler = profiler
+
+
+@dataclass
+class _Tagged:
+    task_id: str
+    # the thread that's being sampled for the task.
+    ident: int
+    active: bool = True
+
+
+@contextmanager
+def profile_task(task_id: str) -> Iterator[None]:
+    # does nothing unless a profiler has been enabled.
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    tagged = _Tagged(task_id, get_ident())
+    token = _current_task.set(tagged)
+    profiler.register(task_id)
+    try:
+        yield
+    finally:
+        with profiler.lock:
+            tagged.active = False
+            profiler.threads.pop(tagged.ident, None)
+        _current_task.reset(token)
+
+
+@contextmanager
+def adopt_current_thread() -> Iterator[None]:
+    """
+    For helper threads started (with a copied context) while a task is being profiled: the task gets
+    sampled on this thread instead of the one that started it, which is presumably just waiting.
+    """
+    profiler, tagged = _profiler, _current_task.get()
+    if profiler is None or tagged is None:
+        yield
+        return
+    with profiler.lock:
+        # the task may have given up on this thread (timed out) before it got going.
+        adopted = tagged.active
+        if adopted:
+            parent = tagged.ident
+            profiler.threads.pop(parent, None)
+            profiler.threads[get_ident()] = tagged.task_id
+            tagged.ident = get_ident()
+    if not adopted:
+        yield
+        return
+    try:
+        yield
+    finally:
+        with profiler.lock:
+            profiler.threads.pop(get_ident(), None)
+            if tagged.active:
+                profiler.threads[parent] = tagged.task_id
+                tagged.ident = parent
@@ -0,0 +1,151 @@
+"""
+Live progress for benchmark sweeps: how many tasks are done, running and queued, how fast they're
+finishing (over a rolling window), accuracy so far and an ETA.  The engines report into a
+SweepProgress; a ProgressReporter draws it as a status line and writes it out as JSON events.
+"""
+import json
+import sys
+import time
+from collections import Counter, deque
+from datetime import datetime
+from threading import Event, Lock, Thread
+from typing import Callable, Deque, Dict, Optional, TextIO, TypedDict
+
+
+class ProgressSnapshot(TypedDict):
+    total: int
+    completed: int
+    in_flight: int
+    queued: int
+    statuses: Dict[str, int]
+    accuracy: float
+    # finished tasks per minute over the last window_s seconds.
+    throughput: float
+    elapsed_s: float
+    eta_s: Optional[float]
+
+
+class SweepProgress:
+    def __init__(self, window_s: float = 600, clock: Callable[[], float] = time.monotonic):
+        self.window_s = window_s
+        self.clock = clock
+        self.began = clock()
+        self.total = 0
+        self.in_flight = 0
+        self.statuses: Counter[str] = Counter()
+        self.finishes: Deque[float] = deque()
+        self.lock = Lock()
+
+    def add(self, n: int = 1):
+        # more work was queued.
+        with self.lock:
+            self.total += n
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finished(self, status: str):
+        with self.lock:
+            self.in_flight -= 1
+            self.statuses[status] += 1
+            self.finishes.append(self.clock())
+
+    def snapshot(self) -> ProgressSnapshot:
+        with self.lock:
+            now = self.clock()
+            while len(self.finishes) > 0 and self.finishes[0] < now - self.window_s:
+                self.finishes.popleft()
+            completed = sum(self.statuses.values())
+            elapsed = now - self.began
+            window = min(self.window_s, elapsed)
+            throughput = len(self.finishes) / window * 60 if window > 0 else 0.0
+            remaining = self.total - completed
+            return {
+                "total": self.total,
+                "completed": completed,
+                "in_flight": self.in_flight,
+                "queued": remaining - self.in_flight,
+                "statuses": dict(self.statuses),
+                "accuracy": self.statuses["correct"] / completed if completed > 0 else 0.0,
+                "throughput": throughput,
+                "elapsed_s": elapsed,
+                "eta_s": remaining / throughput * 60 if throughput > 0 else (0.0 if remaining == 0 else None),
+            }
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours > 0 else f"{minutes}m{seconds:02d}s"
+
+
+def status_line(s: ProgressSnapshot) -> str:
+    problems = ", ".join(f"{s['statuses'][k]} {k}" for k in ["error", "timeout", "budget-exhausted"] if s["statuses"].get(k, 0) > 0)
+    return (
+        f"{s['completed']}/{s['total']} done, {s['in_flight']} running, {s['queued']} queued | "
+        f"{s['throughput']:.1f} tasks/min | {s['accuracy']:.1%} correct"
+        f"{f' ({problems})' if problems != '' else ''} | "
+        f"elapsed {format_duration(s['elapsed_s'])}, eta {format_duration(s['eta_s'])}"
+    )
+
+
+class ProgressReporter:
+    """
+    Redraws the status line every redraw_s seconds (only when the stream is a terminal -- otherwise it's
+    printed along with every event) and appends a JSON event to events every event_s seconds.
+    """
+    def __init__(
+        self,
+        progress: SweepProgress,
+        events: Optional[TextIO] = None,
+        stream: TextIO = sys.stderr,
+        redraw_s: float = 1.0,
+        event_s: float = 30.0
+    ):
+        self.progress = progress
+        self.events = events
+        self.stream = stream
+        self.redraw_s = redraw_s
+        self.event_s = event_s
+        self.tty = stream.isatty()
+        self.stopped = Event()
+        self.thread = Thread(target=self.__report, daemon=True)
+
+    def start(self) -> "ProgressReporter":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        snapshot = self.progress.snapshot()
+        self.__emit("done", snapshot)
+        self.__draw(snapshot, final=True)
+
+    def __report(self):
+        last_event = time.monotonic()
+        while not self.stopped.wait(self.redraw_s):
+            snapshot = self.progress.snapshot()
+            if self.tty:
+                self.__draw(snapshot)
+            if time.monotonic() - last_event >= self.event_s:
+                last_event = time.monotonic()
+                self.__emit("progress", snapshot)
+                if not self.tty:
+                    self.__draw(snapshot)
+
+    def __draw(self, snapshot: ProgressSnapshot, final: bool = False):
+        if self.tty:
+            self.stream.write(f"\r\x1b[K{status_line(snapshot)}{chr(10) if final else ''}")
+        else:
+            self.stream.write(f"{status_line(snapshot)}\n")
+        self.stream.flush()
+
+    def __emit(self, event: str, snapshot: ProgressSnapshot):
+        if self.events is None:
+            return
+        self.events.write(json.dumps({"event": event, "time": datetime.now().isoformat(), **snapshot}) + "\n")
+        self.events.flush()
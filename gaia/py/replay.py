@@ -0,0 +1,123 @@
+"""
+Replays recorded runs instead of calling an LLM: each run gets back the result (or conversation) that
+was recorded for its task, after sleeping for as long as the recorded run took, divided by a speedup
+factor.  Good for load-testing and regression-testing the engines and the server with realistic
+timing.
+
+    python run_server.py --tasks tasks.json --replay runs.json --speedup 60
+    python run_benchmarks.py --replay output.jsonl --speedup 60
+"""
+import json
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from threading import Lock
+from typing import Any, Deque, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from pydantic import TypeAdapter
+
+from blobs import BlobStore, expand_benchmark_result
+from benchmark import LMC, BenchmarkRunner, OpenInterpreterCommand, RunOutput, timeout_message
+from models import CommandConfiguration, FullTask, TaskMetrics, TaskResult, TaskRun
+from runner import TaskRunner
+from store import TaskRunStore
+
+
+T = TypeVar("T")
+
+
+class Recordings(Generic[T]):
+    """
+    Recordings (with how long each took, in seconds) by key.  Each key hands out its recordings in the
+    order they were recorded and starts over once they've all been used, so replays are deterministic
+    no matter how many times a task is run.
+    """
+    def __init__(self, recordings: Iterable[Tuple[str, T, float]]):
+        self.recordings: Dict[str, Deque[Tuple[T, float]]] = defaultdict(deque)
+        for key, recording, seconds in recordings:
+            self.recordings[key].append((recording, seconds))
+        self.lock = Lock()
+
+    def keys(self) -> List[str]:
+        return list(self.recordings.keys())
+
+    def next(self, key: str) -> Optional[Tuple[T, float]]:
+        with self.lock:
+            queue = self.recordings.get(key)
+            if queue is None or len(queue) == 0:
+                return None
+            recording = queue.popleft()
+            queue.append(recording)
+            return recording
+
+
+def prompt_key(prompt: str) -> str:
+    # the attachment's path changes from run to run (see staging.py), so it can't be part of the key.
+    first, _, rest = prompt.partition("\n")
+    return rest if first.startswith("file_path:") else prompt
+
+
+class ReplayTaskRunner(TaskRunner):
+    def __init__(self, runs: Iterable[TaskRun], speedup: float = 1.0):
+        self.speedup = speedup
+        self.recordings: Recordings[TaskResult] = Recordings(
+            (run.task.task_id, run.result, max(0.0, (run.result.created - run.started).total_seconds()))
+            for run in runs
+            if run.result is not None
+        )
+
+    def run(self, command: CommandConfiguration, task: FullTask) -> TaskResult:
+        recording = self.recordings.next(task.task_id)
+        if recording is None:
+            raise RuntimeError(f"No recorded run of task {task.task_id}!")
+        result, seconds = recording
+        time.sleep(seconds / self.speedup)
+        return result.model_copy(update={"created": datetime.now()})
+
+    @staticmethod
+    def from_file(path: str, speedup: float = 1.0) -> "ReplayTaskRunner":
+        # the same format run_server.py's --runs takes.
+        with open(path) as file:
+            return ReplayTaskRunner(TypeAdapter(List[TaskRun]).validate_python(json.load(file)), speedup)
+
+    @staticmethod
+    def from_store(store: TaskRunStore, speedup: float = 1.0) -> "ReplayTaskRunner":
+        return ReplayTaskRunner(store.iter_runs(), speedup)
+
+
+class ReplayBenchmarkRunner(BenchmarkRunner):
+    def __init__(self, results: Iterable[Dict[str, Any]], speedup: float = 1.0):
+        self.speedup = speedup
+        self.task_ids = set()
+        recordings = []
+        for r in results:
+            self.task_ids.add(r["task_id"])
+            seconds = (as_datetime(r["end"]) - as_datetime(r["start"])).total_seconds()
+            recordings.append((prompt_key(r["prompt"]), r, max(0.0, seconds)))
+        self.recordings: Recordings[Dict[str, Any]] = Recordings(recordings)
+
+    def run(self, command: OpenInterpreterCommand, prompt: str, timeout_s: Optional[float] = None) -> RunOutput:
+        start = datetime.now()
+        recording = self.recordings.next(prompt_key(prompt))
+        if recording is None:
+            return RunOutput(start, [{"role": "error", "content": "No recorded run of this prompt!"}], datetime.now())
+        result, seconds = recording
+        seconds /= self.speedup
+        if timeout_s is not None and seconds > timeout_s:
+            time.sleep(timeout_s)
+            return RunOutput(start, [timeout_message(timeout_s)], datetime.now())
+        time.sleep(seconds)
+        metrics = TaskMetrics(**result["metrics"]) if result.get("metrics") is not None else None
+        messages: List[LMC] = result["messages"]
+        return RunOutput(start, messages, datetime.now(), metrics)
+
+    @staticmethod
+    def from_jsonl(path: str, speedup: float = 1.0) -> "ReplayBenchmarkRunner":
+        # what run_benchmarks.py writes to output.jsonl (compacted or not).
+        blobs = BlobStore()
+        with open(path) as file:
+            return ReplayBenchmarkRunner((expand_benchmark_result(json.loads(line), blobs) for line in file if line.strip() != ""), speedup)
+
+
+def as_datetime(value: Any) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
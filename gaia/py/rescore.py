@@ -0,0 +1,160 @@
+"""
+Grades stored conversations again with the current scoring.py, without rerunning anything.  Works on the
+server's run store and on the output.jsonl files run_benchmarks.py writes:
+
+    python rescore.py store runs
+    python rescore.py jsonl output.jsonl --out rescored.jsonl
+
+Conversations are scored in batches on a pool of processes, the changed statuses are written back and
+every task whose verdict changed is reported.
+"""
+import argparse
+import json
+import os
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from blobs import BlobStore, expand_messages
+from catalog import validation_catalog
+from models import TaskResult
+from scoring import Verdict, benchmark_status, result_for, verdict
+from store import TaskRunStore, open_run_store
+
+
+T = TypeVar("T")
+# (key, conversation, expected answer)
+Item = Tuple[str, List[Dict], str]
+Scored = Tuple[str, Verdict, Optional[str]]
+
+
+@dataclass
+class Change:
+    key: str
+    task_id: str
+    before: str
+    after: str
+
+
+def batched(items: Iterable[T], n: int) -> Iterator[List[T]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def score_batch(batch: List[Item]) -> List[Scored]:
+    return [(key, *verdict(messages, expected)) for key, messages, expected in batch]
+
+
+def rescore(items: Iterable[Item], processes: Optional[int] = None, batch_size: int = 256) -> Iterator[Scored]:
+    if processes == 1:
+        for batch in batched(items, batch_size):
+            yield from score_batch(batch)
+        return
+    processes = processes or os.cpu_count() or 1
+    with Pool(processes) as pool:
+        # a couple of batches per process keeps the pool busy.  items are only read as batches are
+        # handed in (Pool.imap would read all of them up front), so no more than that is ever in memory.
+        in_flight: Deque[AsyncResult] = deque()
+        for batch in batched(items, batch_size):
+            in_flight.append(pool.apply_async(score_batch, (batch,)))
+            if len(in_flight) >= 2 * processes:
+                yield from in_flight.popleft().get()
+        while len(in_flight) > 0:
+            yield from in_flight.popleft().get()
+
+
+def rescore_store(store: TaskRunStore, processes: Optional[int] = None, batch_size: int = 256) -> List[Change]:
+    # errors and timeouts are about how the run went, not about its answer, so they stay as they are.
+    # the conversations aren't kept around once they're scored: the runs whose results changed are
+    # read back from the store, a batch at a time, to be written.  (the shelf store still reads every
+    # run at once to iterate over them; SQLite and the log don't.)
+    pending: Dict[str, Tuple[str, str, TaskResult]] = {}
+
+    def items() -> Iterator[Item]:
+        for run in store.iter_runs():
+            if run.result is None or run.result.status in ("error", "timeout", "budget-exhausted"):
+                continue
+            pending[run.id] = (run.task.task_id, run.task.final_answer, run.result.model_copy(update={"conversation": []}))
+            yield run.id, run.result.conversation, run.task.final_answer
+
+    changes: List[Change] = []
+    # (run id, the answer the scorer found)
+    changed: List[Tuple[str, Optional[str]]] = []
+    for run_id, _, actual in rescore(items(), processes, batch_size):
+        task_id, expected, before = pending.pop(run_id)
+        after = result_for(expected, actual, [], before.metrics)
+        after.created = before.created
+        if after.model_dump() != before.model_dump():
+            changed.append((run_id, actual))
+        if after.status != before.status:
+            changes.append(Change(run_id, task_id, before.status, after.status))
+
+    for batch in batched(changed, batch_size):
+        updates = []
+        for run, (_, actual) in zip(store.get_many([run_id for run_id, _ in batch]), batch):
+            if run is None or run.result is None:
+                continue
+            result = result_for(run.task.final_answer, actual, run.result.conversation, run.result.metrics)
+            result.created = run.result.created
+            updates.append((run, result))
+        store.finish_many(updates)
+    return changes
+
+
+def rescore_jsonl(path: str, out_path: str, processes: Optional[int] = None, batch_size: int = 256) -> List[Change]:
+    catalog = validation_catalog()
+    # the rows are written back as they were, compacted or not; only the grading needs the whole text.
+    blobs = BlobStore()
+
+    def rows() -> Iterator[Tuple[int, Dict]]:
+        with open(path) as file:
+            for i, line in enumerate(file):
+                if line.strip() != "":
+                    yield i, json.loads(line)
+
+    def items() -> Iterator[Item]:
+        for i, row in rows():
+            task = catalog.get(row["task_id"])
+            if task is not None:
+                yield str(i), expand_messages(row["messages"], blobs), task["Final answer"]
+
+    statuses = {int(key): benchmark_status(v) for key, v, _ in rescore(items(), processes, batch_size)}
+
+    changes = []
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "w") as out:
+        for i, row in rows():
+            status = statuses.get(i, row["status"])
+            if status != row["status"]:
+                changes.append(Change(str(i), row["task_id"], row["status"], status))
+                row["status"] = status
+            out.write(json.dumps(row, default=str) + "\n")
+    os.replace(tmp_path, out_path)
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", choices=["store", "jsonl"])
+    parser.add_argument("path", type=str, help="the shelf (or .db) the server keeps its runs in, or a .jsonl file from run_benchmarks.py")
+    parser.add_argument("--out", type=str, help="where to write the rescored .jsonl (defaults to overwriting it)")
+    parser.add_argument("--processes", type=int, help="defaults to one per core")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.source == "store":
+        changes = rescore_store(open_run_store(args.path), args.processes, args.batch_size)
+    else:
+        changes = rescore_jsonl(args.path, args.out or args.path, args.processes, args.batch_size)
+
+    for change in changes:
+        print(f"{change.task_id} ({change.key}): {change.before} -> {change.after}")
+    print(f"{len(changes)} verdict(s) changed.")
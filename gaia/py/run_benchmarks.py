@@ -1,11 +1,25 @@
+import argparse
+import atexit
 import os
-import re
 import io
+import json
+import logging
 import csv
+import statistics
+from dataclasses import replace
 from typing import TypedDict, Optional, Dict, cast, List
-from datasets import load_dataset
 
-from benchmark import Benchmark, OpenInterpreterCommand, ResultStatus, TaskResult, ZeroShotTask, run_benchmark, run_benchmark_threaded, run_benchmark_threaded_pool
+from attachments import AttachmentCache, attachment_context
+from blobs import BlobStore, compact_benchmark_result
+from benchmark import Benchmark, BenchmarkRunner, DefaultBenchmarkRunner, OpenInterpreterCommand, ResultStatus, TaskResult, ZeroShotTask, format_sweep_report, run_benchmark, run_benchmark_sweep, run_benchmark_threaded, run_benchmark_threaded_pool, summarize_sweep
+from catalog import validation_catalog
+from cost_model import DEFAULT_HISTORY_PATH, CostModel, append_history
+from profiling import SweepProfiler, enable as enable_profiling
+from progress import ProgressReporter, SweepProgress
+from replay import ReplayBenchmarkRunner
+from sandbox import ContainerPool
+from scoring import benchmark_status, verdict
+from trials import StoppingRule, run_benchmark_trials
 
 
 GAIATask = TypedDict("GAIATask", {
@@ -19,48 +33,43 @@ GAIATask = TypedDict("GAIATask", {
 })
 
 
-def gaia_benchmark(first_n: Optional[int] = None) -> Benchmark[GAIATask]:
+def gaia_benchmark(
+    first_n: Optional[int] = None,
+    cost_model: Optional[CostModel] = None,
+    attachments: Optional[AttachmentCache] = None,
+    with_attachments_only: bool = False
+) -> Benchmark[GAIATask]:
     def get_tasks() -> List[GAIATask]:
-        ds = load_dataset("gaia-benchmark/GAIA", "2023_all", split="validation")
-        as_list = cast(List[GAIATask], list(ds))
+        as_list = cast(List[GAIATask], validation_catalog().rows())
+        if with_attachments_only:
+            as_list = [t for t in as_list if t["file_name"] != ""]
         if first_n is not None:
-            return as_list[:first_n]
-        else:
-            return as_list
+            as_list = as_list[:first_n]
+        if cost_model is not None:
+            cost_model.calibrate(as_list)
+        return as_list
         # data = load_dataset("gaia-benchmark/GAIA", "2023_all", split="validation")
         # tfel = [d for d in data if "tfel" in d["Question"]]
         # return tfel
     
     def task_to_id_prompt(task: GAIATask) -> ZeroShotTask:
-        file_path = f"files/{task['file_name']}"
-        prompt = task["Question"] if task["file_name"] == "" else f"file_path: {file_path}\n{task['Question']}"
-        return {"id": task["task_id"], "prompt": prompt}
+        # the attachment's path is added to the prompt once it's been staged for the run.
+        attachment = task["file_name"] if task["file_name"] != "" else None
+        prompt = task["Question"]
+        extraction = attachments.get(f"files/{attachment}") if attachments is not None and attachment is not None else None
+        if extraction is not None:
+            prompt = f"{prompt}\n\n{attachment_context(extraction)}"
+        return {"id": task["task_id"], "prompt": prompt, "attachment": attachment}
     
     def task_result_status(task: GAIATask, messages: List[Dict[str, str]]) -> ResultStatus:
-        if len(messages) == 0:
-            return "unknown"
-        final_message = messages[-1]
-        if "role" not in final_message:
-            return "unknown"
-        if final_message["role"] == "error":
-            return "error"
-        if "content" not in final_message:
-            return "unknown"
-        final_answer_re = re.search("FINAL ANSWER: (.+)", final_message["content"])
-        if final_answer_re is None:
-            return "unknown"
-
-        expected = task["Final answer"]
-        actual = final_answer_re.group(1).strip()
-        if actual.lower() != expected.lower():
-            return "incorrect"
-        else:
-            return "correct"
+        status, _ = verdict(messages, task["Final answer"])
+        return cast(ResultStatus, benchmark_status(status))
 
     return Benchmark(
         get_tasks,
         task_to_id_prompt,
-        task_result_status
+        task_result_status,
+        cost_model.estimate if cost_model is not None else None
     )
 
 
@@ -111,19 +120,199 @@ commands: Dict[str, OpenInterpreterCommand] = {
 }
 
 
-def consume_results(results: List[TaskResult]):
+# slots per backend when sweeping.  the local llama box can only handle one conversation at a time.
+default_backend_limits: Dict[str, int] = {
+    "openai": 16,
+    "ollama": 1,
+}
+
+
+def consume_results(results: List[TaskResult], path: str = "output.csv"):
     if len(results) > 0:
         f = io.StringIO("")
         with io.StringIO("") as f:
-            writer = csv.DictWriter(f, results[0].keys())
+            # every key any row has, in the order they first turn up; rows without one leave it empty.
+            writer = csv.DictWriter(f, list(dict.fromkeys(k for r in results for k in r.keys())))
             writer.writeheader()
             writer.writerows(results)
-            with open("output.csv", "w") as csv_file:
+            with open(path, "w") as csv_file:
                 v = f.getvalue()
                 csv_file.write(v)
 
 
-b = gaia_benchmark()
-# results = run_benchmark(b, commands["gpt4"])
-results = run_benchmark_threaded_pool(b, commands["gpt35turbo"])
-consume_results(results)
+def write_jsonl(results: List[TaskResult], path: str = "output.jsonl", blobs: Optional[BlobStore] = None):
+    # unlike the csv, this keeps the conversations intact so rescore.py can grade them again later.
+    # with blobs, the big payloads are in there instead (see blobs.py).
+    with open(path, "w") as file:
+        for result in results:
+            row = compact_benchmark_result(cast(Dict, result), blobs) if blobs is not None else result
+            file.write(json.dumps(row, default=str) + "\n")
+
+
+def compare_pre_extraction(
+    name: str,
+    command: OpenInterpreterCommand,
+    attachments: AttachmentCache,
+    first_n: Optional[int] = None,
+    n_threads: int = 4,
+    runner: Optional[BenchmarkRunner] = None,
+    task_timeout_s: Optional[float] = None,
+    progress: Optional[SweepProgress] = None
+) -> Dict[str, List[TaskResult]]:
+    # the same tasks (only the ones with an attachment) with and without the extracted contents in the prompt.
+    results = {}
+    for label, cache in [(name, None), (f"{name}+extract", attachments)]:
+        b = gaia_benchmark(first_n, attachments=cache, with_attachments_only=True)
+        results[label] = run_benchmark_threaded(b, command, n_threads, runner, task_timeout_s=task_timeout_s, progress=progress)
+    return results
+
+
+def format_metrics_report(results: Dict[str, List[TaskResult]]) -> str:
+    header = f"{'command':<24}{'turns':>8}{'llm calls':>11}{'prompt tok':>12}{'compl tok':>11}{'llm s':>8}{'code s':>8}"
+    lines = [header, "-" * len(header)]
+    for name, rs in results.items():
+        ms = [r["metrics"] for r in rs if r.get("metrics") is not None]
+        mean = lambda key: statistics.mean(m[key] for m in ms) if len(ms) > 0 else 0.0
+        lines.append(
+            f"{name:<24}{mean('turns'):>8.1f}{mean('llm_calls'):>11.1f}{mean('prompt_tokens'):>12.0f}"
+            f"{mean('completion_tokens'):>11.0f}{mean('llm_time'):>8.1f}{mean('code_time'):>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_limits(limits: List[str]) -> Dict[str, int]:
+    parsed = dict(default_backend_limits)
+    for limit in limits:
+        backend, n = limit.split("=", 1)
+        parsed[backend] = int(n)
+    return parsed
+
+
+def write_profile(profiler: SweepProfiler, prefix: str = "profile"):
+    profiler.stop()
+    profiler.write_collapsed(f"{prefix}.collapsed")
+    profiler.write_speedscope(f"{prefix}.speedscope.json")
+    print(profiler.summary(10))
+    print(f"flame graphs: {prefix}.collapsed (flamegraph.pl, inferno), {prefix}.speedscope.json (speedscope.app)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", nargs="+", choices=list(commands.keys()), default=["gpt35turbo"])
+    parser.add_argument("--limit", action="append", default=[], help="backend=slots, e.g. --limit ollama=1 --limit openai=16")
+    parser.add_argument("--first-n", type=int)
+    parser.add_argument("--timeout", type=float, default=30 * 60, help="per-task wall-clock limit in seconds")
+    parser.add_argument("--sweep-timeout", type=float, help="wall-clock limit for the whole sweep in seconds")
+    parser.add_argument("--trials", type=int, help="run each task up to this many times, stopping once its outcome is settled")
+    parser.add_argument("--threads", type=int, help="threads per command in --trials and --compare-pre-extract modes")
+    parser.add_argument("--sandbox", type=int, help="run agent code in a pool of this many containers (see sandbox.py)")
+    parser.add_argument("--pre-extract", action="store_true", help="put each attachment's extracted contents in the prompt (see attachments.py)")
+    parser.add_argument("--compare-pre-extract", action="store_true", help="run the tasks with attachments with and without --pre-extract and compare")
+    parser.add_argument("--profile", action="store_true", help="sample every task's stacks and write profile.collapsed/profile.speedscope.json")
+    parser.add_argument("--profile-interval", type=float, default=0.01, help="seconds between --profile samples")
+    parser.add_argument("--replay", type=str, help="replay the runs in this .jsonl (e.g. an old output.jsonl) instead of calling any LLM")
+    parser.add_argument("--speedup", type=float, default=1.0, help="how much faster than recorded --replay runs should go")
+    parser.add_argument("--stop-on-answer", action="store_true", help="end each chat as soon as the agent has written its FINAL ANSWER line")
+    parser.add_argument("--progress-events", type=str, default="progress.jsonl", help="where to append periodic progress events (json lines)")
+    parser.add_argument("--progress-interval", type=float, default=30, help="seconds between progress events")
+    parser.add_argument("--max-turns", type=int, help="stop a task once it has run code this many times")
+    parser.add_argument("--max-tokens", type=int, help="stop a task once it has used this many tokens")
+    parser.add_argument("--max-repeats", type=int, help="stop a task once it has run the same code, or hit the same error, this many times")
+    parser.add_argument("--compact", action="store_true", help="move big payloads out of the .jsonl output into .blobs/ (see blobs.py)")
+    parser.add_argument("--history", type=str, default=DEFAULT_HISTORY_PATH, help="csv every run's per-task durations are appended to, for ordering the next run's tasks (see cost_model.py)")
+    parser.add_argument("--verbose", action="store_true", help="log every task as it starts and finishes (instead of the status line)")
+    args = parser.parse_args()
+
+    blobs = BlobStore() if args.compact else None
+
+    # the budget flags apply to every command in this run.
+    budget = {k: v for k, v in [("max_turns", args.max_turns), ("max_tokens", args.max_tokens), ("max_repeats", args.max_repeats)] if v is not None}
+    for name in args.commands:
+        commands[name] = cast(OpenInterpreterCommand, {**commands[name], **budget})
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG, format="%(message)s")
+
+    if args.profile:
+        profiler = SweepProfiler(args.profile_interval).start()
+        enable_profiling(profiler)
+        atexit.register(write_profile, profiler)
+
+    sandbox = ContainerPool(args.sandbox).start() if args.sandbox is not None else None
+    if sandbox is not None:
+        atexit.register(sandbox.close)
+    runner = DefaultBenchmarkRunner(sandbox, args.stop_on_answer) if args.replay is None else ReplayBenchmarkRunner.from_jsonl(args.replay, args.speedup)
+
+    # --verbose logs every task, which would just scribble over the status line.
+    progress = SweepProgress()
+    reporter = None if args.verbose else ProgressReporter(progress, open(args.progress_events, "a"), event_s=args.progress_interval).start()
+
+    if args.compare_pre_extract:
+        comparisons = {
+            name: compare_pre_extraction(name, commands[name], AttachmentCache(), args.first_n, args.threads or 4, runner, args.timeout, progress)
+            for name in args.commands
+        }
+        if reporter is not None:
+            reporter.stop()
+        for name, compared in comparisons.items():
+            write_jsonl([r for rs in compared.values() for r in rs], f"pre-extract-{name}.jsonl", blobs)
+            print(format_sweep_report(summarize_sweep(compared)))
+            print(format_metrics_report(compared))
+        exit(0)
+
+    # previous durations (if there are any) make the expensive-first ordering a lot more accurate.
+    cost_model = CostModel.from_history(args.history, args.commands)
+    b = gaia_benchmark(args.first_n, cost_model=cost_model, attachments=AttachmentCache() if args.pre_extract else None)
+    # replayed durations are however fast the replay went, not how long the tasks take.
+    record_history = args.replay is None
+    if isinstance(runner, ReplayBenchmarkRunner):
+        # only the tasks there's something to replay for.
+        recorded, get_tasks = runner.task_ids, b.get_tasks
+        b = replace(b, get_tasks=lambda: [t for t in get_tasks() if t["task_id"] in recorded])
+
+    if args.trials is not None:
+        reports = {
+            name: run_benchmark_trials(
+                b,
+                commands[name],
+                StoppingRule(max_trials=args.trials),
+                args.threads,
+                runner,
+                task_timeout_s=args.timeout,
+                sweep_timeout_s=args.sweep_timeout,
+                progress=progress
+            )
+            for name in args.commands
+        }
+        if reporter is not None:
+            reporter.stop()
+        for name, report in reports.items():
+            if record_history:
+                append_history(name, [a for t in report["tasks"] for a in t["attempts"]], args.history)
+            consume_results([a for t in report["tasks"] for a in t["attempts"]], f"trials-{name}.csv")
+            write_jsonl([a for t in report["tasks"] for a in t["attempts"]], f"trials-{name}.jsonl", blobs)
+            consume_results([{k: v for k, v in t.items() if k != "attempts"} for t in report["tasks"]], f"trials-{name}-summary.csv")
+            pass_at = ", ".join(f"pass@{k}={v:.1%}" for k, v in report["pass_at"].items())
+            print(f"{name}: {report['total_attempts']} attempt(s) over {len(report['tasks'])} task(s); {pass_at}")
+        exit(0)
+
+    sweep = run_benchmark_sweep(
+        b,
+        {name: commands[name] for name in args.commands},
+        parse_limits(args.limit),
+        runner=runner,
+        task_timeout_s=args.timeout,
+        sweep_timeout_s=args.sweep_timeout,
+        progress=progress
+    )
+    if reporter is not None:
+        reporter.stop()
+    if record_history:
+        for name, results in sweep.items():
+            append_history(name, results, args.history)
+    consume_results([r for rs in sweep.values() for r in rs])
+    write_jsonl([r for rs in sweep.values() for r in rs], blobs=blobs)
+
+    summaries = summarize_sweep(sweep)
+    consume_results(cast(List, summaries), "sweep.csv")
+    print(format_sweep_report(summaries))
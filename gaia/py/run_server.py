@@ -1,11 +1,17 @@
 import argparse
+import atexit
 import json
 import os
 from typing import List, Optional
 import uvicorn
 from fastapi_server import Server
 from models import FullTask, TaskResult, TaskRun
-from store import DefaultTaskRunStore, DefaultTaskStore, MemoryTaskRunStore, MemoryTaskStore, TaskRunStore, TaskStore
+from store import BatchingTaskRunStore, CompactingTaskRunStore, DefaultTaskRunStore, DefaultTaskStore, MemoryTaskRunStore, MemoryTaskStore, SqliteTaskRunStore, TaskRunStore, TaskStore
+from attachments import AttachmentCache
+from blobs import BlobStore
+from logstore import LogTaskRunStore
+from sandbox import ContainerPool
+from replay import ReplayTaskRunner
 from runner import DefaultTaskRunner, FakeTaskRunner, TaskRunner
 from pydantic import TypeAdapter
 
@@ -20,9 +26,23 @@ def make_task_store(tasks_path: Optional[str]) -> TaskStore:
         return MemoryTaskStore(os)
 
 
-def make_task_runner(result_path: Optional[str]) -> TaskRunner:
+def make_task_runner(
+    result_path: Optional[str],
+    timeout_s: Optional[float] = None,
+    sandbox_size: Optional[int] = None,
+    pre_extract: bool = False,
+    replay_path: Optional[str] = None,
+    speedup: float = 1.0,
+    stop_on_answer: bool = False
+) -> TaskRunner:
+    if replay_path is not None:
+        return ReplayTaskRunner.from_file(replay_path, speedup)
     if result_path is None:
-        return DefaultTaskRunner()
+        sandbox = ContainerPool(sandbox_size).start() if sandbox_size is not None else None
+        if sandbox is not None:
+            atexit.register(sandbox.close)
+        attachments = AttachmentCache() if pre_extract else None
+        return DefaultTaskRunner(timeout_s, sandbox, attachments, stop_on_answer)
     
     with open(result_path) as file:
         js = json.load(file)
@@ -30,7 +50,11 @@ def make_task_runner(result_path: Optional[str]) -> TaskRunner:
         return FakeTaskRunner(os)
 
 
-def make_task_runs_store(runs_path: Optional[str]) -> TaskRunStore:
+def make_task_runs_store(runs_path: Optional[str], db_path: Optional[str] = None, log_dir: Optional[str] = None) -> TaskRunStore:
+    if db_path is not None:
+        return SqliteTaskRunStore(db_path)
+    if log_dir is not None:
+        return LogTaskRunStore(log_dir)
     if runs_path is None:
         return DefaultTaskRunStore("runs")
 
@@ -48,15 +72,39 @@ if __name__ == "__main__":
     parser.add_argument("--runs", type=str)
     parser.add_argument("--host", type=str)
     parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--timeout", type=float, help="per-task wall-clock limit in seconds")
+    parser.add_argument("--sandbox", type=int, help="run agent code in a pool of this many containers (see sandbox.py)")
+    parser.add_argument("--pre-extract", action="store_true", help="put each attachment's extracted contents in the prompt (see attachments.py)")
+    parser.add_argument("--replay", type=str, help="replay the runs recorded in this file (same format as --runs) instead of running anything")
+    parser.add_argument("--speedup", type=float, default=1.0, help="how much faster than recorded --replay runs should go")
+    parser.add_argument("--stop-on-answer", action="store_true", help="end each chat as soon as the agent has written its FINAL ANSWER line")
+    parser.add_argument("--db", type=str, help="keep the runs in this SQLite database instead of the runs shelf (python store.py migrate runs <db> copies them over)")
+    parser.add_argument("--log", type=str, help="keep the runs in an append-only log in this directory, for volumes SQLite can't lock (see logstore.py)")
+    parser.add_argument("--blobs", type=str, help="store the runs compacted, with their big payloads in this directory (see blobs.py)")
+    parser.add_argument("--batch-window", type=float, help="write the runs' results in batches, gathering them for up to this many seconds (see BatchingTaskRunStore)")
+    parser.add_argument("--leases", type=str, default="leases.log", help="journal of the runs queued for workers, so a restart can queue the unfinished ones again (see leases.py)")
     args = parser.parse_args()
 
     tasks = make_task_store(args.tasks)
-    runner = make_task_runner(args.results)
-    runs = make_task_runs_store(args.runs)
+    runner = make_task_runner(args.results, args.timeout, args.sandbox, args.pre_extract, args.replay, args.speedup, args.stop_on_answer)
+    runs = make_task_runs_store(args.runs, args.db, args.log)
+    blobs = BlobStore(args.blobs) if args.blobs is not None else None
+    if blobs is not None:
+        runs = CompactingTaskRunStore(runs, blobs)
+    if args.batch_window is not None:
+        # SQLite and the log can take reads alongside the writer; the shelf can't.
+        runs = BatchingTaskRunStore(runs, args.batch_window, exclusive=args.db is None and args.log is None)
 
-    app = Server(tasks, runner, runs).make_app()
+    server = Server(tasks, runner, runs, blobs, args.leases)
+    requeued = server.requeue_unfinished()
+    if requeued > 0:
+        print(f"requeued {requeued} unfinished run(s) for the workers.")
+    app = server.make_app()
     if args.host is not None:
         uvicorn.run(app, port=args.port, host=args.host)
     else:
         uvicorn.run(app, port=args.port)
+    if isinstance(runs, BatchingTaskRunStore):
+        # whatever's still waiting to be written.
+        runs.close()
    
\ No newline at end of file
@@ -1,10 +1,17 @@
-import re
 import traceback
 from abc import ABC, abstractmethod
-from typing import List, cast
+from contextlib import nullcontext
+from threading import Lock
+from typing import List, Optional, cast
 from interpreter import OpenInterpreter
 
+from attachments import AttachmentCache, attachment_context
+from budget import Budget
+from chat import chat
+from sandbox import WORKDIR, ContainerPool, SandboxUnavailable, sandboxed_languages
+from staging import attachment_prompt, scratch, scratch_languages, stage
 from models import TR, CommandConfiguration, FullTask, TaskResult
+from scoring import score
 
 
 def interpreter_from_command(cmd: CommandConfiguration) -> OpenInterpreter:
@@ -28,42 +35,84 @@ class FakeTaskRunner(TaskRunner):
     def __init__(self, results: List[TaskResult]):
         self.current_index = 0
         self.results = results
+        self.lock = Lock()
     
     def run(self, command: CommandConfiguration, task: FullTask) -> TaskResult:
-        if self.current_index >= len(self.results):
-            raise RuntimeError(f"Used up all {len(self.results)} results!")
-        return self.results[self.current_index]
+        with self.lock:
+            if self.current_index >= len(self.results):
+                raise RuntimeError(f"Used up all {len(self.results)} results!")
+            result = self.results[self.current_index]
+            self.current_index += 1
+            return result
 
 
 class DefaultTaskRunner(TaskRunner):
+    def __init__(
+        self,
+        timeout_s: Optional[float] = None,
+        sandbox: Optional[ContainerPool] = None,
+        attachments: Optional[AttachmentCache] = None,
+        stop_on_answer: bool = False
+    ):
+        self.timeout_s = timeout_s
+        # when given, the agent's code runs in a container borrowed from the pool rather than on the host.
+        self.sandbox = sandbox
+        # when given, the attachment's pre-extracted contents go right into the prompt.
+        self.attachments = attachments
+        # stop the chat as soon as a FINAL ANSWER line has been written (see chat.py).
+        self.stop_on_answer = stop_on_answer
+
     def run(self, command: CommandConfiguration, task: FullTask) -> TaskResult:
-        interpreter = interpreter_from_command(command)
+        try:
+            attachment = task.file_name if task.file_name != "" else None
+            with self.sandbox.lease(attachment) if self.sandbox is not None else nullcontext() as container:
+                interpreter = interpreter_from_command(command)
+                # a container is scratch space enough; on the host the agent gets a directory of its own.
+                with nullcontext(None) if container is not None else scratch() as directory:
+                    if container is not None:
+                        interpreter.computer.terminal.languages = sandboxed_languages(container)
+                    else:
+                        interpreter.computer.terminal.languages = scratch_languages(directory, interpreter.computer.terminal.languages)
+                    attachment_path = self.__stage(task, container, directory)
+                    budget = Budget(command.max_turns, command.max_tokens, command.max_repeats)
+                    return self.__run(interpreter, task, attachment_path, budget)
+        except SandboxUnavailable as e:
+            return TR.error(str(e), [{ "role": "error", "content": str(e) }])
 
-        file_path = f"files/{task.file_name}"
-        prompt = task.question
-        if file_path != '':
-            prompt = f"file_path:{file_path}\n{prompt}"
+    def __stage(self, task: FullTask, container: Optional[str], directory: Optional[str]) -> Optional[str]:
+        if task.file_name == "":
+            return None
+        # the pool put it in the container's files/ when it was leased.
+        if container is not None or directory is None:
+            return f"{WORKDIR}/files/{task.file_name}"
+        return stage(task.file_name, directory)
 
+    def __run(self, interpreter: OpenInterpreter, task: FullTask, attachment_path: Optional[str], budget: Budget) -> TaskResult:
+        prompt = attachment_prompt(task.question, attachment_path)
+        extraction = self.attachments.get(f"files/{task.file_name}") if self.attachments is not None and task.file_name != "" else None
+        if extraction is not None:
+            prompt = f"{prompt}\n\n{attachment_context(extraction)}"
+
+        metrics = None
         try:
-            output = cast(List, interpreter.chat(prompt, display=True, stream=False))
+            outcome = chat(interpreter, prompt, self.timeout_s, display=True, stop_on_answer=self.stop_on_answer, budget=budget)
+            output = outcome.messages
+            metrics = outcome.metrics
+            if outcome.timed_out:
+                return TR.timeout(cast(float, self.timeout_s), output, metrics)
+            if outcome.budget_exhausted is not None:
+                return TR.budget_exhausted(outcome.budget_exhausted, output, metrics)
+            if outcome.error is not None:
+                output = [*output, { "role": "error", "content": outcome.error }]
+                return TR.error(outcome.error.strip().splitlines()[-1], output, metrics)
         except KeyboardInterrupt:
             print("KeyboardInterrupt!")
             output = [*interpreter.messages, { "role": "error", "content": "KeyboardInterrupt" }]
         except Exception as e:
             trace = traceback.format_exc()
             output = [*interpreter.messages, { "role": "error", "content": trace }]
-            return TR.error(str(e), output)
+            return TR.error(str(e), output, metrics)
         finally:
             interpreter.computer.terminate()
 
-        final_message = output[-1]["content"]
-        final_answer_re = re.search("FINAL ANSWER: (.+)", final_message)
-        if final_answer_re is None:
-            return TR.not_found(output)
-
-        final_answer = final_answer_re.group(1).strip().lower()
-        if final_answer == task.final_answer.lower():
-            return TR.correct(task.final_answer, output)
-        else:
-            return TR.incorrect(task.final_answer, final_answer, output)
-    
\ No newline at end of file
+        return score(task.final_answer, output, metrics)
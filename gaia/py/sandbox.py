@@ -0,0 +1,206 @@
+"""
+Runs the code an agent writes inside throwaway containers instead of on the host.  A pool of containers
+is started ahead of time from gaia/Dockerfile; each task borrows one, and once the task is done the
+container is removed and a fresh one is started in the background, so nobody waits on docker.  A
+replacement that won't start is retried a few times before the pool gives up on it and gets smaller.
+
+files/ isn't mounted into the containers.  Each one gets an empty directory of its own instead (read-only,
+at /home/files), and when it's leased for a task the task's attachment is linked into that directory
+(see staging.py), so the agent can see that one file and nothing else.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from queue import Empty, Queue
+from threading import Event, Lock
+from typing import Dict, Iterator, List, Optional
+from interpreter.core.computer.terminal.languages.shell import Shell
+
+from staging import STAGING_DIR, stage
+
+
+DEFAULT_IMAGE = "gaia-sandbox"
+# a task's attachment shows up (read-only) in /home/files, which is where prompts point in sandbox mode.
+WORKDIR = "/home"
+END_OF_CODE = "__GAIA_END_OF_CODE__"
+# how many times a replacement container is tried, and how long to wait after the first failure (the
+# wait doubles after each one).
+LAUNCH_ATTEMPTS = 3
+RETRY_S = 2.0
+# how often a waiting lease checks whether the pool still has any containers at all.
+POLL_S = 1.0
+
+
+class SandboxUnavailable(RuntimeError):
+    pass
+
+
+def build_image(image: str = DEFAULT_IMAGE, context: str = "..", docker: str = "docker"):
+    subprocess.run([docker, "build", "-t", image, context], check=True)
+
+
+def sandboxed_languages(container: str, docker: str = "docker") -> List[type]:
+    """
+    Shell and Python languages whose code runs in the given container.  These replace the terminal's
+    language list entirely, so nothing the agent writes can fall through to the host.
+    """
+    class SandboxedShell(Shell):
+        def __init__(self):
+            super().__init__()
+            self.start_cmd = [docker, "exec", "-i", "-w", WORKDIR, container, "bash"]
+
+    class SandboxedPython(SandboxedShell):
+        # every block runs in its own python process, so (unlike the jupyter-backed default) variables
+        # don't carry over between blocks.
+        file_extension = "py"
+        name = "Python"
+        aliases = ["py"]
+
+        def preprocess_code(self, code):
+            return f"python3 - <<'{END_OF_CODE}'\n{code}\n{END_OF_CODE}\necho \"##end_of_execution##\""
+
+        def detect_active_line(self, line):
+            return None
+
+    return [SandboxedPython, SandboxedShell]
+
+
+class ContainerPool:
+    def __init__(
+        self,
+        size: int,
+        image: str = DEFAULT_IMAGE,
+        files_dir: str = "files",
+        docker: str = "docker",
+        lease_timeout_s: Optional[float] = None
+    ):
+        self.size = size
+        self.image = image
+        self.files_dir = os.path.abspath(files_dir)
+        self.docker = docker
+        # None waits for as long as the pool has containers that might come free.
+        self.lease_timeout_s = lease_timeout_s
+        self.available: Queue[str] = Queue()
+        self.replacer = ThreadPoolExecutor(max_workers=size)
+        # containers that are available, leased out or being replaced.
+        self.live = 0
+        self.lock = Lock()
+        self.closed = Event()
+        # the host directory each container has mounted as its files/.
+        self.mounts: Dict[str, str] = {}
+
+    def start(self) -> "ContainerPool":
+        # every launch is waited for, so that if any of them failed the ones that didn't can be removed.
+        launches = [self.replacer.submit(self.__launch) for _ in range(self.size)]
+        started, failure = [], None
+        for launch in launches:
+            try:
+                started.append(launch.result())
+            except Exception as e:
+                failure = failure if failure is not None else e
+        if failure is not None:
+            for container in started:
+                self.__remove(container)
+            self.replacer.shutdown()
+            raise failure
+        for container in started:
+            self.available.put(container)
+            self.live += 1
+        return self
+
+    @contextmanager
+    def lease(self, attachment: Optional[str] = None) -> Iterator[str]:
+        container = self.__take()
+        try:
+            if attachment is not None:
+                stage(attachment, self.mounts[container], self.files_dir)
+            yield container
+        finally:
+            # containers are never reused -- whatever the last task left behind goes with it.
+            if self.closed.is_set():
+                self.__remove(container)
+            else:
+                self.replacer.submit(self.__replace, container)
+
+    def close(self):
+        self.closed.set()
+        self.replacer.shutdown(wait=True)
+        while not self.available.empty():
+            self.__remove(self.available.get())
+
+    def __take(self) -> str:
+        waited = 0.0
+        while True:
+            try:
+                return self.available.get(timeout=POLL_S)
+            except Empty:
+                waited += POLL_S
+            with self.lock:
+                live = self.live
+            if live == 0:
+                raise SandboxUnavailable("none of the sandbox containers could be restarted")
+            if self.lease_timeout_s is not None and waited >= self.lease_timeout_s:
+                raise SandboxUnavailable(f"no sandbox container came free within {self.lease_timeout_s}s")
+
+    def __launch(self) -> str:
+        # next to files/, so the attachments can be hardlinked in.
+        root = os.path.join(os.path.dirname(self.files_dir), STAGING_DIR)
+        os.makedirs(root, exist_ok=True)
+        mount = tempfile.mkdtemp(prefix="container-", dir=root)
+        try:
+            output = subprocess.run(
+                [
+                    self.docker, "run", "-d", "--rm",
+                    "-v", f"{mount}:{WORKDIR}/files:ro",
+                    "-w", WORKDIR,
+                    self.image,
+                    "sleep", "infinity"
+                ],
+                check=True,
+                capture_output=True,
+                text=True
+            )
+        except BaseException:
+            shutil.rmtree(mount, ignore_errors=True)
+            raise
+        container = output.stdout.strip()
+        with self.lock:
+            self.mounts[container] = mount
+        return container
+
+    def __remove(self, container: str):
+        subprocess.run([self.docker, "rm", "-f", container], capture_output=True)
+        with self.lock:
+            mount = self.mounts.pop(container, None)
+        if mount is not None:
+            shutil.rmtree(mount, ignore_errors=True)
+
+    def __replace(self, container: str):
+        self.__remove(container)
+        for attempt in range(LAUNCH_ATTEMPTS):
+            try:
+                self.available.put(self.__launch())
+                return
+            except Exception as e:
+                detail = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) and e.stderr else str(e)
+                print(f"starting a sandbox container failed (attempt {attempt + 1} of {LAUNCH_ATTEMPTS}): {detail}")
+            if self.closed.wait(RETRY_S * 2 ** attempt):
+                break
+        with self.lock:
+            self.live -= 1
+            live = self.live
+        print(f"gave up on a sandbox container, {live} of {self.size} left.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["build"])
+    parser.add_argument("--image", type=str, default=DEFAULT_IMAGE)
+    parser.add_argument("--context", type=str, default="..", help="the directory holding gaia's Dockerfile")
+    args = parser.parse_args()
+
+    build_image(args.image, args.context)
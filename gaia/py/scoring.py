@@ -0,0 +1,61 @@
+"""
+Grades a conversation against a task's expected answer.  The live runners and rescore.py all go through
+here, so changing how answers are pulled out or compared only means re-running rescore.py.
+"""
+import re
+from typing import Dict, List, Literal, Optional, Tuple
+
+from models import TR, TaskMetrics, TaskResult
+
+
+FINAL_ANSWER_RE = re.compile("FINAL ANSWER: (.+)")
+
+Verdict = Literal["correct", "incorrect", "not-found", "error", "timeout", "budget-exhausted"]
+
+
+def final_answer(messages: List[Dict]) -> Optional[str]:
+    # we're assuming the "FINAL ANSWER: " text is in the last message of the LLM's response.
+    if len(messages) == 0:
+        return None
+    content = messages[-1].get("content")
+    if not isinstance(content, str):
+        return None
+    final_answer_re = FINAL_ANSWER_RE.search(content)
+    if final_answer_re is None:
+        return None
+    return final_answer_re.group(1).strip()
+
+
+def answers_match(expected: str, actual: str) -> bool:
+    return actual.strip().lower() == expected.strip().lower()
+
+
+def verdict(messages: List[Dict], expected: str) -> Tuple[Verdict, Optional[str]]:
+    """
+    The verdict along with the answer that was found, if there was one.
+    """
+    if len(messages) > 0 and messages[-1].get("role") in ("error", "timeout", "budget-exhausted"):
+        return messages[-1]["role"], None
+    actual = final_answer(messages)
+    if actual is None:
+        return "not-found", None
+    return ("correct" if answers_match(expected, actual) else "incorrect"), actual
+
+
+def benchmark_status(v: Verdict) -> str:
+    # benchmark.py's results call a missing answer "unknown".
+    return "unknown" if v == "not-found" else v
+
+
+def result_for(expected: str, actual: Optional[str], conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> TaskResult:
+    if actual is None:
+        return TR.not_found(conversation, metrics)
+    if answers_match(expected, actual):
+        return TR.correct(expected, conversation, metrics)
+    return TR.incorrect(expected, actual, conversation, metrics)
+
+
+def score(expected: str, conversation: List[Dict], metrics: Optional[TaskMetrics] = None) -> TaskResult:
+    # only for conversations that ran to completion -- errors, timeouts and exhausted budgets carry more
+    # than a verdict.
+    return result_for(expected, final_answer(conversation), conversation, metrics)
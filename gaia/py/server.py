@@ -6,6 +6,8 @@ import ds
 
 app = Flask(__name__)
 validation = ds.all_of_the_validation_tests()
+# task_id -> entry, so looking one up doesn't mean going through the whole dataset.
+validation_index = {entry["task_id"]: entry for entry in reversed(list(validation))}
 
 @app.get("/gaia")
 @cross_origin()
@@ -17,10 +19,7 @@ def fetch_all():
 @app.get("/gaia/<string:task_id>")
 @cross_origin()
 def fetch_single(task_id):
-    for entry in validation:
-        if entry["task_id"] == task_id:
-            return jsonify(entry)
-    return jsonify(None)
+    return jsonify(validation_index.get(task_id))
 
 
 @app.post("/gaia/run")
@@ -28,15 +27,15 @@ def fetch_single(task_id):
 def run_single():
     task_id = request.json["task_id"]
     entry_command = request.json["command"]
-    for entry in validation:
-        if entry["task_id"] == task_id:
-            final_answer = ds.run_gaia_task_from_library(entry, entry_command)
-            if final_answer is None:
-                return jsonify({ "status": "not-found" })
-            else:
-                expected = entry["Final answer"].lower()
-                if expected == final_answer:
-                    return jsonify({ "status": "correct", "actual": final_answer })
-                else:
-                    return jsonify({ "status": "incorrect", "expected": expected, "actual": final_answer })
-    return jsonify({ "status": "error" })
+    entry = validation_index.get(task_id)
+    if entry is None:
+        return jsonify({ "status": "error" })
+    final_answer = ds.run_gaia_task_from_library(entry, entry_command)
+    if final_answer is None:
+        return jsonify({ "status": "not-found" })
+    else:
+        expected = entry["Final answer"].lower()
+        if expected == final_answer:
+            return jsonify({ "status": "correct", "actual": final_answer })
+        else:
+            return jsonify({ "status": "incorrect", "expected": expected, "actual": final_answer })
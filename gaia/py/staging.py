@@ -0,0 +1,184 @@
+"""
+Gives every task its own scratch directory with its attachment linked in, so concurrent tasks never
+read or write each other's files and nothing depends on the process's working directory.  The agent's
+code runs from that directory too.
+
+Attachments are never copied per task.  Instead files/ is mirrored once into a read-only cache next to
+it (catalog.py's snapshot builds it, and anything missing or out of date is cached on first use), and
+each scratch directory gets a reflink (copy-on-write) of the cached file where the filesystem supports
+it, or a hardlink, or a symlink when the scratch directory is on another filesystem.  Either way the
+original in files/ is never touched.  A missing attachment isn't staged at all.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+
+FILES_DIR = "files"
+# next to files/ rather than in /tmp, which is often a different filesystem (where hardlinks can't go).
+STAGING_DIR = ".staging"
+CACHE_DIR = ".files-cache"
+# from linux/fs.h
+FICLONE = 0x40049409
+
+
+def attachment_prompt(prompt: str, path: Optional[str]) -> str:
+    return prompt if path is None else f"file_path: {path}\n{prompt}"
+
+
+def reflink(source: str, destination: str):
+    import fcntl
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+
+
+def cached(file_name: str, files_dir: str = FILES_DIR) -> str:
+    """
+    The absolute path of the read-only copy of files_dir/file_name in the cache, made first if it's
+    missing or no longer matches the original.
+    """
+    files_dir = os.path.abspath(files_dir)
+    source = os.path.join(files_dir, file_name)
+    path = os.path.join(os.path.dirname(files_dir), CACHE_DIR, file_name)
+    original = os.stat(source)
+    try:
+        # a copy that was written to through one of its links (root ignores the read-only bit) won't
+        # match any more either, so it gets replaced rather than handed to the next task.
+        copy = os.stat(path)
+        if copy.st_size == original.st_size and copy.st_mtime_ns == original.st_mtime_ns:
+            return path
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # copied next to where it goes and renamed into place, so no task ever links a half-written file.
+    fd, temporary = tempfile.mkstemp(prefix=".caching-", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        try:
+            reflink(source, temporary)
+        except (OSError, ImportError):
+            shutil.copyfile(source, temporary)
+        os.chmod(temporary, 0o444)
+        os.utime(temporary, ns=(original.st_atime_ns, original.st_mtime_ns))
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return path
+
+
+def cache_files(files_dir: str = FILES_DIR) -> int:
+    """
+    Brings the cache up to date with everything in files_dir ahead of time, and says how many files
+    are in it.
+    """
+    count = 0
+    for directory, _, file_names in os.walk(files_dir):
+        for file_name in file_names:
+            cached(os.path.relpath(os.path.join(directory, file_name), files_dir), files_dir)
+            count += 1
+    return count
+
+
+def link(source: str, destination: str) -> str:
+    """
+    Links source to destination and says how.
+    """
+    try:
+        reflink(source, destination)
+        return "reflink"
+    except (OSError, ImportError):
+        pass
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError:
+        os.symlink(os.path.abspath(source), destination)
+        return "symlink"
+
+
+@contextmanager
+def scratch(files_dir: str = FILES_DIR, root: Optional[str] = None) -> Iterator[str]:
+    """
+    A fresh, empty directory for one task, removed afterwards.
+    """
+    root = root if root is not None else os.path.join(os.path.dirname(os.path.abspath(files_dir)), STAGING_DIR)
+    os.makedirs(root, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix="task-", dir=root)
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def stage(file_name: str, directory: str, files_dir: str = FILES_DIR) -> str:
+    """
+    Links the attachment into directory and returns its absolute path there.  If the attachment doesn't
+    exist, its plain path in files_dir instead.
+    """
+    source = os.path.join(os.path.abspath(files_dir), file_name)
+    if not os.path.exists(source):
+        return source
+    path = os.path.join(directory, file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    link(cached(file_name, files_dir), path)
+    return path
+
+
+@contextmanager
+def staged(file_name: str, files_dir: str = FILES_DIR, root: Optional[str] = None) -> Iterator[str]:
+    """
+    The absolute path of the attachment, alone in a fresh directory that's removed afterwards.  If the
+    attachment doesn't exist, its plain path in files_dir instead.
+    """
+    if not os.path.exists(os.path.join(files_dir, file_name)):
+        yield os.path.join(os.path.abspath(files_dir), file_name)
+        return
+    with scratch(files_dir, root) as directory:
+        yield stage(file_name, directory, files_dir)
+
+
+def scratch_languages(directory: str, languages: List[type]) -> List[type]:
+    """
+    The terminal's languages, changed to start in directory rather than the process's working directory
+    (which every task shares).  Ones that don't run a process of their own (html, react) are left alone.
+    """
+    # imported here so catalog.py can build the cache without loading the interpreter.
+    from interpreter.core.computer.terminal.languages.jupyter_language import JupyterLanguage
+    from interpreter.core.computer.terminal.languages.subprocess_language import SubprocessLanguage
+
+    def in_kernel(language: type) -> type:
+        class InDirectory(language):
+            def __init__(self, computer):
+                super().__init__(computer)
+                for _ in self.run(f"import os\nos.chdir({directory!r})"):
+                    pass
+        return InDirectory
+
+    def in_subprocess(language: type) -> type:
+        class InDirectory(language):
+            def __init__(self):
+                super().__init__()
+                # java builds its own command for every block.
+                if isinstance(self.start_cmd, list) and len(self.start_cmd) > 0:
+                    self.start_cmd = ["sh", "-c", 'cd "$0" && exec "$@"', directory, *self.start_cmd]
+        return InDirectory
+
+    # on windows there's no sh to do the cd.
+    if os.name == "nt":
+        return languages
+    return [
+        in_kernel(language) if issubclass(language, JupyterLanguage)
+        else in_subprocess(language) if issubclass(language, SubprocessLanguage)
+        else language
+        for language in languages
+    ]
@@ -1,10 +1,89 @@
 from abc import ABC, abstractmethod
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+import argparse
+import base64
+import os
 import shelve
-import uuid
-import ds
-from typing import Any, Dict, List, Optional, TypedDict, cast
-from models import AnnotatorMetadata, CommandConfiguration, FullTask, TaskPreview, TaskResult, TaskRun, TaskRunPreview
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime
+from pydantic import TypeAdapter
+from blobs import BlobStore, compact_command, compact_result, expand_run
+from catalog import validation_catalog
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypedDict, TypeVar, cast
+from models import CommandConfiguration, FullTask, RunFilter, TaskPreview, TaskResult, TaskRun, TaskRunPreview
+
+
+T = TypeVar("T")
+# a page of a listing, and the cursor for the next one if there's more.
+Page = Tuple[List[T], Optional[str]]
+
+
+def encode_cursor(*parts: str) -> str:
+    # opaque to clients, who should only ever hand back what they were given.
+    return base64.urlsafe_b64encode("\n".join(parts).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, n_parts: int) -> List[str]:
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("\n")
+    except (ValueError, UnicodeError):
+        raise ValueError(f"bad cursor {cursor!r}")
+    if len(parts) != n_parts:
+        raise ValueError(f"bad cursor {cursor!r}")
+    return parts
+
+
+# run listings are in (started, id) order, and a run's cursor is just where it is in that order.
+def run_cursor(preview: TaskRunPreview) -> str:
+    return encode_cursor(preview.started.isoformat(), preview.id)
+
+
+def decode_run_cursor(cursor: str) -> Tuple[datetime, str]:
+    started, id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(started), id
+    except ValueError:
+        raise ValueError(f"bad cursor {cursor!r}")
+
+
+# task listings are in the store's own order, and a task's cursor is its position in it.
+def task_cursor(position: int) -> str:
+    return encode_cursor(str(position))
+
+
+def decode_task_cursor(cursor: Optional[str]) -> int:
+    if cursor is None:
+        return 0
+    position, = decode_cursor(cursor, 1)
+    if not position.isdigit():
+        raise ValueError(f"bad cursor {cursor!r}")
+    return int(position)
+
+
+def take_page(items: Iterable[T], limit: Optional[int], cursor_after: Callable[[T], str]) -> Page[T]:
+    # only pulls one more item than it needs, to find out whether there's another page.
+    page = []
+    for item in items:
+        if limit is not None and len(page) == limit:
+            return page, cursor_after(page[-1])
+        page.append(item)
+    return page, None
+
+
+def page_previews(previews: Iterable[TaskRunPreview], filter: RunFilter, cursor: Optional[str], limit: Optional[int]) -> Page[TaskRunPreview]:
+    after = decode_run_cursor(cursor) if cursor is not None else None
+    matching = sorted(
+        (
+            p for p in previews
+            if filter.matches(p.task, p.started, p.result, p.model) and (after is None or (p.started, p.id) > after)
+        ),
+        key=lambda p: (p.started, p.id)
+    )
+    return take_page(matching, limit, run_cursor)
 
 
 class TaskStore(ABC):
@@ -16,27 +95,47 @@ class TaskStore(ABC):
     def get_single(self, task_id: str) -> Optional[FullTask]:
         ...
 
+    def get_many(self, task_ids: List[str]) -> List[Optional[FullTask]]:
+        # in the same order, with None for the ones that don't exist.
+        return [self.get_single(task_id) for task_id in task_ids]
+
+    def get_page(self, level: Optional[int] = None, cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskPreview]:
+        # stores that can skip ahead and filter on their own should.
+        start = decode_task_cursor(cursor)
+        matching = ((i, t) for i, t in enumerate(self.get_all()) if i >= start and (level is None or t.level == level))
+        page, next_cursor = take_page(matching, limit, lambda item: task_cursor(item[0] + 1))
+        return [t for _, t in page], next_cursor
+
 
 class MemoryTaskStore(TaskStore):
     def __init__(self, tasks: List[FullTask]):
         self.tasks = tasks
+        # reversed, so the first of any duplicates wins.
+        self.index: Dict[str, FullTask] = {t.task_id: t for t in reversed(tasks)}
     
     def get_all(self) -> List[TaskPreview]:
         return [t.to_preview() for t in self.tasks]
     
     def get_single(self, task_id: str) -> Optional[FullTask]:
-        for t in self.tasks:
-            if t.task_id == task_id:
-                return t
-        return None
+        return self.index.get(task_id)
+
+    def get_many(self, task_ids: List[str]) -> List[Optional[FullTask]]:
+        return [self.index.get(task_id) for task_id in task_ids]
+
+    def get_page(self, level: Optional[int] = None, cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskPreview]:
+        start = decode_task_cursor(cursor)
+        # only the tasks on the page get turned into previews.
+        matching = ((i, self.tasks[i]) for i in range(start, len(self.tasks)) if level is None or self.tasks[i].level == level)
+        page, next_cursor = take_page(matching, limit, lambda item: task_cursor(item[0] + 1))
+        return [t.to_preview() for _, t in page], next_cursor
 
 
 class DefaultTaskStore(TaskStore):
     def __init__(self):
-        self.validation = ds.all_of_the_validation_tests()
+        self.catalog = validation_catalog()
 
     def get_all(self) -> List[TaskPreview]:
-        data = ds.pull_out(self.validation, ["task_id", "Level", "Question"])
+        data = self.catalog.columns(["task_id", "Level", "Question"])
         previews = []
         for d in data:
             p = TaskPreview(task_id=d["task_id"], level=d["Level"], question=d["Question"])
@@ -44,30 +143,26 @@ class DefaultTaskStore(TaskStore):
         return previews
 
     def get_single(self, task_id: str) -> Optional[FullTask]:
-        for entry in self.validation:
-            e: Any = entry
-            if e["task_id"] == task_id:
-                am = e["Annotator Metadata"]
-                return FullTask(
-                    task_id=e["task_id"],
-                    level=e["Level"],
-                    question=e["Question"],
-                    final_answer=e["Final answer"],
-                    file_name=e["file_name"],
-                    annotator_metadata=AnnotatorMetadata(
-                        steps=am["Steps"],
-                        number_of_steps=am["Number of steps"],
-                        length_of_time=am["How long did this take?"],
-                        tools=am["Tools"],
-                        number_of_tools=am["Number of tools"]
-                    )
-                )
-        return None
+        e = self.catalog.get(task_id)
+        if e is None:
+            return None
+        return FullTask.from_gaia_task(e)
+
+    def get_many(self, task_ids: List[str]) -> List[Optional[FullTask]]:
+        return [FullTask.from_gaia_task(e) if e is not None else None for e in self.catalog.get_many(task_ids)]
+
+    def get_page(self, level: Optional[int] = None, cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskPreview]:
+        # the catalog does the filtering on the arrow table, and only reads the rows on the page.
+        rows = self.catalog.find(["task_id", "Level", "Question"], decode_task_cursor(cursor), level, limit + 1 if limit is not None else None)
+        page, next_cursor = take_page(rows, limit, lambda item: task_cursor(item[0] + 1))
+        return [TaskPreview(task_id=d["task_id"], level=d["Level"], question=d["Question"]) for _, d in page], next_cursor
 
 
 class TaskRunStoreShelfSchema(TypedDict):
     # The keys should be string versions of UUIDs.
     runs: Dict[str, TaskRun]
+    # the same keys, kept up to date alongside runs so listings never unpickle a conversation.
+    previews: Dict[str, TaskRunPreview]
 
 
 @contextmanager
@@ -82,13 +177,34 @@ class TaskRunStore(ABC):
     def start(self, task: FullTask, command: CommandConfiguration) -> TaskRun:
         ...
 
+    def start_many(self, requests: List[Tuple[FullTask, CommandConfiguration]]) -> List[TaskRun]:
+        # like finish_many: stores that can start several runs at once should.
+        return [self.start(task, command) for task, command in requests]
+
     @abstractmethod
     def finish(self, run: TaskRun, result: TaskResult):
         ...
     
+    def finish_many(self, results: List[Tuple[TaskRun, TaskResult]]):
+        # stores that can write several results at once should.
+        for run, result in results:
+            self.finish(run, result)
+
     @abstractmethod
     def get(self, id: str) -> TaskRun:
         ...
+
+    def get_many(self, ids: List[str]) -> List[Optional[TaskRun]]:
+        # in the same order, with None for the ones that don't exist.
+        return [self.get(id) for id in ids]
+
+    def get_compact(self, id: str) -> TaskRun:
+        # the run with its big payloads left as blob references, for stores that keep them that way.
+        return self.get(id)
+
+    @abstractmethod
+    def iter_runs(self) -> Iterator[TaskRun]:
+        ...
     
     @abstractmethod
     def get_previews(self) -> List[TaskRunPreview]:
@@ -98,30 +214,50 @@ class TaskRunStore(ABC):
     def get_task_runs(self, task: FullTask) -> List[TaskRunPreview]:
         ...
 
+    def get_preview_page(self, filter: RunFilter = RunFilter(), cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskRunPreview]:
+        # the previews that get through the filter, in (started, id) order.  stores that can filter
+        # and page without going through every preview should.
+        return page_previews(self.get_previews(), filter, cursor, limit)
+
+    def metrics(self) -> Dict[str, float]:
+        # counters for /gaia/store-metrics, from stores that keep any.
+        return {}
+
 
 class MemoryTaskRunStore(TaskRunStore):
     def __init__(self, runs: List[TaskRun]):
         self.runs = runs
+        self.index: Dict[str, TaskRun] = {r.id: r for r in reversed(runs)}
+        self.previews: Dict[str, TaskRunPreview] = {r.id: r.to_preview() for r in self.index.values()}
     
     def start(self, task: FullTask, command: CommandConfiguration) -> TaskRun:
         r = TaskRun(task=task, command=command, result=None)
         self.runs.append(r)
+        self.index[r.id] = r
+        self.previews[r.id] = r.to_preview()
         return r
 
     def finish(self, run: TaskRun, result: TaskResult):
-        ...
+        stored_run = self.get(run.id)
+        if stored_run is None:
+            raise RuntimeError("Not found!!")
+        stored_run.result = result
+        self.previews[run.id] = stored_run.to_preview()
     
     def get(self, id: str) -> Optional[TaskRun]:
-        for tr in self.runs:
-            if tr.id == id:
-                return tr
-        return None
+        return self.index.get(id)
+
+    def get_many(self, ids: List[str]) -> List[Optional[TaskRun]]:
+        return [self.index.get(id) for id in ids]
+
+    def iter_runs(self) -> Iterator[TaskRun]:
+        return iter(list(self.runs))
     
     def get_previews(self) -> List[TaskRunPreview]:
-        return [r.to_preview() for r in self.runs]
+        return list(self.previews.values())
     
     def get_task_runs(self, task: FullTask) -> List[TaskRunPreview]:
-        return [r.to_preview() for r in self.runs if r.task.task_id == task.task_id]
+        return [p for p in self.previews.values() if p.task.task_id == task.task_id]
 
 
 class DefaultTaskRunStore(TaskRunStore):
@@ -130,10 +266,14 @@ class DefaultTaskRunStore(TaskRunStore):
         self.__create_store_if_missing()
 
     def start(self, task: FullTask, command: CommandConfiguration) -> TaskRun:
+        return self.start_many([(task, command)])[0]
+
+    def start_many(self, requests: List[Tuple[FullTask, CommandConfiguration]]) -> List[TaskRun]:
         with open_shelf(self.path, "w") as store:
-            run = TaskRun(task=task, command=command, result=None)
-            store["runs"] = {**store["runs"], run.id: run}
-            return run
+            started = [TaskRun(task=task, command=command, result=None) for task, command in requests]
+            store["runs"] = {**store["runs"], **{run.id: run for run in started}}
+            store["previews"] = {**store["previews"], **{run.id: run.to_preview() for run in started}}
+            return started
     
     def finish(self, run: TaskRun, result: TaskResult):
         with open_shelf(self.path, "w") as store:
@@ -143,25 +283,555 @@ class DefaultTaskRunStore(TaskRunStore):
                 raise RuntimeError("Not found!!")
             stored_run.result = result
             store["runs"] = {**store["runs"], run.id: stored_run}
+            store["previews"] = {**store["previews"], run.id: stored_run.to_preview()}
+
+    def finish_many(self, results: List[Tuple[TaskRun, TaskResult]]):
+        # one read and one write of the shelf no matter how many results there are.
+        with open_shelf(self.path, "w") as store:
+            runs, previews = store["runs"], store["previews"]
+            for run, result in results:
+                stored_run = runs.get(run.id)
+                if stored_run is None:
+                    raise RuntimeError("Not found!!")
+                stored_run.result = result
+                previews[run.id] = stored_run.to_preview()
+            store["runs"] = runs
+            store["previews"] = previews
     
     def get(self, id: str) -> TaskRun:
         with open_shelf(self.path, "r") as store:
             return store["runs"][id]
+
+    def get_many(self, ids: List[str]) -> List[Optional[TaskRun]]:
+        # one unpickling of the runs for all of them.
+        with open_shelf(self.path, "r") as store:
+            runs = store["runs"]
+        return [runs.get(id) for id in ids]
+
+    def iter_runs(self) -> Iterator[TaskRun]:
+        with open_shelf(self.path, "r") as store:
+            runs = store["runs"]
+        yield from runs.values()
     
     def get_previews(self) -> List[TaskRunPreview]:
-        with open_shelf(self.path, "c") as store:
-            runs = store["runs"]
-            previews = [f.to_preview() for f in runs.values()]
-            return previews
+        with open_shelf(self.path, "r") as store:
+            return list(store["previews"].values())
     
     def get_task_runs(self, task: FullTask) -> List[TaskRunPreview]:
         with open_shelf(self.path, "r") as store:
-            runs = cast(Dict[uuid.UUID, TaskRun], store["runs"])
-            previews = (f.to_preview() for f in runs.values())
-            task_previews = [p for p in previews if p.task.task_id == task.task_id]
-            return task_previews
+            return [p for p in store["previews"].values() if p.task.task_id == task.task_id]
 
     def __create_store_if_missing(self):
         with open_shelf(self.path, "c") as store:
             if store.get("runs") is None:
                 store["runs"] = {}
+            if store.get("previews") is None:
+                # shelves from before there was a preview index get one built the first time they're opened.
+                store["previews"] = {id: r.to_preview() for id, r in store["runs"].items()}
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    -- level, question and model are there for the listings, which never touch the json columns.
+    level INTEGER,
+    question TEXT,
+    model TEXT,
+    started TEXT NOT NULL,
+    -- both NULL while the run is going.
+    status TEXT,
+    finished TEXT,
+    task TEXT NOT NULL,
+    command TEXT NOT NULL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_task_id ON runs (task_id);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model);
+"""
+
+SQLITE_PREVIEW_COLUMNS = "id, task_id, level, question, started, status, finished, model"
+# older SQLites won't bind more than 999.
+SQLITE_MAX_PARAMETERS = 900
+
+TaskResultAdapter: TypeAdapter[TaskResult] = TypeAdapter(TaskResult)
+
+
+class SqliteTaskRunStore(TaskRunStore):
+    """
+    One row per run in a SQLite database in WAL mode, so starting or finishing a run touches just that
+    row, and readers never wait on writers.  Every thread gets its own connection, and other processes
+    can open the same file.
+    """
+    def __init__(self, path: str, busy_timeout_s: float = 30.0):
+        self.path = path
+        self.busy_timeout_s = busy_timeout_s
+        self.local = threading.local()
+        with self.__connection() as db:
+            db.executescript(SQLITE_SCHEMA)
+
+    def start(self, task: FullTask, command: CommandConfiguration) -> TaskRun:
+        return self.start_many([(task, command)])[0]
+
+    def start_many(self, requests: List[Tuple[FullTask, CommandConfiguration]]) -> List[TaskRun]:
+        started = [TaskRun(task=task, command=command, result=None) for task, command in requests]
+        with self.__connection() as db:
+            db.executemany(
+                "INSERT INTO runs (id, task_id, level, question, model, started, task, command) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (run.id, run.task.task_id, run.task.level, run.task.question, run.command.model, run.started.isoformat(), run.task.model_dump_json(), run.command.model_dump_json())
+                    for run in started
+                )
+            )
+        return started
+
+    def finish(self, run: TaskRun, result: TaskResult):
+        self.finish_many([(run, result)])
+
+    def finish_many(self, results: List[Tuple[TaskRun, TaskResult]]):
+        with self.__connection() as db:
+            for run, result in results:
+                cursor = db.execute(
+                    "UPDATE runs SET status = ?, finished = ?, result = ? WHERE id = ?",
+                    (result.status, result.created.isoformat(), result.model_dump_json(), run.id)
+                )
+                if cursor.rowcount == 0:
+                    raise RuntimeError("Not found!!")
+
+    def get(self, id: str) -> Optional[TaskRun]:
+        row = self.__connection().execute("SELECT id, started, task, command, result FROM runs WHERE id = ?", (id,)).fetchone()
+        return sqlite_run(row) if row is not None else None
+
+    def get_many(self, ids: List[str]) -> List[Optional[TaskRun]]:
+        found: Dict[str, TaskRun] = {}
+        # SQLite only takes so many parameters at once.
+        for i in range(0, len(ids), SQLITE_MAX_PARAMETERS):
+            chunk = ids[i:i + SQLITE_MAX_PARAMETERS]
+            rows = self.__connection().execute(
+                f"SELECT id, started, task, command, result FROM runs WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            found.update((row[0], sqlite_run(row)) for row in rows)
+        return [found.get(id) for id in ids]
+
+    def iter_runs(self) -> Iterator[TaskRun]:
+        cursor = self.__connection().execute("SELECT id, started, task, command, result FROM runs ORDER BY started")
+        return (sqlite_run(row) for row in cursor)
+
+    def get_previews(self) -> List[TaskRunPreview]:
+        rows = self.__connection().execute(f"SELECT {SQLITE_PREVIEW_COLUMNS} FROM runs ORDER BY started")
+        return [sqlite_preview(row) for row in rows]
+
+    def get_task_runs(self, task: FullTask) -> List[TaskRunPreview]:
+        rows = self.__connection().execute(
+            f"SELECT {SQLITE_PREVIEW_COLUMNS} FROM runs WHERE task_id = ? ORDER BY started",
+            (task.task_id,)
+        )
+        return [sqlite_preview(row) for row in rows]
+
+    def get_preview_page(self, filter: RunFilter = RunFilter(), cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskRunPreview]:
+        where, parameters = sqlite_where(filter)
+        if cursor is not None:
+            started, id = decode_run_cursor(cursor)
+            where.append("(started > ? OR (started = ? AND id > ?))")
+            parameters += [started.isoformat(), started.isoformat(), id]
+        query = f"SELECT {SQLITE_PREVIEW_COLUMNS} FROM runs"
+        if len(where) > 0:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY started, id"
+        if limit is not None:
+            # one more than the page, to know if there's another.
+            query += " LIMIT ?"
+            parameters.append(limit + 1)
+        rows = self.__connection().execute(query, parameters)
+        return take_page((sqlite_preview(row) for row in rows), limit, run_cursor)
+
+    def insert_many(self, runs: Iterator[TaskRun]) -> int:
+        # for migrations: runs that are already here are left alone.
+        with self.__connection() as db:
+            cursor = db.executemany(
+                "INSERT OR IGNORE INTO runs (id, task_id, level, question, model, started, status, finished, task, command, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        run.id,
+                        run.task.task_id,
+                        run.task.level,
+                        run.task.question,
+                        run.command.model,
+                        run.started.isoformat(),
+                        run.result.status if run.result is not None else None,
+                        run.result.created.isoformat() if run.result is not None else None,
+                        run.task.model_dump_json(),
+                        run.command.model_dump_json(),
+                        run.result.model_dump_json() if run.result is not None else None,
+                    )
+                    for run in runs
+                )
+            )
+            return cursor.rowcount
+
+    def __connection(self) -> sqlite3.Connection:
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout_s)
+            db.execute("PRAGMA journal_mode=WAL")
+            # with WAL this only risks the last few commits on a power cut, never corruption.
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+
+def sqlite_run(row: Tuple[str, str, str, str, Optional[str]]) -> TaskRun:
+    id, started, task, command, result = row
+    return TaskRun(
+        id=id,
+        started=datetime.fromisoformat(started),
+        task=FullTask.model_validate_json(task),
+        command=CommandConfiguration.model_validate_json(command),
+        result=TaskResultAdapter.validate_json(result) if result is not None else None
+    )
+
+
+def sqlite_preview(row: Tuple[str, str, int, str, str, Optional[str], Optional[str], Optional[str]]) -> TaskRunPreview:
+    id, task_id, level, question, started, status, finished, model = row
+    return TaskRunPreview(
+        id=id,
+        task=TaskPreview(task_id=task_id, level=level, question=question),
+        started=datetime.fromisoformat(started),
+        result=cast(Any, status),
+        finished=datetime.fromisoformat(finished) if finished is not None else None,
+        model=model
+    )
+
+
+def sqlite_where(filter: RunFilter) -> Tuple[List[str], List[Any]]:
+    # the filter as conditions on the preview columns.
+    where: List[str] = []
+    parameters: List[Any] = []
+    for column, value in [("task_id", filter.task_id), ("level", filter.level), ("model", filter.model)]:
+        if value is not None:
+            where.append(f"{column} = ?")
+            parameters.append(value)
+    if filter.status == "running":
+        where.append("status IS NULL")
+    elif filter.status is not None:
+        where.append("status = ?")
+        parameters.append(filter.status)
+    if filter.started_after is not None:
+        where.append("started >= ?")
+        parameters.append(filter.started_after.isoformat())
+    if filter.started_before is not None:
+        where.append("started < ?")
+        parameters.append(filter.started_before.isoformat())
+    return where, parameters
+
+
+def migrate_shelf(shelf_path: str, db: SqliteTaskRunStore) -> int:
+    # copies every run in a DefaultTaskRunStore shelf into the database; safe to run more than once.
+    with open_shelf(shelf_path, "r") as store:
+        runs = store["runs"]
+    return db.insert_many(iter(runs.values()))
+
+
+def open_run_store(path: str) -> TaskRunStore:
+    # .db/.sqlite files are SqliteTaskRunStores, anything else is a shelf.
+    if os.path.splitext(path)[1] in (".db", ".sqlite", ".sqlite3"):
+        return SqliteTaskRunStore(path)
+    return DefaultTaskRunStore(path)
+
+class CompactingTaskRunStore(TaskRunStore):
+    """
+    Keeps another store's runs compact: conversation payloads and system prompts go into the blob store
+    (see blobs.py) on the way in, and come back out on the way out, so the inner store only ever
+    serializes references.
+    """
+    def __init__(self, inner: TaskRunStore, blobs: BlobStore):
+        self.inner = inner
+        self.blobs = blobs
+
+    def start(self, task: FullTask, command: CommandConfiguration) -> TaskRun:
+        return self.start_many([(task, command)])[0]
+
+    def start_many(self, requests: List[Tuple[FullTask, CommandConfiguration]]) -> List[TaskRun]:
+        started = self.inner.start_many([(task, compact_command(command, self.blobs)) for task, command in requests])
+        # whoever started the runs is going to run them, so they get the real system prompts back.
+        return [run.model_copy(update={"command": command}) for run, (_, command) in zip(started, requests)]
+
+    def finish(self, run: TaskRun, result: TaskResult):
+        self.inner.finish(run, compact_result(result, self.blobs))
+
+    def finish_many(self, results: List[Tuple[TaskRun, TaskResult]]):
+        self.inner.finish_many([(run, compact_result(result, self.blobs)) for run, result in results])
+
+    def get(self, id: str) -> TaskRun:
+        run = self.inner.get(id)
+        return expand_run(run, self.blobs) if run is not None else run
+
+    def get_many(self, ids: List[str]) -> List[Optional[TaskRun]]:
+        return [expand_run(run, self.blobs) if run is not None else None for run in self.inner.get_many(ids)]
+
+    def get_compact(self, id: str) -> TaskRun:
+        return self.inner.get(id)
+
+    def iter_runs(self) -> Iterator[TaskRun]:
+        return (expand_run(run, self.blobs) for run in self.inner.iter_runs())
+
+    def get_previews(self) -> List[TaskRunPreview]:
+        return self.inner.get_previews()
+
+    def get_preview_page(self, filter: RunFilter = RunFilter(), cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskRunPreview]:
+        return self.inner.get_preview_page(filter, cursor, limit)
+
+    def get_task_runs(self, task: FullTask) -> List[TaskRunPreview]:
+        return self.inner.get_task_runs(task)
+
+    def metrics(self) -> Dict[str, float]:
+        return self.inner.metrics()
+
+
+@dataclass
+class PendingStart:
+    task: FullTask
+    command: CommandConfiguration
+    run: Optional[TaskRun] = None
+    error: Optional[Exception] = None
+
+
+class BatchingTaskRunStore(TaskRunStore):
+    """
+    Group commit for another store.  Starts and finishes that pile up while a write is in progress are
+    handed to the inner store's start_many and finish_many together, so a sweep's worth of runs
+    finishing at once costs a few transactions (and fsyncs) instead of one each.
+
+    start waits until its run is written, since the caller needs it.  finish is write-behind: it returns
+    right away, and the result is written within about window_s, but get and the listings see it in the
+    meantime.  flush waits for everything so far to be written; close flushes and stops the writer.
+    """
+    def __init__(
+        self,
+        inner: TaskRunStore,
+        # how long a finish waits for others to share its write.  starts never wait, since someone's blocked on them.
+        window_s: float = 0.01,
+        max_batch: int = 512,
+        # only let one thread at a time into the inner store.  the shelf needs this; SQLite and the log don't.
+        exclusive: bool = True
+    ):
+        self.inner = inner
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self.inner_lock = threading.RLock() if exclusive else nullcontext()
+        self.changed = threading.Condition()
+        self.starts: List[PendingStart] = []
+        # by run id: the finishes nobody has written yet, and the ones being written right now.
+        self.finishes: Dict[str, Tuple[TaskRun, TaskResult]] = {}
+        self.writing: Dict[str, Tuple[TaskRun, TaskResult]] = {}
+        # every call that queues something gets the next sequence number; written is the last one that's done.
+        self.queued = 0
+        self.written = 0
+        self.flushing = 0
+        self.stopped = False
+        self.counts = {"starts": 0, "finishes": 0, "commits": 0, "failed": 0}
+        self.write_s = 0.0
+        self.writer = threading.Thread(target=self.__write_batches, daemon=True)
+        self.writer.start()
+
+    def start(self, task: FullTask, command: CommandConfiguration) -> TaskRun:
+        return self.start_many([(task, command)])[0]
+
+    def start_many(self, requests: List[Tuple[FullTask, CommandConfiguration]]) -> List[TaskRun]:
+        pending = [PendingStart(task, command) for task, command in requests]
+        with self.changed:
+            if self.stopped:
+                with self.inner_lock:
+                    return self.inner.start_many(requests)
+            self.starts.extend(pending)
+            sequence = self.__queued()
+            while self.written < sequence:
+                self.changed.wait()
+        for p in pending:
+            if p.error is not None:
+                raise p.error
+        return [cast(TaskRun, p.run) for p in pending]
+
+    def finish(self, run: TaskRun, result: TaskResult):
+        self.finish_many([(run, result)])
+
+    def finish_many(self, results: List[Tuple[TaskRun, TaskResult]]):
+        with self.changed:
+            if self.stopped:
+                with self.inner_lock:
+                    return self.inner.finish_many(results)
+            for run, result in results:
+                # a run finished twice before the first was written only needs the second written.
+                self.finishes[run.id] = (run, result)
+            self.__queued()
+
+    def flush(self):
+        with self.changed:
+            sequence = self.queued
+            self.flushing += 1
+            self.changed.notify_all()
+            while self.written < sequence:
+                self.changed.wait()
+            self.flushing -= 1
+
+    def close(self):
+        self.flush()
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+        self.writer.join()
+
+    def get(self, id: str) -> TaskRun:
+        # the pending results are looked up first: anything that's not pending by then has been written.
+        pending = self.__pending_results()
+        with self.inner_lock:
+            run = self.inner.get(id)
+        return self.__with_pending(run, pending)
+
+    def get_many(self, ids: List[str]) -> List[Optional[TaskRun]]:
+        pending = self.__pending_results()
+        with self.inner_lock:
+            runs = self.inner.get_many(ids)
+        return [self.__with_pending(run, pending) for run in runs]
+
+    def get_compact(self, id: str) -> TaskRun:
+        pending = self.__pending_results()
+        with self.inner_lock:
+            run = self.inner.get_compact(id)
+        return self.__with_pending(run, pending)
+
+    def iter_runs(self) -> Iterator[TaskRun]:
+        pending = self.__pending_results()
+        with self.inner_lock:
+            runs = list(self.inner.iter_runs())
+        return (self.__with_pending(run, pending) for run in runs)
+
+    def get_previews(self) -> List[TaskRunPreview]:
+        pending = self.__pending_results()
+        with self.inner_lock:
+            previews = self.inner.get_previews()
+        return [self.__preview_with_pending(p, pending) for p in previews]
+
+    def get_task_runs(self, task: FullTask) -> List[TaskRunPreview]:
+        pending = self.__pending_results()
+        with self.inner_lock:
+            previews = self.inner.get_task_runs(task)
+        return [self.__preview_with_pending(p, pending) for p in previews]
+
+    def get_preview_page(self, filter: RunFilter = RunFilter(), cursor: Optional[str] = None, limit: Optional[int] = None) -> Page[TaskRunPreview]:
+        if filter.status is not None:
+            # the inner store would filter on the statuses from before the pending results.
+            self.flush()
+        pending = self.__pending_results()
+        with self.inner_lock:
+            previews, next_cursor = self.inner.get_preview_page(filter, cursor, limit)
+        return [self.__preview_with_pending(p, pending) for p in previews], next_cursor
+
+    def metrics(self) -> Dict[str, float]:
+        with self.inner_lock:
+            inner = self.inner.metrics()
+        with self.changed:
+            writes = self.counts["starts"] + self.counts["finishes"]
+            return {
+                **inner,
+                **self.counts,
+                # each commit is one start_many or finish_many, so at most one fsync (the log store counts its real ones).
+                "writes_per_commit": writes / self.counts["commits"] if self.counts["commits"] > 0 else 0.0,
+                # while writing, that is; idle time doesn't count.
+                "writes_per_s": writes / self.write_s if self.write_s > 0 else 0.0,
+                "pending": len(self.starts) + len(self.finishes) + len(self.writing),
+            }
+
+    def __queued(self) -> int:
+        # call with self.changed held.
+        self.queued += 1
+        self.changed.notify_all()
+        return self.queued
+
+    def __write_batches(self):
+        while True:
+            with self.changed:
+                while not self.stopped and len(self.starts) == 0 and len(self.finishes) == 0:
+                    self.changed.wait()
+                if self.stopped:
+                    return
+                # finishes have nobody waiting on them, so they can give others a moment to join in.
+                deadline = time.monotonic() + self.window_s
+                while len(self.starts) == 0 and self.flushing == 0 and len(self.finishes) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.changed.wait(remaining)
+                starts, self.starts = self.starts, []
+                self.writing, self.finishes = self.finishes, {}
+                finishes = list(self.writing.values())
+                sequence = self.queued
+            self.__write(starts, finishes)
+            with self.changed:
+                self.writing = {}
+                self.written = sequence
+                self.changed.notify_all()
+
+    def __write(self, starts: List[PendingStart], finishes: List[Tuple[TaskRun, TaskResult]]):
+        began = time.perf_counter()
+        commits, failed = 0, 0
+        with self.inner_lock:
+            if len(starts) > 0:
+                try:
+                    for p, run in zip(starts, self.inner.start_many([(p.task, p.command) for p in starts])):
+                        p.run = run
+                    commits += 1
+                except Exception as e:
+                    for p in starts:
+                        p.error = e
+            if len(finishes) > 0:
+                try:
+                    self.inner.finish_many(finishes)
+                    commits += 1
+                except Exception:
+                    # one bad result (a run the store's never heard of, say) mustn't take the rest down
+                    # with it, and nobody's waiting to hear about it.  writing a result twice is harmless.
+                    for run, result in finishes:
+                        try:
+                            self.inner.finish(run, result)
+                            commits += 1
+                        except Exception:
+                            print(f"couldn't write the result of run {run.id}:")
+                            traceback.print_exc()
+                            failed += 1
+        with self.changed:
+            self.counts["starts"] += len([p for p in starts if p.run is not None])
+            self.counts["finishes"] += len(finishes) - failed
+            self.counts["commits"] += commits
+            self.counts["failed"] += failed
+            self.write_s += time.perf_counter() - began
+
+    def __pending_results(self) -> Dict[str, TaskResult]:
+        with self.changed:
+            return {id: result for id, (_, result) in {**self.writing, **self.finishes}.items()}
+
+    def __with_pending(self, run: Optional[TaskRun], pending: Dict[str, TaskResult]) -> Any:
+        if run is None or run.id not in pending:
+            return run
+        return run.model_copy(update={"result": pending[run.id]})
+
+    def __preview_with_pending(self, preview: TaskRunPreview, pending: Dict[str, TaskResult]) -> TaskRunPreview:
+        if preview.id not in pending:
+            return preview
+        result = pending[preview.id]
+        return preview.model_copy(update={"result": result.status, "finished": result.created})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="copy the runs in a shelf into a SQLite store")
+    migrate_parser.add_argument("shelf", type=str)
+    migrate_parser.add_argument("db", type=str)
+    args = parser.parse_args()
+
+    n = migrate_shelf(args.shelf, SqliteTaskRunStore(args.db))
+    print(f"migrated {n} run(s) from {args.shelf} into {args.db}.")
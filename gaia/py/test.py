@@ -1,12 +1,46 @@
-from typing import cast
+import csv
+import io
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, cast
 import unittest
-from unittest.mock import Mock
+import zipfile
+from unittest.mock import Mock, patch
 from fastapi.testclient import TestClient
+from interpreter.core.computer.terminal.languages.shell import Shell
 
+import api
+from attachments import AttachmentCache
+from blobs import BlobStore, compact_messages, expand_messages, is_ref
+from bench_harness import ENGINES, measure, regressions
+from bench_stores import cases, synthetic_catalog, synthetic_tasks
+from benchmark import LMC, Benchmark, BenchmarkRunner, OpenInterpreterCommand, RunOutput, WorkerStats, budget_message, run_benchmark, run_single_task, run_benchmark_sweep, run_benchmark_threaded, schedule_tasks, summarize_sweep, timeout_message
+from budget import Budget, BudgetWatcher
+from chat import FinalAnswerWatcher, chat
+from replay import ReplayBenchmarkRunner, ReplayTaskRunner
+from rescore import rescore, rescore_store
+from run_benchmarks import consume_results
+from scoring import verdict
+from staging import CACHE_DIR, STAGING_DIR, cached, scratch, scratch_languages, staged
+from cost_model import CostModel, append_history, parse_minutes
+import profiling
+from progress import SweepProgress, status_line
+from trials import StoppingRule, pass_at_k, run_benchmark_trials
+from worker import work
 from fastapi_server import Server
-from runner import TaskRunner
-from models import AnnotatorMetadata, FullTask, TaskPreview
-from store import TaskRunStore, TaskStore
+from leases import LeaseQueue
+from logstore import LogTaskRunStore, Retention
+from runner import DefaultTaskRunner, FakeTaskRunner, TaskRunner
+from sandbox import ContainerPool, SandboxUnavailable, sandboxed_languages
+from models import TR, AnnotatorMetadata, CommandConfiguration, FullTask, RunFilter, TaskMetrics, TaskPreview, TaskRun
+from store import BatchingTaskRunStore, CompactingTaskRunStore, DefaultTaskRunStore, MemoryTaskRunStore, MemoryTaskStore, SqliteTaskRunStore, TaskRunStore, TaskStore, migrate_shelf, open_shelf
 
 
 class TestServerOnly(unittest.TestCase):
@@ -74,6 +108,1349 @@ class TestServerOnly(unittest.TestCase):
         args, = self.tasks.get_single.call_args[0]
         self.assertEqual(task_id, args)
     
-    
+
+
+def full_task(task_id: str) -> FullTask:
+    return FullTask(task_id=task_id, level=1, question="Why?", final_answer="because", file_name="", annotator_metadata=None)
+
+
+def command() -> CommandConfiguration:
+    return CommandConfiguration(auto_run=True, os_mode=False, model="", api_base="", api_key="", system_prompt="")
+
+
+class TestLeases(unittest.TestCase):
+    def test_expired_lease_is_requeued(self):
+        now = datetime(2024, 5, 1)
+        queue = LeaseQueue(lambda: now)
+        queue.enqueue(TaskRun(task=full_task("a"), command=command(), result=None))
+
+        first = queue.claim("worker-1", 60)
+        assert first is not None
+        self.assertIsNone(queue.claim("worker-2", 60))
+
+        now += timedelta(seconds=45)
+        self.assertIsNone(queue.heartbeat(first.id, "worker-2", 60))
+        self.assertIsNotNone(queue.heartbeat(first.id, "worker-1", 60))
+        now += timedelta(seconds=45)
+        self.assertIsNone(queue.claim("worker-2", 60))
+
+        now += timedelta(seconds=61)
+        self.assertIsNone(queue.heartbeat(first.id, "worker-1", 60))
+        second = queue.claim("worker-2", 60)
+        assert second is not None
+        self.assertEqual(first.run_id, second.run_id)
+        self.assertIsNone(queue.complete(first.id, "worker-1"))
+        self.assertIsNone(queue.complete(second.id, "worker-1"))
+        self.assertIsNotNone(queue.complete(second.id, "worker-2"))
+        self.assertDictEqual({"queued": 0, "leased": 0}, queue.counts())
+
+    def test_sweep_through_leases(self):
+        runs = MemoryTaskRunStore([])
+        server = Server(MemoryTaskStore([full_task("a"), full_task("b")]), cast(TaskRunner, Mock(spec=TaskRunner)), runs)
+        client = TestClient(server.make_app())
+
+        run_ids = client.post("/gaia/sweeps", json={"command": command().model_dump()}).json()
+        self.assertEqual(2, len(run_ids))
+
+        for _ in run_ids:
+            lease = client.post("/gaia/leases", json={"worker_id": "w", "lease_s": 60}).json()
+            self.assertEqual(404, client.post(f"/gaia/leases/{lease['id']}/heartbeat", json={"worker_id": "other", "lease_s": 60}).status_code)
+            self.assertEqual(200, client.post(f"/gaia/leases/{lease['id']}/heartbeat", json={"worker_id": "w", "lease_s": 60}).status_code)
+            result = TR.correct("because", []).model_dump(mode="json")
+            self.assertEqual(404, client.post(f"/gaia/leases/{lease['id']}/result", params={"worker_id": "other"}, json=result).status_code)
+            self.assertEqual(200, client.post(f"/gaia/leases/{lease['id']}/result", params={"worker_id": "w"}, json=result).status_code)
+
+        self.assertIsNone(client.post("/gaia/leases", json={"worker_id": "w", "lease_s": 60}).json())
+        self.assertListEqual(["correct", "correct"], [r.result for r in runs.get_previews()])
+        self.assertEqual(404, client.post("/gaia/sweeps", json={"command": command().model_dump(), "task_ids": ["nope"]}).status_code)
+
+    def test_restart_requeues_unfinished_runs(self):
+        tasks = MemoryTaskStore([full_task("a"), full_task("b"), full_task("c")])
+        runs = MemoryTaskRunStore([])
+        with tempfile.TemporaryDirectory() as directory:
+            journal = os.path.join(directory, "leases.log")
+            client = TestClient(Server(tasks, cast(TaskRunner, Mock(spec=TaskRunner)), runs, lease_journal=journal).make_app())
+            run_ids = client.post("/gaia/sweeps", json={"command": command().model_dump()}).json()
+            stale = client.post("/gaia/leases", json={"worker_id": "w", "lease_s": 60}).json()
+            finished = client.post("/gaia/leases", json={"worker_id": "w", "lease_s": 60}).json()
+            client.post(f"/gaia/leases/{finished['id']}/result", params={"worker_id": "w"}, json=TR.correct("because", []).model_dump(mode="json"))
+            # what /gaia/invoke does: it runs on the server, and mustn't end up with the workers.
+            runs.start(full_task("a"), command())
+
+            restarted = Server(tasks, cast(TaskRunner, Mock(spec=TaskRunner)), runs, lease_journal=journal)
+            self.assertEqual(2, restarted.requeue_unfinished())
+            client = TestClient(restarted.make_app())
+            self.assertEqual(404, client.post(f"/gaia/leases/{stale['id']}/result", params={"worker_id": "w"}, json=TR.correct("because", []).model_dump(mode="json")).status_code)
+            leased = [client.post("/gaia/leases", json={"worker_id": "w", "lease_s": 60}).json()["run_id"] for _ in range(2)]
+            self.assertEqual(sorted(set(run_ids) - {finished["run_id"]}), sorted(leased))
+            self.assertIsNone(client.post("/gaia/leases", json={"worker_id": "w", "lease_s": 60}).json())
+            self.assertEqual(sorted(leased), sorted(restarted.leases.journaled()))
+
+    def test_worker_runs_what_is_queued(self):
+        runs = MemoryTaskRunStore([])
+        server = Server(MemoryTaskStore([full_task("a"), full_task("b"), full_task("c")]), cast(TaskRunner, Mock(spec=TaskRunner)), runs)
+        client = TestClient(server.make_app())
+        client.post("/gaia/sweeps", json={"command": command().model_dump()})
+        runner = FakeTaskRunner([TR.correct("because", []), TR.not_found([]), TR.correct("because", [])])
+
+        base = "http://testserver"
+        with patch("api.requests.post", lambda url, json, params=None: client.post(url.removeprefix(base), params=params, json=json)), redirect_stdout(io.StringIO()):
+            self.assertEqual(2, work(base, runner, "w", max_tasks=2))
+            self.assertEqual(1, work(base, runner, "w", exit_when_idle=True))
+            self.assertEqual(0, work(base, runner, "w", exit_when_idle=True))
+
+        self.assertListEqual(["correct", "correct", "not-found"], sorted(cast(str, p.result) for p in runs.get_previews()))
+        self.assertDictEqual({"queued": 0, "leased": 0}, server.leases.counts())
+
+
+class SleepyBenchmarkRunner(BenchmarkRunner):
+    """
+    Pretends to be an agent by sleeping for however many seconds the prompt says.
+    """
+    def run(self, command: OpenInterpreterCommand, prompt: str, timeout_s: Optional[float] = None) -> Tuple[datetime, List[LMC], datetime]:
+        start = datetime.now()
+        duration = float(prompt)
+        if timeout_s is not None and duration > timeout_s:
+            time.sleep(timeout_s)
+            return start, [timeout_message(timeout_s)], datetime.now()
+        time.sleep(duration)
+        return start, [{"role": "assistant", "content": "FINAL ANSWER: done"}], datetime.now()
+
+
+def sleepy_benchmark(durations: List[float]) -> Benchmark[Dict]:
+    return Benchmark(
+        lambda: [{"id": str(i), "duration": d} for i, d in enumerate(durations)],
+        lambda t: {"id": t["id"], "prompt": str(t["duration"])},
+        lambda t, messages: "correct"
+    )
+
+
+class TestBenchmarkEngines(unittest.TestCase):
+    def test_threaded_skewed_durations(self):
+        # dealing these round-robin onto 2 threads would put every long task on the same thread.
+        durations = [0.4, 0.01] * 4
+        n_threads = 2
+        round_robin_makespan = max(sum(durations[i::n_threads]) for i in range(n_threads))
+
+        stats: List[WorkerStats] = []
+        started = time.perf_counter()
+        results = run_benchmark_threaded(sleepy_benchmark(durations), {}, n_threads, SleepyBenchmarkRunner(), stats)
+        makespan = time.perf_counter() - started
+
+        self.assertEqual(len(durations), len(results))
+        self.assertEqual(len(durations), sum(s.tasks_run for s in stats))
+        self.assertLess(makespan, 0.75 * round_robin_makespan)
+        for s in stats:
+            self.assertAlmostEqual(makespan, s.busy + s.idle, delta=0.05)
+
+    def test_task_timeout(self):
+        results = run_benchmark(sleepy_benchmark([0.01, 5.0]), {}, SleepyBenchmarkRunner(), task_timeout_s=0.1)
+        self.assertListEqual(["correct", "timeout"], [r["status"] for r in results])
+
+    def test_threaded_keeps_going_when_a_task_raises(self):
+        class FlakyRunner(SleepyBenchmarkRunner):
+            def run(self, command, prompt, timeout_s=None):
+                if prompt == "0.02":
+                    raise RuntimeError("backend went away")
+                return super().run(command, prompt, timeout_s)
+
+        results = run_benchmark_threaded(sleepy_benchmark([0.01, 0.02, 0.03, 0.01]), {}, n_threads=1, runner=FlakyRunner())
+        self.assertListEqual(["0", "1", "2", "3"], sorted(r["task_id"] for r in results))
+        [error] = [r for r in results if r["status"] == "error"]
+        self.assertEqual("1", error["task_id"])
+        self.assertIn("RuntimeError: backend went away", error["messages"][0]["content"])
+
+    def test_sweep_timeout(self):
+        started = time.perf_counter()
+        results = run_benchmark(sleepy_benchmark([0.2, 0.2, 0.2, 0.2]), {}, SleepyBenchmarkRunner(), sweep_timeout_s=0.3)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertListEqual(["correct", "timeout", "timeout", "timeout"], [r["status"] for r in results])
+
+    def test_sweep_backend_limits(self):
+        in_flight: Dict[str, int] = {}
+        most_in_flight: Dict[str, int] = {}
+        lock = threading.Lock()
+
+        class CountingRunner(SleepyBenchmarkRunner):
+            def run(self, command, prompt, timeout_s=None):
+                model = command["model"]
+                with lock:
+                    in_flight[model] = in_flight.get(model, 0) + 1
+                    most_in_flight[model] = max(most_in_flight.get(model, 0), in_flight[model])
+                try:
+                    return super().run(command, prompt, timeout_s)
+                finally:
+                    with lock:
+                        in_flight[model] -= 1
+
+        commands: Dict[str, OpenInterpreterCommand] = {
+            "local": {"model": "ollama/llama3"},
+            "big": {"model": "openai/gpt-4o"},
+            "small": {"model": "openai/gpt-3.5-turbo-0125"},
+        }
+        results = run_benchmark_sweep(sleepy_benchmark([0.05] * 8), commands, {"ollama": 1, "openai": 4}, runner=CountingRunner())
+
+        self.assertSetEqual(set(commands.keys()), set(results.keys()))
+        self.assertTrue(all(len(rs) == 8 for rs in results.values()))
+        self.assertEqual(1, most_in_flight["ollama/llama3"])
+        self.assertLessEqual(most_in_flight["openai/gpt-4o"], 4)
+        self.assertGreater(most_in_flight["openai/gpt-4o"], 1)
+
+    def test_sweep_keeps_results_when_a_task_raises(self):
+        class FlakyRunner(SleepyBenchmarkRunner):
+            def run(self, command, prompt, timeout_s=None):
+                if command["model"] == "broken" and prompt == "0.02":
+                    raise RuntimeError("backend went away")
+                return super().run(command, prompt, timeout_s)
+
+        commands: Dict[str, OpenInterpreterCommand] = {"ok": {"model": "ok"}, "broken": {"model": "broken"}}
+        results = run_benchmark_sweep(sleepy_benchmark([0.01, 0.02, 0.03]), commands, {}, runner=FlakyRunner())
+
+        self.assertListEqual(["correct", "correct", "correct"], [r["status"] for r in results["ok"]])
+        self.assertListEqual(["correct", "error", "correct"], [r["status"] for r in results["broken"]])
+        [message] = results["broken"][1]["messages"]
+        self.assertIn("RuntimeError: backend went away", message["content"])
+        self.assertIn("Traceback", message["content"])
+
+        # an error first mustn't narrow down the csv's columns.
+        rows = [results["broken"][1], *results["ok"]]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "output.csv")
+            consume_results(rows, path)
+            with open(path) as file:
+                self.assertEqual(list(rows[1].keys()), next(csv.reader(file)))
+
+
+class TestProfiling(unittest.TestCase):
+    def test_samples_are_tagged_by_task(self):
+        profiler = profiling.SweepProfiler(0.005).start()
+        profiling.enable(profiler)
+        try:
+            run_benchmark_threaded(sleepy_benchmark([0.2, 0.2]), {}, n_threads=2, runner=SleepyBenchmarkRunner())
+        finally:
+            profiling.enable(None)
+            profiler.stop()
+
+        self.assertSetEqual({"0", "1"}, set(profiler.samples.keys()))
+        # the runner's sleep is in C, so the sampled leaf is the runner's run method.
+        self.assertRegex(profiler.hotspots("0", 1)[0][0], r"^run \((.*/)?test\.py:\d+\)$")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.collapsed")
+            profiler.write_collapsed(path)
+            with open(path) as file:
+                lines = file.read().splitlines()
+        self.assertTrue(len(lines) > 0)
+        self.assertTrue(all(line.startswith("task 0;") or line.startswith("task 1;") for line in lines))
+
+
+class TestProgress(unittest.TestCase):
+    def test_snapshot(self):
+        now = 0.0
+        progress = SweepProgress(window_s=60, clock=lambda: now)
+        progress.add(10)
+        for status in ["correct", "incorrect", "correct", "error"]:
+            progress.started()
+            now += 5
+            progress.finished(status)
+        progress.started()
+
+        snapshot = progress.snapshot()
+        self.assertEqual((4, 1, 5), (snapshot["completed"], snapshot["in_flight"], snapshot["queued"]))
+        self.assertEqual(0.5, snapshot["accuracy"])
+        # 4 tasks in 20s is 12 a minute, which leaves 30s for the other 6.
+        self.assertAlmostEqual(12.0, snapshot["throughput"])
+        self.assertAlmostEqual(30.0, cast(float, snapshot["eta_s"]))
+        self.assertIn("4/10 done, 1 running, 5 queued", status_line(snapshot))
+
+        # only the last minute counts towards throughput.
+        now += 52
+        self.assertAlmostEqual(2.0, progress.snapshot()["throughput"])
+
+    def test_engines_report_progress(self):
+        progress = SweepProgress()
+        run_benchmark_threaded(sleepy_benchmark([0.01] * 6), {}, 3, SleepyBenchmarkRunner(), progress=progress)
+        snapshot = progress.snapshot()
+        self.assertEqual((6, 6, 0, 0), (snapshot["total"], snapshot["completed"], snapshot["in_flight"], snapshot["queued"]))
+        self.assertEqual({"correct": 6}, snapshot["statuses"])
+
+
+class TestReplay(unittest.TestCase):
+    def test_fake_runner_advances(self):
+        results = [TR.correct("a", []), TR.not_found([])]
+        runner = FakeTaskRunner(results)
+        self.assertEqual(["correct", "not-found"], [runner.run(command(), full_task("x")).status for _ in results])
+        self.assertRaises(RuntimeError, runner.run, command(), full_task("x"))
+
+    def test_task_runner_replays_results_and_latency(self):
+        started = datetime(2024, 5, 1, 12)
+        correct, wrong = TR.correct("because", []), TR.incorrect("because", "dunno", [])
+        correct.created, wrong.created = started + timedelta(seconds=2), started + timedelta(seconds=4)
+        runs = [
+            TaskRun(started=started, task=full_task("a"), command=command(), result=correct),
+            TaskRun(started=started, task=full_task("a"), command=command(), result=wrong),
+        ]
+        runner = ReplayTaskRunner(runs, speedup=40)
+
+        began = time.perf_counter()
+        statuses = [runner.run(command(), full_task("a")).status for _ in range(3)]
+        elapsed = time.perf_counter() - began
+
+        self.assertEqual(["correct", "incorrect", "correct"], statuses)
+        self.assertGreaterEqual(elapsed, (2 + 4 + 2) / 40)
+        self.assertLess(elapsed, 2 * (2 + 4 + 2) / 40)
+        self.assertRaises(RuntimeError, runner.run, command(), full_task("b"))
+
+    def test_benchmark_runner_through_engine(self):
+        start = datetime(2024, 5, 1, 12)
+        recorded = [
+            {"task_id": str(i), "prompt": f"file_path: /old/.staging/task-{i}/x.txt\nquestion {i}", "start": str(start),
+             "end": str(start + timedelta(seconds=i)), "messages": [{"role": "assistant", "content": f"FINAL ANSWER: {i}"}],
+             "status": "correct", "metrics": {"llm_calls": 2, "turns": 1}}
+            for i in range(4)
+        ]
+        runner = ReplayBenchmarkRunner(recorded, speedup=20)
+        b = Benchmark(
+            lambda: [{"id": str(i)} for i in range(4)],
+            lambda t: {"id": t["id"], "prompt": f"question {t['id']}"},
+            lambda t, messages: "correct" if messages[-1]["content"] == f"FINAL ANSWER: {t['id']}" else "incorrect"
+        )
+
+        began = time.perf_counter()
+        results = run_benchmark_threaded(b, {}, 4, runner, task_timeout_s=0.125)
+        elapsed = time.perf_counter() - began
+
+        by_id = {r["task_id"]: r for r in results}
+        self.assertEqual(["correct", "correct", "correct", "timeout"], [by_id[str(i)]["status"] for i in range(4)])
+        self.assertEqual(2, cast(Dict, by_id["1"]["metrics"])["llm_calls"])
+        # the longest task is cut off by the timeout rather than replayed in full.
+        self.assertLess(elapsed, 0.3)
+
+
+class TestHarnessBench(unittest.TestCase):
+    def test_every_engine_measures(self):
+        for name, engine in ENGINES.items():
+            m = measure(engine, 50, 4, repeats=1)
+            self.assertGreater(m["tasks_per_s"], 0, name)
+            self.assertGreater(m["peak_mb"], 0, name)
+
+    def test_regressions(self):
+        baseline = {"tasks_per_s": 1000.0, "overhead_us": 1000.0, "peak_mb": 10.0}
+        self.assertEqual([], regressions("x", {"tasks_per_s": 800.0, "overhead_us": 1250.0, "peak_mb": 12.0}, baseline, 0.3))
+        self.assertEqual(2, len(regressions("x", {"tasks_per_s": 600.0, "overhead_us": 1666.0, "peak_mb": 14.0}, baseline, 0.3)))
+
+    def test_regressions_are_relative_to_the_calibration_loop(self):
+        baseline = {"tasks_per_s": 1000.0, "overhead_us": 1000.0, "peak_mb": 10.0, "relative": 0.5}
+        # a machine running at half speed slows the calibration loop down just as much.
+        self.assertEqual([], regressions("x", {"tasks_per_s": 500.0, "overhead_us": 2000.0, "peak_mb": 10.0, "relative": 0.5}, baseline, 0.3))
+        self.assertEqual(1, len(regressions("x", {"tasks_per_s": 1000.0, "overhead_us": 1000.0, "peak_mb": 10.0, "relative": 0.3}, baseline, 0.3)))
+
+
+class TestLookups(unittest.TestCase):
+    def test_memory_stores(self):
+        first, duplicate = full_task("a"), full_task("a").model_copy(update={"question": "Why not?"})
+        tasks = MemoryTaskStore([first, full_task("b"), duplicate])
+        self.assertIs(first, tasks.get_single("a"))
+        self.assertEqual(["b", None, "a"], [t.task_id if t is not None else None for t in tasks.get_many(["b", "nope", "a"])])
+
+        runs = MemoryTaskRunStore([])
+        started = runs.start(full_task("a"), command())
+        runs.finish(started, TR.correct("because", []))
+        self.assertEqual([started.id, None], [r.id if r is not None else None for r in runs.get_many([started.id, "nope"])])
+        self.assertEqual("correct", cast(Any, runs.get(started.id)).result.status)
+
+    def test_catalog_and_sqlite(self):
+        tasks = synthetic_tasks(50)
+        catalog = synthetic_catalog(tasks)
+        self.assertEqual(["task-00000007", None, "task-00000003"], [e["task_id"] if e is not None else None for e in catalog.get_many(["task-00000007", "nope", "task-00000003"])])
+
+        with tempfile.TemporaryDirectory() as directory:
+            db = SqliteTaskRunStore(os.path.join(directory, "runs.db"))
+            started = db.start_many([(full_task(str(i)), command()) for i in range(1000)])
+            # more ids than fit in one query.
+            ids = [r.id for r in reversed(started)] + ["nope"]
+            self.assertEqual(ids[:-1] + [None], [r.id if r is not None else None for r in db.get_many(ids)])
+
+    def test_bench_cases(self):
+        for name, case in cases(300).items():
+            self.assertGreater(case()["lookups_per_s"], 0, name)
+
+
+class TestTrials(unittest.TestCase):
+    def test_pass_at_k(self):
+        self.assertAlmostEqual(0.5, pass_at_k(4, 2, 1))
+        self.assertAlmostEqual(1 - 1 / 6, pass_at_k(4, 2, 2))
+        self.assertEqual(1.0, pass_at_k(4, 3, 2))
+        self.assertEqual(0.0, pass_at_k(4, 0, 3))
+
+    def test_stops_once_settled(self):
+        attempts: Dict[str, int] = {}
+        lock = threading.Lock()
+
+        class FlakyRunner(BenchmarkRunner):
+            # "steady" is always right, "flaky" is right every other attempt.
+            def run(self, command, prompt, timeout_s=None):
+                with lock:
+                    attempts[prompt] = attempts.get(prompt, 0) + 1
+                    n = attempts[prompt]
+                answer = "yes" if prompt == "steady" or n % 2 == 0 else "no"
+                now = datetime.now()
+                return now, [{"role": "assistant", "content": f"FINAL ANSWER: {answer}"}], now
+
+        b = Benchmark(
+            lambda: ["steady", "flaky"],
+            lambda t: {"id": t, "prompt": t},
+            lambda t, messages: "correct" if messages[-1]["content"].endswith("yes") else "incorrect"
+        )
+        report = run_benchmark_trials(b, {}, StoppingRule(max_trials=8), runner=FlakyRunner())
+        by_id = {t["task_id"]: t for t in report["tasks"]}
+
+        self.assertEqual(3, by_id["steady"]["trials"])
+        self.assertEqual("identical", by_id["steady"]["settled_by"])
+        self.assertEqual(8, by_id["flaky"]["trials"])
+        self.assertEqual(0.5, by_id["flaky"]["success_rate"])
+        self.assertEqual(11, report["total_attempts"])
+        self.assertAlmostEqual(0.75, report["pass_at"][1])
+
+    def test_lopsided_outcomes_settle_by_ci(self):
+        attempts: Dict[str, int] = {}
+        lock = threading.Lock()
+
+        class RaisingRunner(BenchmarkRunner):
+            # every task's first attempt blows up; the rest are right.
+            def run(self, command, prompt, timeout_s=None):
+                with lock:
+                    attempts[prompt] = attempts.get(prompt, 0) + 1
+                    if attempts[prompt] == 1:
+                        raise RuntimeError("rate limited")
+                now = datetime.now()
+                return now, [{"role": "assistant", "content": "FINAL ANSWER: yes"}], now
+
+        b = Benchmark(lambda: ["a", "b"], lambda t: {"id": t, "prompt": t}, lambda t, messages: "correct")
+        report = run_benchmark_trials(b, {}, runner=RaisingRunner())
+
+        for t in report["tasks"]:
+            self.assertEqual("ci", t["settled_by"])
+            self.assertEqual(8, t["trials"])
+            self.assertEqual(7, t["successes"])
+            self.assertEqual("error", t["attempts"][0]["status"])
+            self.assertIn("RuntimeError: rate limited", t["attempts"][0]["messages"][0]["content"])
+
+
+class StuckInterpreter:
+    """
+    Just enough of an OpenInterpreter to get stuck in chat() forever.
+    """
+    def __init__(self):
+        self.messages = []
+        self.llm = Mock()
+        self.computer = Mock()
+
+    def chat(self, prompt, display=False, stream=True):
+        self.messages.append({"role": "user", "type": "message", "content": prompt})
+        while True:
+            yield {"role": "computer", "type": "console", "format": "output", "content": "still going..."}
+            time.sleep(0.01)
+
+
+class ScriptedInterpreter:
+    """
+    Calls into llm.completions and computer.run the way the real respond loop does: one LLM call that
+    writes code, one code run, and one more LLM call with the answer.
+    """
+    def __init__(self):
+        self.messages = []
+        self.llm = Mock()
+        self.llm.model = "gpt-4"
+        self.llm.completions = lambda **params: iter([{"choices": [{"delta": {"content": params["reply"]}}]}])
+        self.computer = Mock()
+        self.computer.run = lambda language, code, stream=False: iter([{"type": "console", "format": "output", "content": "42"}])
+
+    def chat(self, prompt, display=False, stream=True):
+        self.messages.append({"role": "user", "type": "message", "content": prompt})
+        for chunk in self.llm.completions(model="gpt-4", messages=self.messages, reply="print(42)"):
+            yield {"role": "assistant", "type": "code", "content": chunk["choices"][0]["delta"]["content"]}
+        for line in self.computer.run("python", "print(42)", stream=True):
+            yield {"role": "computer", **line}
+        for chunk in self.llm.completions(model="gpt-4", messages=self.messages, reply="FINAL ANSWER: 42"):
+            yield {"role": "assistant", "type": "message", "content": chunk["choices"][0]["delta"]["content"]}
+        self.messages.append({"role": "assistant", "type": "message", "content": "FINAL ANSWER: 42"})
+
+
+class ChattyInterpreter(ScriptedInterpreter):
+    """
+    Gives its final answer a few tokens at a time and then, rather than stopping, goes on to check it
+    with more code.
+    """
+    def chat(self, prompt, display=False, stream=True):
+        self.messages.append({"role": "user", "type": "message", "content": prompt})
+        self.messages.append({"role": "assistant", "type": "message", "content": ""})
+        yield {"role": "assistant", "type": "message", "start": True}
+        for token in ["FINAL ", "ANSWER: ", "42", "\n", "Let me double-check."]:
+            next(self.llm.completions(model="gpt-4", messages=self.messages, reply=token))
+            self.messages[-1]["content"] += token
+            yield {"role": "assistant", "type": "message", "content": token}
+        yield {"role": "assistant", "type": "message", "end": True}
+        for chunk in self.llm.completions(model="gpt-4", messages=self.messages, reply="print(6 * 7)"):
+            yield {"role": "assistant", "type": "code", "content": chunk["choices"][0]["delta"]["content"]}
+        self.messages.append({"role": "assistant", "type": "code", "content": "print(6 * 7)"})
+
+
+class TestChat(unittest.TestCase):
+    def test_chat_metrics(self):
+        outcome = chat(cast(Any, ScriptedInterpreter()), "what is six times seven?")
+        metrics = outcome.metrics
+        assert metrics is not None
+        self.assertEqual(2, metrics.llm_calls)
+        self.assertEqual(1, metrics.turns)
+        self.assertIsNotNone(metrics.time_to_first_token)
+        self.assertGreater(metrics.prompt_tokens, 0)
+        self.assertGreater(metrics.completion_tokens, 0)
+
+    def test_results_get_their_own_timestamps(self):
+        first = TR.not_found([])
+        time.sleep(0.01)
+        self.assertLess(first.created, TR.not_found([]).created)
+
+    def test_chat_timeout(self):
+        interpreter = StuckInterpreter()
+        outcome = chat(cast(Any, interpreter), "loop forever", timeout_s=0.1)
+        self.assertTrue(outcome.timed_out)
+        self.assertEqual("loop forever", outcome.messages[0]["content"])
+        interpreter.computer.terminate.assert_called_once()
+
+    def test_final_answer_watcher(self):
+        watcher = FinalAnswerWatcher()
+        self.assertFalse(watcher.feed({"role": "assistant", "type": "message", "start": True}))
+        self.assertFalse(watcher.feed({"role": "assistant", "type": "message", "content": "FINAL ANSWER: 4"}))
+        # the answer could still be 42 (or 4000).
+        self.assertFalse(watcher.feed({"role": "assistant", "type": "message", "content": "2"}))
+        self.assertTrue(watcher.feed({"role": "assistant", "type": "message", "end": True}))
+        self.assertFalse(watcher.feed({"role": "assistant", "type": "code", "content": "FINAL ANSWER: 1\n"}))
+        self.assertFalse(watcher.feed({"role": "assistant", "type": "message", "start": True}))
+        self.assertFalse(watcher.feed({"role": "assistant", "type": "message", "end": True}))
+
+    def test_chat_stops_on_answer(self):
+        interpreter = ChattyInterpreter()
+        outcome = chat(cast(Any, interpreter), "what is six times seven?", stop_on_answer=True)
+        metrics = outcome.metrics
+        assert metrics is not None
+        # stopped right after the newline: neither the rest of the message nor the code ever got asked for.
+        self.assertEqual(4, metrics.llm_calls)
+        self.assertEqual("FINAL ANSWER: 42\n", outcome.messages[-1]["content"])
+        self.assertEqual(2, metrics.stopped_early_message)
+        self.assertIsNotNone(metrics.stopped_early_s)
+        self.assertFalse(outcome.timed_out)
+        interpreter.computer.terminate.assert_called_once()
+        self.assertEqual("correct", verdict(outcome.messages, "42")[0])
+
+        # without it the chat runs its course.
+        outcome = chat(cast(Any, ChattyInterpreter()), "what is six times seven?")
+        assert outcome.metrics is not None
+        self.assertEqual(6, outcome.metrics.llm_calls)
+        self.assertIsNone(outcome.metrics.stopped_early_s)
+
+
+class LoopingInterpreter(ScriptedInterpreter):
+    """
+    Keeps running the same broken code, the way an agent does when it doesn't read its errors.
+    """
+    def __init__(self):
+        super().__init__()
+        self.code_runs = 0
+
+        def run(language, code, stream=False):
+            self.code_runs += 1
+            return iter([
+                {"type": "console", "format": "output", "content": "Traceback (most recent call last):\n"},
+                {"type": "console", "format": "output", "content": "NameError: name 'answer' is not defined\n"},
+            ])
+        self.computer.run = run
+
+    def chat(self, prompt, display=False, stream=True):
+        self.messages.append({"role": "user", "type": "message", "content": prompt})
+        for _ in range(100):
+            for chunk in self.llm.completions(model="gpt-4", messages=self.messages, reply="print(answer)"):
+                yield {"role": "assistant", "type": "code", "content": chunk["choices"][0]["delta"]["content"]}
+            self.messages.append({"role": "assistant", "type": "code", "content": "print(answer)"})
+            for line in self.computer.run("python", "print(answer)", stream=True):
+                yield {"role": "computer", **line}
+
+
+class TestBudget(unittest.TestCase):
+    def test_watcher(self):
+        metrics = TaskMetrics()
+        watcher = BudgetWatcher(Budget(max_turns=3, max_tokens=1000, max_repeats=2), metrics)
+        self.assertIsNone(watcher.exhausted())
+        watcher.code_ran("python", "print(1)", "1\n")
+        watcher.code_ran("python", "print(x)", "Traceback (most recent call last):\nNameError: name 'x' is not defined\n")
+        self.assertIsNone(watcher.exhausted())
+        # different code, same error.
+        watcher.code_ran("python", "print(x + 1)", "Traceback (most recent call last):\nNameError: name 'x' is not defined\n")
+        self.assertEqual("hit the same error 2 times: NameError: name 'x' is not defined", watcher.exhausted())
+
+        watcher = BudgetWatcher(Budget(max_repeats=2), metrics)
+        watcher.code_ran("shell", "ls", "a\n")
+        watcher.code_ran("shell", " ls\n", "a\n")
+        self.assertEqual("ran the same shell code 2 times", watcher.exhausted())
+
+        metrics.turns = 3
+        watcher = BudgetWatcher(Budget(max_turns=3), metrics)
+        self.assertIsNone(watcher.exhausted())
+        self.assertEqual("used up its 3 turns", watcher.may_run())
+        self.assertEqual("used up its 3 turns", watcher.exhausted())
+        metrics.turns = 4
+        self.assertEqual("used up its 3 turns", BudgetWatcher(Budget(max_turns=3), metrics).exhausted())
+        metrics.prompt_tokens, metrics.completion_tokens = 900, 200
+        self.assertEqual("used 1100 of its 1000 tokens", BudgetWatcher(Budget(max_tokens=1000), metrics).exhausted())
+        self.assertIsNone(BudgetWatcher(Budget(), metrics).exhausted())
+
+    def test_chat_stops_looping_agent(self):
+        interpreter = LoopingInterpreter()
+        outcome = chat(cast(Any, interpreter), "what is the answer?", budget=Budget(max_repeats=3))
+        self.assertEqual("ran the same python code 3 times", outcome.budget_exhausted)
+        assert outcome.metrics is not None
+        self.assertEqual(3, outcome.metrics.turns)
+        interpreter.computer.terminate.assert_called_once()
+
+        interpreter = LoopingInterpreter()
+        outcome = chat(cast(Any, interpreter), "what is the answer?", budget=Budget(max_turns=5))
+        self.assertEqual("used up its 5 turns", outcome.budget_exhausted)
+        assert outcome.metrics is not None
+        # the 6th run is refused before it starts.
+        self.assertEqual(5, outcome.metrics.turns)
+        self.assertEqual(5, interpreter.code_runs)
+
+    def test_sweep_counts_budget_exhausted(self):
+        class BudgetRunner(BenchmarkRunner):
+            def run(self, command, prompt, timeout_s=None):
+                now = datetime.now()
+                metrics = TaskMetrics(prompt_tokens=700, completion_tokens=300)
+                return RunOutput(now, [budget_message("used up its 5 turns")], now, metrics)
+
+        b = Benchmark(lambda: [{"id": "a"}, {"id": "b"}], lambda t: {"id": t["id"], "prompt": "?"}, lambda t, m: "unknown")
+        results = run_benchmark(b, {"max_turns": 5}, BudgetRunner())
+        self.assertEqual(["budget-exhausted"] * 2, [r["status"] for r in results])
+        self.assertEqual("budget-exhausted", verdict(results[0]["messages"], "42")[0])
+        [summary] = summarize_sweep({"a": results})
+        self.assertEqual(2, summary["budget_exhausted"])
+        self.assertEqual(2000, summary["wasted_tokens"])
+
+
+class TestScoring(unittest.TestCase):
+    def test_verdict(self):
+        self.assertEqual(("correct", "Because"), verdict([{"role": "assistant", "content": "FINAL ANSWER: Because "}], "because"))
+        self.assertEqual(("incorrect", "why not"), verdict([{"role": "assistant", "content": "FINAL ANSWER: why not"}], "because"))
+        self.assertEqual(("not-found", None), verdict([{"role": "assistant", "content": "no idea"}], "because"))
+        self.assertEqual(("error", None), verdict([{"role": "error", "content": "Traceback..."}], "because"))
+        self.assertEqual(("not-found", None), verdict([], "because"))
+
+    def test_rescore_store(self):
+        answered = [{"role": "assistant", "content": "FINAL ANSWER: because"}]
+        runs = [
+            # graded by some older, stricter scorer.
+            TaskRun(task=full_task("a"), command=command(), result=TR.incorrect("because", "because", answered)),
+            TaskRun(task=full_task("b"), command=command(), result=TR.correct("because", answered)),
+            TaskRun(task=full_task("c"), command=command(), result=TR.error("boom", answered)),
+            TaskRun(task=full_task("d"), command=command(), result=None),
+        ]
+        store = MemoryTaskRunStore(runs)
+
+        changes = rescore_store(store, processes=2, batch_size=1)
+
+        self.assertEqual([("a", "incorrect", "correct")], [(c.task_id, c.before, c.after) for c in changes])
+        self.assertEqual(["correct", "correct", "error"], [r.result.status for r in runs[:3] if r.result is not None])
+        self.assertIsNone(runs[3].result)
+
+    def test_rescore_reads_items_as_it_goes(self):
+        read = []
+
+        def items():
+            for i in range(100):
+                read.append(i)
+                yield str(i), [{"role": "assistant", "content": "FINAL ANSWER: because"}], "because"
+
+        scored = rescore(items(), processes=2, batch_size=1)
+        self.assertEqual(("0", "correct", "because"), next(scored))
+        # two batches in flight per process.
+        self.assertLessEqual(len(read), 4)
+        self.assertEqual(99, len(list(scored)))
+
+
+class TestAttachments(unittest.TestCase):
+    def test_extractions_are_cached_by_content(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pptx = os.path.join(directory, "slides.pptx")
+            with zipfile.ZipFile(pptx, "w") as archive:
+                slide = '<p:sld xmlns:p="p" xmlns:a="a"><a:p><a:r><a:t>crayfish</a:t></a:r><a:r><a:t> and isopods</a:t></a:r></a:p></p:sld>'
+                archive.writestr("ppt/slides/slide1.xml", slide)
+            renamed = os.path.join(directory, "copy.pptx")
+            shutil.copy(pptx, renamed)
+
+            cache = AttachmentCache(os.path.join(directory, "cache"))
+            extraction = cache.get(pptx)
+            assert extraction is not None
+            self.assertEqual("# slide 1\ncrayfish and isopods", extraction["text"])
+            self.assertEqual(1, len(os.listdir(cache.cache_dir)))
+
+            self.assertEqual(extraction, cache.get(renamed))
+            self.assertEqual(1, len(os.listdir(cache.cache_dir)))
+
+            unknown = os.path.join(directory, "unknown.bin")
+            with open(unknown, "wb") as file:
+                file.write(b"\0")
+            self.assertIsNone(cache.get(unknown))
+
+    def test_missing_attachment_has_no_extraction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AttachmentCache(os.path.join(directory, "cache"))
+            self.assertIsNone(cache.get(os.path.join(directory, "does-not-exist.pdf")))
+            self.assertEqual([], os.listdir(cache.cache_dir))
+
+
+class TestBlobs(unittest.TestCase):
+    def test_payloads_are_stored_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            blobs = BlobStore(directory)
+            screenshot = "iVBORw0KGgo" * 1000
+            messages = [
+                {"role": "system", "type": "message", "content": "You are a helpful assistant."},
+                {"role": "computer", "type": "image", "format": "base64.png", "content": screenshot},
+                {"role": "assistant", "type": "message", "content": "FINAL ANSWER: 42"},
+            ]
+            compacted = compact_messages(messages, blobs)
+            self.assertTrue(is_ref(compacted[0]["content"]))
+            self.assertTrue(is_ref(compacted[1]["content"]))
+            self.assertEqual("FINAL ANSWER: 42", compacted[2]["content"])
+            self.assertEqual("base64.png", compacted[1]["format"])
+            # compacting twice (or another run with the same payloads) doesn't store anything new.
+            self.assertEqual(compacted, compact_messages(compacted, blobs))
+            self.assertEqual(compacted, compact_messages(messages, blobs))
+            self.assertEqual(2, sum(len(files) for _, _, files in os.walk(directory)))
+            self.assertLess(sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(directory) for f in fs), 1000)
+
+            self.assertEqual(messages, expand_messages(compacted, blobs))
+            self.assertIsNone(blobs.get("../../etc/passwd"))
+
+    def test_compacting_store_and_api(self):
+        with tempfile.TemporaryDirectory() as directory:
+            blobs = BlobStore(directory)
+            inner = MemoryTaskRunStore([])
+            runs = CompactingTaskRunStore(inner, blobs)
+            with_prompt = command().model_copy(update={"system_prompt": "Answer with FINAL ANSWER: <answer>."})
+            run = runs.start(full_task("a"), with_prompt)
+            self.assertEqual(with_prompt.system_prompt, run.command.system_prompt)
+            output = "x" * 10_000
+            runs.finish(run, TR.correct("because", [{"role": "computer", "type": "console", "content": output}]))
+
+            stored = inner.runs[0]
+            assert stored.result is not None
+            self.assertTrue(is_ref(stored.command.system_prompt))
+            self.assertTrue(is_ref(stored.result.conversation[0]["content"]))
+            self.assertEqual(output, cast(Any, runs.get(run.id)).result.conversation[0]["content"])
+
+            client = TestClient(Server(cast(TaskStore, Mock(spec=TaskStore)), FakeTaskRunner([]), runs, blobs).make_app())
+            expanded = client.get(f"/gaia/runs/{run.id}").json()
+            self.assertEqual(output, expanded["result"]["conversation"][0]["content"])
+            compact = client.get(f"/gaia/runs/{run.id}", params={"form": "compact"}).json()
+            ref = compact["result"]["conversation"][0]["content"]
+            self.assertTrue(is_ref(ref))
+            self.assertEqual(output, client.get(f"/gaia/blobs/{ref}").text)
+            self.assertEqual(404, client.get(f"/gaia/blobs/{'0' * 64}").status_code)
+
+
+class TestSqliteStore(unittest.TestCase):
+    def test_migrate_from_shelf(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shelf = DefaultTaskRunStore(os.path.join(directory, "runs"))
+            finished = shelf.start(full_task("a"), command())
+            shelf.finish(finished, TR.correct("because", [{"role": "assistant", "content": "FINAL ANSWER: because"}]))
+            running = shelf.start(full_task("b"), command())
+
+            db = SqliteTaskRunStore(os.path.join(directory, "runs.db"))
+            self.assertEqual(2, migrate_shelf(os.path.join(directory, "runs"), db))
+            self.assertEqual(0, migrate_shelf(os.path.join(directory, "runs"), db))
+
+            self.assertEqual(shelf.get(finished.id), db.get(finished.id))
+            self.assertEqual(shelf.get(running.id), db.get(running.id))
+            self.assertIsNone(db.get("nope"))
+            self.assertEqual(sorted(p.model_dump_json() for p in shelf.get_previews()), sorted(p.model_dump_json() for p in db.get_previews()))
+            self.assertEqual([running.id], [p.id for p in db.get_task_runs(full_task("b"))])
+
+            db.finish(running, TR.not_found([]))
+            self.assertEqual("not-found", cast(Any, db.get(running.id)).result.status)
+            with self.assertRaises(RuntimeError):
+                db.finish(TaskRun(task=full_task("c"), command=command(), result=None), TR.not_found([]))
+
+    def test_concurrent_writers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "runs.db")
+            db = SqliteTaskRunStore(path)
+
+            def work(worker: int):
+                for i in range(20):
+                    run = db.start(full_task(f"{worker}-{i}"), command())
+                    db.finish(run, TR.correct("because", []))
+
+            threads = [threading.Thread(target=work, args=(w,)) for w in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            # what another process opening the same file would see.
+            previews = SqliteTaskRunStore(path).get_previews()
+            self.assertEqual(160, len(previews))
+            self.assertTrue(all(p.result == "correct" for p in previews))
+
+
+class TestPreviewIndex(unittest.TestCase):
+    def test_old_shelves_get_an_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "runs")
+            run = TaskRun(task=full_task("a"), command=command(), result=TR.correct("because", []))
+            with open_shelf(path, "c") as shelf:
+                shelf["runs"] = {run.id: run}
+
+            store = DefaultTaskRunStore(path)
+            self.assertEqual([run.to_preview()], store.get_previews())
+            started = store.start(full_task("b"), command())
+            store.finish_many([(started, TR.not_found([]))])
+            self.assertEqual(["not-found"], [p.result for p in store.get_task_runs(full_task("b"))])
+            # the listings don't look at the runs at all.
+            with open_shelf(path, "w") as shelf:
+                shelf["runs"] = {}
+            self.assertEqual(2, len(store.get_previews()))
+
+    def test_sqlite_listings_skip_the_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "runs.db")
+            store = SqliteTaskRunStore(path)
+            run = store.start(full_task("a"), command())
+            self.assertEqual([run.to_preview()], store.get_previews())
+            with sqlite3.connect(path) as db:
+                db.execute("UPDATE runs SET task = 'not json', command = 'not json'")
+            db.close()
+            self.assertEqual([run.to_preview()], store.get_task_runs(full_task("a")))
+
+
+class CountingRunStore(MemoryTaskRunStore):
+    def __init__(self):
+        super().__init__([])
+        self.batches: List[int] = []
+
+    def finish_many(self, results: List[Tuple[TaskRun, Any]]):
+        self.batches.append(len(results))
+        super().finish_many(results)
+
+
+class TestBatchingStore(unittest.TestCase):
+    def test_read_your_writes(self):
+        inner = CountingRunStore()
+        runs = BatchingTaskRunStore(inner, window_s=60)
+        started = runs.start_many([(full_task("a"), command()), (full_task("b"), command())])
+        self.assertEqual(2, len(inner.get_previews()))
+
+        runs.finish(started[0], TR.correct("because", []))
+        runs.finish(started[1], TR.not_found([]))
+        # nothing's been written yet, but it's all there to be read.
+        self.assertIsNone(cast(Any, inner.get(started[0].id)).result)
+        self.assertEqual("correct", cast(Any, runs.get(started[0].id)).result.status)
+        self.assertEqual(["not-found"], [p.result for p in runs.get_task_runs(full_task("b"))])
+        self.assertEqual({"correct", "not-found"}, {cast(Any, r.result).status for r in runs.iter_runs()})
+
+        runs.flush()
+        self.assertEqual([2], inner.batches)
+        self.assertEqual("correct", cast(Any, inner.get(started[0].id)).result.status)
+        metrics = runs.metrics()
+        self.assertEqual((2, 2, 2, 0), (metrics["starts"], metrics["finishes"], metrics["commits"], metrics["pending"]))
+        runs.close()
+
+    def test_one_bad_result(self):
+        inner = CountingRunStore()
+        runs = BatchingTaskRunStore(inner, window_s=60)
+        run = runs.start(full_task("a"), command())
+        runs.finish(TaskRun(task=full_task("b"), command=command(), result=None), TR.not_found([]))
+        runs.finish(run, TR.correct("because", []))
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            runs.close()
+        self.assertEqual("correct", cast(Any, inner.get(run.id)).result.status)
+        self.assertEqual(1, runs.metrics()["failed"])
+        # once it's closed, writes go straight through.
+        runs.finish(run, TR.not_found([]))
+        self.assertEqual("not-found", cast(Any, inner.get(run.id)).result.status)
+
+    def test_concurrent_finishes_share_fsyncs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = LogTaskRunStore(directory, compact_interval_s=None)
+            runs = BatchingTaskRunStore(log, window_s=0.05, exclusive=False)
+
+            def work(worker: int):
+                for i in range(20):
+                    run = runs.start(full_task(f"{worker}-{i}"), command())
+                    runs.finish(run, TR.correct("because", []))
+
+            threads = [threading.Thread(target=work, args=(w,)) for w in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            runs.close()
+
+            self.assertEqual(160, len([p for p in log.get_previews() if p.result == "correct"]))
+            metrics = runs.metrics()
+            self.assertEqual((160, 160, 0), (metrics["starts"], metrics["finishes"], metrics["failed"]))
+            self.assertLess(metrics["fsyncs"], 320)
+            self.assertGreater(metrics["writes_per_commit"], 1)
+            log.close()
+
+
+class TestPagination(unittest.TestCase):
+    def fill(self, runs: TaskRunStore) -> List[TaskRun]:
+        started = []
+        for i in range(7):
+            task = full_task(f"t{i % 3}").model_copy(update={"level": i % 2 + 1})
+            run = runs.start(task, command().model_copy(update={"model": "a" if i < 4 else "b"}))
+            if i % 3 != 2:
+                runs.finish(run, TR.correct("because", []) if i % 2 == 0 else TR.not_found([]))
+            started.append(run)
+        return started
+
+    def all_pages(self, runs: TaskRunStore, filter: RunFilter, limit: int) -> List[str]:
+        ids, cursor = [], None
+        while True:
+            page, cursor = runs.get_preview_page(filter, cursor, limit)
+            self.assertLessEqual(len(page), limit)
+            ids.extend(p.id for p in page)
+            if cursor is None:
+                return ids
+
+    def test_stores_agree(self):
+        filters = [
+            RunFilter(),
+            RunFilter(level=2),
+            RunFilter(status="running"),
+            RunFilter(status="correct", model="a"),
+            RunFilter(task_id="t1"),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            log = LogTaskRunStore(os.path.join(directory, "log"), compact_interval_s=None)
+            stores: Dict[str, TaskRunStore] = {
+                "memory": MemoryTaskRunStore([]),
+                "shelf": DefaultTaskRunStore(os.path.join(directory, "runs")),
+                "sqlite": SqliteTaskRunStore(os.path.join(directory, "runs.db")),
+                "log": log,
+            }
+            for name, runs in stores.items():
+                started = self.fill(runs)
+                previews = sorted((runs.get(r.id).to_preview() for r in started), key=lambda p: (p.started, p.id))
+                for filter in filters:
+                    expected = [p.id for p in previews if filter.matches(p.task, p.started, p.result, p.model)]
+                    self.assertEqual(expected, [p.id for p in runs.get_preview_page(filter)[0]], (name, filter))
+                    self.assertEqual(expected, self.all_pages(runs, filter, 2), (name, filter))
+                self.assertEqual(3, len(runs.get_preview_page(RunFilter(started_before=previews[3].started))[0]), name)
+                self.assertEqual(["a", "b"], sorted({cast(str, p.model) for p in runs.get_previews()}), name)
+                with self.assertRaises(ValueError):
+                    runs.get_preview_page(RunFilter(), "not a cursor", 2)
+            log.close()
+
+    def test_catalog_pages(self):
+        catalog = synthetic_catalog(synthetic_tasks(10))
+        self.assertEqual([1, 4, 7], [i for i, _ in catalog.find(["task_id"], 0, level=2, limit=3)])
+        self.assertEqual([4, 7], [i for i, _ in catalog.find(["task_id"], 2, level=2)])
+        self.assertEqual([(8, {"task_id": "task-00000008"}), (9, {"task_id": "task-00000009"})], catalog.find(["task_id"], 8))
+
+    def test_server_pages(self):
+        tasks = MemoryTaskStore([full_task(str(i)).model_copy(update={"level": i % 3 + 1}) for i in range(10)])
+        runs = MemoryTaskRunStore([])
+        for task in tasks.tasks[:5]:
+            runs.start(task, command())
+        client = TestClient(Server(tasks, cast(TaskRunner, Mock(spec=TaskRunner)), runs).make_app())
+
+        response = client.get("/gaia/tasks", params={"level": 1, "limit": 2})
+        self.assertEqual(["0", "3"], [t["task_id"] for t in response.json()])
+        self.assertIn("X-Next-Cursor", response.headers)
+        self.assertEqual(400, client.get("/gaia/runs", params={"cursor": "nope"}).status_code)
+        self.assertEqual(422, client.get("/gaia/runs", params={"limit": 0}).status_code)
+
+        base = "http://testserver"
+        with patch("api.requests.get", lambda url, params: client.get(url.removeprefix(base), params=params)):
+            self.assertEqual(["0", "3", "6", "9"], [t.task_id for t in api.iter_tasks(base, level=1, page_size=3)])
+            self.assertEqual(5, len(list(api.iter_runs(base, page_size=2))))
+            self.assertEqual(["1"], [r.task.task_id for r in api.iter_runs(base, RunFilter(task_id="1", status="running"), page_size=2)])
+            self.assertEqual(5, len(api.get_all_runs(base)))
+
+    def test_server_filters_by_aware_timestamps(self):
+        now = datetime.now(timezone.utc)
+        with tempfile.TemporaryDirectory() as directory:
+            for runs in [MemoryTaskRunStore([]), SqliteTaskRunStore(os.path.join(directory, "runs.db"))]:
+                for i in range(3):
+                    runs.start(full_task(str(i)), command())
+                client = TestClient(Server(MemoryTaskStore([]), cast(TaskRunner, Mock(spec=TaskRunner)), runs).make_app())
+
+                for bound, expected in [(now - timedelta(hours=1), 3), (now + timedelta(hours=1), 0)]:
+                    for text in [bound.isoformat(), bound.strftime("%Y-%m-%dT%H:%M:%S.%fZ")]:
+                        response = client.get("/gaia/runs", params={"started_after": text})
+                        self.assertEqual(200, response.status_code, text)
+                        self.assertEqual(expected, len(response.json()), (type(runs).__name__, text))
+                        response = client.get("/gaia/runs", params={"started_before": text})
+                        self.assertEqual(3 - expected, len(response.json()), (type(runs).__name__, text))
+
+
+class TestLogStore(unittest.TestCase):
+    def test_recovers_after_a_crash(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = LogTaskRunStore(directory, compact_interval_s=None)
+            runs = [log.start(full_task(str(i)), command()) for i in range(3)]
+            log.finish(runs[0], TR.correct("because", []))
+            log.checkpoint()
+            log.finish(runs[1], TR.not_found([]))
+            # killed halfway through writing a record, so there's no checkpoint of it either.
+            log.active.close()
+            with open(os.path.join(directory, "segment-00000001.log"), "ab") as file:
+                file.write(b'{"op": "finish", "id": ')
+
+            reopened = LogTaskRunStore(directory, compact_interval_s=None)
+            self.assertEqual([r.id for r in runs], [r.id for r in reopened.iter_runs()])
+            self.assertEqual(log.get(runs[1].id), reopened.get(runs[1].id))
+            self.assertEqual([None, "correct", "not-found"], sorted([p.result for p in reopened.get_previews()], key=str))
+            reopened.finish(runs[2], TR.correct("because", []))
+            reopened.close()
+            again = LogTaskRunStore(directory, compact_interval_s=None)
+            self.assertEqual("correct", cast(Any, again.get(runs[2].id)).result.status)
+            again.close()
+
+    def test_compaction_keeps_the_latest_records(self):
+        with tempfile.TemporaryDirectory() as directory:
+            now = datetime(2024, 5, 1)
+            log = LogTaskRunStore(directory, segment_bytes=2000, compact_interval_s=None, retention=Retention(max_runs=5), clock=lambda: now)
+            runs = [log.start(full_task(str(i % 3)), command()) for i in range(12)]
+            for run in runs[:8]:
+                log.finish(run, TR.incorrect("because", "why", []))
+                log.finish(run, TR.correct("because", []))
+            log.start(full_task("active"), command())
+            self.assertGreater(len(os.listdir(directory)), 3)
+
+            self.assertEqual(3, log.compact())
+            self.assertEqual(2, len([n for n in os.listdir(directory) if n.endswith(".log")]))
+            kept = [r.id for r in runs[3:]]
+            self.assertEqual(sorted(kept), sorted(r.id for r in log.iter_runs() if r.task.task_id != "active"))
+            self.assertEqual("correct", cast(Any, log.get(runs[5].id)).result.status)
+            self.assertIsNone(cast(Any, log.get(runs[10].id)).result)
+
+            [sealed, _] = sorted(os.path.join(directory, n) for n in os.listdir(directory) if n.endswith(".log"))
+            inode = os.stat(sealed).st_ino
+            self.assertEqual(0, log.compact())
+            self.assertEqual(inode, os.stat(sealed).st_ino)
+            # superseding a record in the compacted segment makes it worth rewriting again.
+            refinished = next(r for r in runs[3:8] if cast(Any, log.index[r.id].finish).segment != log.active_id)
+            log.finish(refinished, TR.not_found([]))
+            self.assertEqual(0, log.compact())
+            self.assertNotEqual(inode, os.stat(sealed).st_ino)
+            self.assertEqual("not-found", cast(Any, log.get(refinished.id)).result.status)
+
+            log.close()
+            reopened = LogTaskRunStore(directory, compact_interval_s=None)
+            self.assertEqual([p.model_dump_json() for p in log.get_task_runs(full_task("1"))], [p.model_dump_json() for p in reopened.get_task_runs(full_task("1"))])
+            reopened.close()
+
+    def test_concurrent_finishes_share_fsyncs(self):
+        fsync = os.fsync
+
+        def slow_fsync(fd: int):
+            # slow enough that writers pile up behind it, the way they do on a network volume.
+            time.sleep(0.002)
+            fsync(fd)
+
+        with tempfile.TemporaryDirectory() as directory, patch("logstore.os.fsync", slow_fsync):
+            log = LogTaskRunStore(directory, compact_interval_s=None)
+
+            def work(worker: int):
+                for i in range(25):
+                    log.finish(log.start(full_task(f"{worker}-{i}"), command()), TR.correct("because", []))
+
+            threads = [threading.Thread(target=work, args=(w,)) for w in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(400, log.appended)
+            self.assertLess(log.fsyncs, log.appended)
+            self.assertEqual(log.appended, log.synced)
+            log.close()
+            reopened = LogTaskRunStore(directory, compact_interval_s=None)
+            previews = reopened.get_previews()
+            reopened.close()
+            self.assertEqual(200, len(previews))
+            self.assertTrue(all(p.result == "correct" for p in previews))
+
+    def test_batched_fsyncs_are_finished_in_the_background(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = LogTaskRunStore(directory, fsync_batch=10, fsync_interval_s=0.2, compact_interval_s=None)
+            for i in range(25):
+                log.start(full_task(str(i)), command())
+            # one fsync per 10 appends, and maybe one from the background thread.
+            self.assertLessEqual(log.fsyncs, 3)
+            self.assertLess(log.synced, log.appended)
+
+            deadline = time.monotonic() + 5
+            while log.synced < log.appended and time.monotonic() < deadline:
+                time.sleep(0.02)
+            self.assertEqual(log.appended, log.synced)
+            log.close()
+
+
+FAKE_DOCKER = """#!/bin/sh
+# stands in for docker: logs every call, hands out numbered containers, and runs exec'd commands here.
+echo "$@" >> "$FAKE_DOCKER_DIR/calls"
+case "$1" in
+    run)
+        [ -e "$FAKE_DOCKER_DIR/broken" ] && { echo "cannot start container" >&2; exit 1; }
+        rm "$FAKE_DOCKER_DIR/broken-once" 2>/dev/null && { echo "cannot start container" >&2; exit 1; }
+        echo "container-$$" ;;
+    exec)
+        shift 5
+        exec "$@" ;;
+esac
+"""
+
+
+class TestSandbox(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        docker = os.path.join(self.directory, "docker")
+        with open(docker, "w") as file:
+            file.write(FAKE_DOCKER)
+        os.chmod(docker, 0o755)
+        environment = patch.dict(os.environ, {"PATH": f"{self.directory}{os.pathsep}{os.environ['PATH']}", "FAKE_DOCKER_DIR": self.directory})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def calls(self) -> List[List[str]]:
+        with open(os.path.join(self.directory, "calls")) as file:
+            return [line.split() for line in file]
+
+    def test_containers_are_replaced_and_removed(self):
+        pool = ContainerPool(2).start()
+        with pool.lease() as first:
+            pass
+        with pool.lease() as second, pool.lease() as third:
+            self.assertNotEqual(second, third)
+            self.assertNotIn(first, {second, third})
+        pool.close()
+
+        calls = self.calls()
+        removed = [call[-1] for call in calls if call[0] == "rm"]
+        self.assertIn(first, removed)
+        # every container that was started got removed again.
+        self.assertEqual(len([call for call in calls if call[0] == "run"]), len(set(removed)))
+
+    def test_only_the_attachment_is_mounted(self):
+        files_dir = os.path.join(self.directory, "files")
+        os.makedirs(files_dir)
+        for name in ["mine.txt", "theirs.txt"]:
+            with open(os.path.join(files_dir, name), "w") as file:
+                file.write(name)
+
+        pool = ContainerPool(2, files_dir=files_dir).start()
+        with pool.lease("mine.txt") as container:
+            mount = pool.mounts[container]
+            self.assertIn(["run", "-d", "--rm", "-v", f"{mount}:/home/files:ro"], [call[:5] for call in self.calls()])
+            self.assertEqual(["mine.txt"], os.listdir(mount))
+        pool.close()
+        self.assertFalse(os.path.exists(mount))
+
+    def test_failed_start_removes_the_containers_that_did_start(self):
+        open(os.path.join(self.directory, "broken-once"), "w").close()
+        pool = ContainerPool(3, files_dir=os.path.join(self.directory, "files"))
+        with self.assertRaises(subprocess.CalledProcessError):
+            pool.start()
+
+        calls = self.calls()
+        self.assertEqual(3, len([call for call in calls if call[0] == "run"]))
+        self.assertEqual(2, len([call for call in calls if call[0] == "rm"]))
+        self.assertEqual({}, pool.mounts)
+        self.assertEqual([], os.listdir(os.path.join(self.directory, STAGING_DIR)))
+
+    def test_failed_replacement_doesnt_block_leases(self):
+        pool = ContainerPool(1).start()
+        open(os.path.join(self.directory, "broken"), "w").close()
+        with patch("sandbox.RETRY_S", 0.0), patch("sandbox.POLL_S", 0.05), redirect_stdout(io.StringIO()) as out:
+            with pool.lease():
+                pass
+            with self.assertRaises(SandboxUnavailable):
+                with pool.lease():
+                    pass
+            result = DefaultTaskRunner(sandbox=pool).run(command(), full_task("a"))
+        pool.close()
+
+        self.assertIn("cannot start container", out.getvalue())
+        self.assertIn("0 of 1 left", out.getvalue())
+        self.assertEqual("error", result.status)
+
+    def test_lease_timeout(self):
+        pool = ContainerPool(1, lease_timeout_s=0.1).start()
+        with patch("sandbox.POLL_S", 0.05):
+            with pool.lease():
+                with self.assertRaises(SandboxUnavailable):
+                    with pool.lease():
+                        pass
+        pool.close()
+
+    def test_sandboxed_languages_run_through_docker_exec(self):
+        python, shell = sandboxed_languages("container-7")
+        for language, code in [(python, "print(6 * 7)"), (shell, "echo 42")]:
+            runner = language()
+            try:
+                output = "".join(chunk.get("content", "") for chunk in runner.run(code) if chunk.get("format") == "output")
+            finally:
+                runner.terminate()
+                runner.process.wait()
+            self.assertIn("42", output, language.name)
+        self.assertIn(["exec", "-i", "-w", "/home", "container-7", "bash"], self.calls())
+
+
+class TestStaging(unittest.TestCase):
+    def test_each_run_gets_its_own_link(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files_dir = os.path.join(directory, "files")
+            os.makedirs(files_dir)
+            source = os.path.join(files_dir, "data.csv")
+            with open(source, "w") as file:
+                file.write("a,b\n1,2\n")
+
+            with staged("data.csv", files_dir) as first, staged("data.csv", files_dir) as second:
+                self.assertTrue(os.path.isabs(first))
+                self.assertNotEqual(os.path.dirname(first), os.path.dirname(second))
+                with open(first) as file:
+                    self.assertEqual("a,b\n1,2\n", file.read())
+            self.assertFalse(os.path.exists(first))
+            self.assertFalse(os.path.exists(os.path.dirname(second)))
+            self.assertTrue(os.path.exists(source))
+
+    def test_attachments_are_linked_from_the_read_only_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files_dir = os.path.join(directory, "files")
+            os.makedirs(files_dir)
+            source = os.path.join(files_dir, "data.csv")
+            with open(source, "w") as file:
+                file.write("a,b\n")
+            mode = os.stat(source).st_mode
+
+            with staged("data.csv", files_dir) as first, staged("data.csv", files_dir) as second:
+                copy = os.path.join(directory, CACHE_DIR, "data.csv")
+                self.assertEqual(0o444, os.stat(copy).st_mode & 0o777)
+                # hardlinks here (reflinks would be fresh inodes, on filesystems that have them).
+                self.assertTrue(os.path.samefile(copy, first))
+                self.assertTrue(os.path.samefile(copy, second))
+                self.assertFalse(os.path.samefile(source, first))
+            self.assertEqual(mode, os.stat(source).st_mode)
+
+            # a cached copy that stops matching the original is made again rather than handed out.
+            with open(source, "a") as file:
+                file.write("1,2\n")
+            with open(cached("data.csv", files_dir)) as file:
+                self.assertEqual("a,b\n1,2\n", file.read())
+
+    def test_languages_start_in_the_scratch_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with scratch(root=directory) as workdir:
+                [shell] = scratch_languages(workdir, [Shell])
+                runner = shell()
+                try:
+                    output = "".join(chunk.get("content", "") for chunk in runner.run("pwd") if chunk.get("format") == "output")
+                finally:
+                    runner.terminate()
+                    runner.process.wait()
+                self.assertIn(os.path.realpath(workdir), output)
+            self.assertFalse(os.path.exists(workdir))
+
+    def test_missing_attachment_is_not_staged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with staged("does-not-exist.pdf", directory) as path:
+                self.assertEqual(os.path.join(directory, "does-not-exist.pdf"), path)
+            self.assertFalse(os.path.exists(os.path.join(directory, STAGING_DIR)))
+
+    def test_benchmark_prompt_gets_staged_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "notes.txt"), "w") as file:
+                file.write("hello")
+            seen = []
+
+            class StagingRunner(BenchmarkRunner):
+                def stage(self, attachment: str):
+                    return staged(attachment, directory)
+
+                def run(self, command: OpenInterpreterCommand, prompt: str, timeout_s: Optional[float] = None):
+                    path = prompt.splitlines()[0].removeprefix("file_path: ")
+                    seen.append((path, os.path.exists(path)))
+                    now = datetime.now()
+                    return now, [{"role": "assistant", "content": "FINAL ANSWER: hello"}], now
+
+            b = Benchmark(lambda: [{}], lambda t: {"id": "0", "prompt": "What does it say?", "attachment": "notes.txt"}, lambda t, m: "correct")
+            result = run_single_task(b, StagingRunner(), {}, {})
+
+            [(path, existed)] = seen
+            self.assertTrue(existed)
+            self.assertTrue(os.path.isabs(path))
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(f"file_path: {path}\nWhat does it say?", result["prompt"])
+
+
+def gaia_like_task(task_id: str, level: int, steps: str, tools: str, how_long: str) -> Dict:
+    return {
+        "task_id": task_id,
+        "Level": level,
+        "Annotator Metadata": {"Number of steps": steps, "Number of tools": tools, "How long did this take?": how_long}
+    }
+
+
+class TestCostModel(unittest.TestCase):
+    def test_parse_minutes(self):
+        self.assertEqual(7.5, parse_minutes("5-10 minutes"))
+        self.assertEqual(90, parse_minutes("1.5 hours"))
+        self.assertIsNone(parse_minutes("no idea"))
+
+    def test_expensive_first(self):
+        tasks = [
+            gaia_like_task("cheap", 1, "2", "0", "2 minutes"),
+            gaia_like_task("pricey", 3, "12", "4", "1 hour"),
+            gaia_like_task("middling", 2, "6", "2", "15 minutes"),
+        ]
+        model = CostModel()
+        model.calibrate(tasks)
+        b = Benchmark(lambda: tasks, lambda t: {"id": t["task_id"], "prompt": ""}, lambda t, m: "correct", model.estimate)
+        self.assertListEqual(["pricey", "middling", "cheap"], [t["task_id"] for t in schedule_tasks(b, tasks)])
+
+    def test_history_overrides_prior(self):
+        tasks = [gaia_like_task("a", 3, "12", "4", "1 hour"), gaia_like_task("b", 1, "2", "0", "2 minutes")]
+        model = CostModel()
+        model.observe("b", 10_000.0)
+        model.calibrate(tasks)
+        self.assertEqual(10_000.0, model.estimate(tasks[1]))
+        # the prior badly underestimated b, so everything without history gets scaled up too.
+        self.assertGreater(model.estimate(tasks[0]), 10_000.0)
+
+    def test_history_is_appended_per_command(self):
+        start = datetime(2024, 5, 1)
+        def result(task_id: str, seconds: float, status: str = "correct") -> Dict:
+            return {"task_id": task_id, "start": start, "end": start + timedelta(seconds=seconds), "status": status}
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "durations.csv")
+            self.assertEqual(1, append_history("fast", [result("a", 10.0), result("b", 1.0, "error")], path))
+            self.assertEqual(1, append_history("slow", [result("a", 100.0)], path))
+            # a later run adds to what's there rather than replacing it.
+            self.assertEqual(1, append_history("fast", [result("a", 20.0)], path))
+
+            task = gaia_like_task("a", 1, "2", "0", "2 minutes")
+            self.assertEqual(15.0, CostModel.from_history(path, ["fast"]).estimate(task))
+            self.assertEqual(100.0, CostModel.from_history(path, ["slow"]).estimate(task))
+            self.assertAlmostEqual(130.0 / 3, CostModel.from_history(path).estimate(task))
+            self.assertNotIn("b", CostModel.from_history(path).history)
+            self.assertEqual({}, CostModel.from_history(os.path.join(directory, "nope.csv")).history)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,157 @@
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Literal, Optional, Tuple, TypedDict
+
+from benchmark import Benchmark, BenchmarkRunner, Deadline, DefaultBenchmarkRunner, OpenInterpreterCommand, Task, TaskResult, error_result, run_single_task, schedule_tasks
+from progress import SweepProgress
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoppingRule:
+    max_trials: int = 10
+    min_trials: int = 1
+    # stop as soon as the first this-many outcomes all agree.
+    identical_streak: int = 3
+    # ...or once the confidence interval on the success rate is at most this wide.  within max_trials,
+    # the (wilson) interval of a mixed outcome is never narrower than about 0.39, so this has to be
+    # wider for the rule to ever fire: at 0.45, one odd outcome in 8 is enough.
+    ci_width: float = 0.45
+    # 1.96 ~ 95%.
+    z: float = 1.96
+
+
+SettledBy = Literal["identical", "ci", "max"]
+
+
+def wilson_interval(successes: int, n: int, z: float = 1.96) -> Tuple[float, float]:
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    # the unbiased estimator from the codex paper: chance at least one of k samples (out of n, c correct) passes.
+    if n - c < k:
+        return 1.0
+    return 1.0 - math.comb(n - c, k) / math.comb(n, k)
+
+
+def settled(outcomes: List[bool], rule: StoppingRule) -> Optional[SettledBy]:
+    n = len(outcomes)
+    if n >= rule.max_trials:
+        return "max"
+    if n < rule.min_trials:
+        return None
+    if n >= rule.identical_streak and len(set(outcomes)) == 1:
+        return "identical"
+    low, high = wilson_interval(sum(outcomes), n, rule.z)
+    if n > 1 and high - low <= rule.ci_width:
+        return "ci"
+    return None
+
+
+class TaskTrials(TypedDict):
+    task_id: str
+    attempts: List[TaskResult]
+    trials: int
+    successes: int
+    success_rate: float
+    ci_low: float
+    ci_high: float
+    settled_by: SettledBy
+
+
+class TrialsReport(TypedDict):
+    tasks: List[TaskTrials]
+    total_attempts: int
+    # k -> pass@k averaged over every task.
+    pass_at: Dict[int, float]
+
+
+def task_pass_at_k(t: TaskTrials, k: int) -> float:
+    if k <= t["trials"]:
+        return pass_at_k(t["trials"], t["successes"], k)
+    # we stopped sampling before k, so extrapolate from the success rate we settled on.
+    return 1.0 - (1.0 - t["success_rate"]) ** k
+
+
+def run_benchmark_trials(
+    benchmark: Benchmark[Task],
+    command: OpenInterpreterCommand,
+    rule: Optional[StoppingRule] = None,
+    n_threads: Optional[int] = None,
+    runner: Optional[BenchmarkRunner] = None,
+    task_timeout_s: Optional[float] = None,
+    sweep_timeout_s: Optional[float] = None,
+    progress: Optional[SweepProgress] = None
+) -> TrialsReport:
+    """
+    Runs every task repeatedly, keeping every attempt, until the rule says its outcome is settled.
+    Attempts of a single task run one after the other (each one decides whether there's a next),
+    while different tasks run in parallel.
+    """
+    rule = rule if rule is not None else StoppingRule()
+    all_tasks = schedule_tasks(benchmark, benchmark.get_tasks())
+    runner = runner if runner is not None else DefaultBenchmarkRunner()
+    deadline = Deadline(task_timeout_s, sweep_timeout_s)
+    if progress is not None:
+        # one attempt per task to start with; every extra attempt is queued once it's decided on.
+        progress.add(len(all_tasks))
+
+    def run_trials(task: Task) -> TaskTrials:
+        attempts: List[TaskResult] = []
+        outcomes: List[bool] = []
+        settled_by = settled(outcomes, rule)
+        while settled_by is None:
+            if progress is not None and len(attempts) > 0:
+                progress.add()
+            try:
+                result = run_single_task(benchmark, runner, command, task, deadline, progress)
+            except Exception as e:
+                # a failed attempt counts as a wrong one; it mustn't take every other task's report with it.
+                result = error_result(benchmark, command, task, e)
+            attempts.append(result)
+            outcomes.append(result["status"] == "correct")
+            settled_by = settled(outcomes, rule)
+            # no point in sampling further once the sweep is out of time.
+            if result["status"] == "timeout" and deadline.remaining() == 0:
+                settled_by = settled_by or "max"
+
+        task_id = attempts[0]["task_id"]
+        successes = sum(outcomes)
+        low, high = wilson_interval(successes, len(outcomes), rule.z)
+        logger.debug(f"  task {task_id}: {successes}/{len(outcomes)} correct (settled by {settled_by})")
+        return {
+            "task_id": task_id,
+            "attempts": attempts,
+            "trials": len(outcomes),
+            "successes": successes,
+            "success_rate": successes / len(outcomes),
+            "ci_low": low,
+            "ci_high": high,
+            "settled_by": settled_by,
+        }
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        logger.debug(f"Running up to {rule.max_trials} trial(s) of {len(all_tasks)} task(s) across {pool._max_workers} threads...")
+        tasks = list(pool.map(run_trials, all_tasks))
+        logger.debug("done!")
+
+    pass_at = {
+        k: sum(task_pass_at_k(t, k) for t in tasks) / len(tasks) if len(tasks) > 0 else 0.0
+        for k in range(1, rule.max_trials + 1)
+    }
+    return {
+        "tasks": tasks,
+        "total_attempts": sum(t["trials"] for t in tasks),
+        "pass_at": pass_at,
+    }
@@ -0,0 +1,98 @@
+"""
+Pulls runs queued on a server (POST /gaia/sweeps) and runs them locally, so a sweep can be spread
+over as many machines as there are API keys and CPUs.  To try it out on one host:
+
+    python run_server.py --tasks tasks.json --results results.json
+    python worker.py --results results.json --exit-when-idle &
+    python worker.py --results results.json --exit-when-idle &
+"""
+import argparse
+import socket
+import time
+import uuid
+from threading import Event, Thread
+from typing import Optional
+
+import api
+from models import Lease
+from runner import TaskRunner
+from run_server import make_task_runner
+
+
+class Heartbeat(Thread):
+    def __init__(self, base: str, lease: Lease, lease_s: float):
+        super().__init__(daemon=True)
+        self.base = base
+        self.lease = lease
+        self.lease_s = lease_s
+        self.stopped = Event()
+        # set when the server no longer recognizes the lease (it expired and went back to the queue).
+        self.lost = Event()
+
+    def run(self):
+        # a third of the lease leaves room for a couple of missed beats.
+        while not self.stopped.wait(self.lease_s / 3):
+            try:
+                if api.heartbeat_lease(self.base, self.lease, self.lease_s) is None:
+                    self.lost.set()
+                    return
+            except Exception as e:
+                print(f"heartbeat for lease {self.lease.id} failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def work(
+    base: str,
+    runner: TaskRunner,
+    worker_id: str,
+    lease_s: float = 60,
+    poll_s: float = 5,
+    exit_when_idle: bool = False,
+    max_tasks: Optional[int] = None
+) -> int:
+    completed = 0
+    while max_tasks is None or completed < max_tasks:
+        lease = api.claim_lease(base, worker_id, lease_s)
+        if lease is None:
+            if exit_when_idle:
+                break
+            time.sleep(poll_s)
+            continue
+
+        print(f"[{worker_id}] running task {lease.task.task_id} (run {lease.run_id})...")
+        heartbeat = Heartbeat(base, lease, lease_s)
+        heartbeat.start()
+        try:
+            result = runner.run(lease.command, lease.task)
+        finally:
+            heartbeat.stop()
+
+        if heartbeat.lost.is_set() or not api.submit_lease_result(base, lease, result):
+            print(f"[{worker_id}] lease on run {lease.run_id} expired, dropping its result.")
+        else:
+            print(f"[{worker_id}] run {lease.run_id}: {result.status}")
+        completed += 1
+    return completed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base", type=str, default="http://localhost:8000")
+    parser.add_argument("--results", type=str)
+    parser.add_argument("--timeout", type=float, help="per-task wall-clock limit in seconds")
+    parser.add_argument("--sandbox", type=int, help="run agent code in a pool of this many containers (see sandbox.py)")
+    parser.add_argument("--pre-extract", action="store_true", help="put each attachment's extracted contents in the prompt (see attachments.py)")
+    parser.add_argument("--replay", type=str, help="replay the runs recorded in this file instead of running anything (see replay.py)")
+    parser.add_argument("--speedup", type=float, default=1.0, help="how much faster than recorded --replay runs should go")
+    parser.add_argument("--stop-on-answer", action="store_true", help="end each chat as soon as the agent has written its FINAL ANSWER line")
+    parser.add_argument("--worker-id", type=str, default=f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--lease", type=float, default=60, help="lease length in seconds")
+    parser.add_argument("--poll", type=float, default=5, help="seconds to wait before asking again when nothing is queued")
+    parser.add_argument("--exit-when-idle", action="store_true")
+    args = parser.parse_args()
+
+    runner = make_task_runner(args.results, args.timeout, args.sandbox, args.pre_extract, args.replay, args.speedup, args.stop_on_answer)
+    n = work(args.base, runner, args.worker_id, args.lease, args.poll, args.exit_when_idle)
+    print(f"[{args.worker_id}] done after {n} task(s).")